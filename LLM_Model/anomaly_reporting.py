@@ -1,7 +1,11 @@
 import pandas as pd
+import argparse
 import os
 from datetime import datetime
-import re
+
+from event_store import EVENT_STORE_DIR, read_events_for_pids, read_events_in_windows, read_query_templates
+from preprocessing import RESAMPLE_FREQUENCY, resolution_tag
+from session_engine import SESSION_EVENT_COLUMNS, build_sessions, session_of_events
 
 # ----------------------------------------------------------------------
 # A. CONFIGURATION AND PATH SETUP
@@ -10,23 +14,29 @@ timestamp_str = datetime.now().strftime('%Y%m%d')
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_DIR = os.path.join(BASE_DIR, '..', 'CSV_FILE', 'OUTPUT_CSVFILE')
 
-# Anomaly file name (OUTPUT from 03_model_training.py)
-ANOMALY_FILE = f'anomaly_records-{timestamp_str}.csv'
-# Path: TRAIN_AI subdirectory
-ANOMALY_PATH = os.path.join(CSV_DIR, 'TRAIN_AI', ANOMALY_FILE) 
+# Anomaly file (OUTPUT from 03_model_training.py)
+# Path: TRAIN_AI subdirectory, tagged by window size (see preprocessing.resolution_tag)
+def anomaly_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, 'TRAIN_AI', f'anomaly_records{resolution_tag(freq)}-{timestamp_str}.parquet')
+
+ANOMALY_PATH = anomaly_path()
 
-# Detailed event file name (OUTPUT from 01_data_extraction.py) - CONTAINS PID
-EVENTS_FILE = f'postgresql_events-{timestamp_str}.csv'
+# Detailed event store (OUTPUT from 01_data_extraction.py) - CONTAINS PID
 # Path: LOG_EVENT subdirectory
-EVENTS_PATH = os.path.join(CSV_DIR, 'LOG_EVENT', EVENTS_FILE) 
+EVENTS_PATH = EVENT_STORE_DIR
 
-# Output report file name
-OUTPUT_PID_REPORT_FILE = f'anomalous_pid_report-{timestamp_str}.csv'
+# Output report
 # Path: REPORT subdirectory
-OUTPUT_PID_REPORT_PATH = os.path.join(CSV_DIR, 'REPORT', OUTPUT_PID_REPORT_FILE) 
+def pid_report_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, 'REPORT', f'anomalous_pid_report{resolution_tag(freq)}-{timestamp_str}.csv')
+
+def session_report_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, 'REPORT', f'anomalous_session_report{resolution_tag(freq)}-{timestamp_str}.csv')
+
+def template_report_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, 'REPORT', f'anomalous_query_templates{resolution_tag(freq)}-{timestamp_str}.csv')
 
-# Time window configuration (must match 02_preprocessing.py)
-RESAMPLE_FREQUENCY = '30s' # 5 minutes
+OUTPUT_PID_REPORT_PATH = pid_report_path()
 
 # ----------------------------------------------------------------------
 # B. LOOK-BACK FUNCTION
@@ -41,52 +51,61 @@ CRITICAL_EVENT_TYPES = [
     'CONNECT_AUTHORIZED' # Successful connections
 ]
 
-def look_back_and_report_pids(anomaly_path, events_path, output_path, freq):
+def look_back_and_report_pids(anomaly_path, events_path, output_path, freq, session_output_path=None,
+                              template_output_path=None):
     """
     Looks back into detailed event logs (including PID, User, Query) 
-    for time windows flagged as anomalous by the model.
+    for time windows flagged as anomalous by the model. Events carry the
+    id of their query template; the templates are saved once, apart.
+    The session and template reports are only written if their path is given.
     """
     try:
         # 1. Load anomaly data (only need timestamps and score)
         print(f"Loading anomaly data from: {anomaly_path}")
-        anomaly_df = pd.read_csv(anomaly_path, index_col=0, parse_dates=True)
+        anomaly_df = pd.read_parquet(anomaly_path, columns=['anomaly_score'])
         anomaly_timestamps = anomaly_df.index
         
-        # 2. Load detailed event data (CONTAINS PID)
+        # 2. Load detailed event data (CONTAINS PID), only the row groups of the anomalous windows
+        window_delta = pd.Timedelta(freq)
         print(f"Loading detailed event data from: {events_path}")
-        events_df = pd.read_csv(events_path, parse_dates=['timestamp'])
+        events_df = read_events_in_windows(
+            [(start_time, start_time + window_delta) for start_time in anomaly_timestamps],
+            store_dir=events_path
+        )
         
-        # 3. Prepare time window
-        window_delta = pd.Timedelta(freq)
-        anomalous_events_list = []
+        # 3. Keep critical/error logs only
+        critical_events = events_df[events_df['event_type'].isin(CRITICAL_EVENT_TYPES)]
         
         print(f"Starting look-back on {len(anomaly_timestamps)} anomalous time windows...")
         
-        for start_time in anomaly_timestamps:
-            end_time = start_time + window_delta
-            
-            # 3a. Filter all detailed log events within the 5-minute window
-            current_window_events = events_df[
-                (events_df['timestamp'] >= start_time) & (events_df['timestamp'] < end_time)
-            ].copy()
-            
-            if not current_window_events.empty:
-                # Filter for critical/error logs only
-                critical_events = current_window_events[
-                    current_window_events['event_type'].isin(CRITICAL_EVENT_TYPES)
-                ].copy()
-                
-                if not critical_events.empty:
-                    # 3b. Add time window info and anomaly score to the report
-                    critical_events['Anomaly_Time_Window'] = start_time
-                    critical_events['Anomaly_Score'] = anomaly_df.loc[start_time, 'anomaly_score']
-                    
-                    anomalous_events_list.append(critical_events)
+        # 3a. Find each event's window with one sorted-index lookup:
+        #     the last window starting at or before the event, if the event is before its end
+        windows = anomaly_df['anomaly_score'].sort_index()
+        window_starts = windows.index
+        event_times = pd.DatetimeIndex(critical_events['timestamp'])
+        position = window_starts.searchsorted(event_times, side='right') - 1
+        in_window = position >= 0
+        in_window[in_window] = event_times[in_window] < (window_starts[position[in_window]] + window_delta)
+        
+        # 3b. Add time window info and anomaly score to the report
+        final_report_df = critical_events[in_window].copy()
+        matched = position[in_window]
+        final_report_df['Anomaly_Time_Window'] = window_starts[matched]
+        final_report_df['Anomaly_Score'] = windows.to_numpy()[matched]
+        
+        # Same order as a window-by-window look-back (anomaly file order, then event order)
+        window_order = anomaly_timestamps.get_indexer(window_starts)[matched]
+        final_report_df = final_report_df.iloc[window_order.argsort(kind='stable')].reset_index(drop=True)
+
+        # 3c. Rebuild the sessions of the reported PIDs in one pass and tag every event with its session
+        sessions_df = pd.DataFrame()
+        if not final_report_df.empty:
+            pid_events = read_events_for_pids(final_report_df['pid'].unique(), SESSION_EVENT_COLUMNS, store_dir=events_path)
+            sessions_df = build_sessions(pid_events.sort_values('timestamp', kind='stable'))
+            final_report_df = session_of_events(final_report_df, sessions_df)
                 
         # 4. Combine results and generate report
-        if anomalous_events_list:
-            final_report_df = pd.concat(anomalous_events_list, ignore_index=True)
-            
+        if not final_report_df.empty:
             # Columns to include in the report (New columns + Original columns)
             new_cols = ['Anomaly_Time_Window', 'Anomaly_Score']
             report_cols_ordered = new_cols + [col for col in final_report_df.columns if col not in new_cols]
@@ -101,6 +120,12 @@ def look_back_and_report_pids(anomaly_path, events_path, output_path, freq):
             print("-" * 60)
             print(f"SUCCESS: Detailed PID/Event report saved to: {output_path}")
             print(f"Total critical log events found: {len(final_report_df)}")
+
+            # Templates of the reported queries, each written once
+            if template_output_path is not None:
+                templates_df = read_query_templates(final_report_df['query_id'].dropna().unique(), events_path)
+                templates_df.to_csv(template_output_path, index=False)
+                print(f"{len(templates_df)} query templates saved to: {template_output_path}")
             print("-" * 60)
             
             # 5. Display the report summary
@@ -121,10 +146,19 @@ def look_back_and_report_pids(anomaly_path, events_path, output_path, freq):
             
             print("-" * 60)
 
-            # Display summary of top suspicious PIDs/Users
-            print("\nTop 5 suspicious PID/User combinations:")
-            suspicious_pids = final_report_df.groupby(['pid', 'user','timestamp','event_type']).size().sort_values(ascending=False)
-            print(suspicious_pids.head(5).to_string())
+            # Summary of the suspicious sessions (critical events and worst window score per session)
+            suspicious_sessions = final_report_df.groupby(['pid', 'session_start']).agg(
+                critical_events=('event_type', 'size'), min_anomaly_score=('Anomaly_Score', 'min')
+            ).join(sessions_df.rename(columns={'start_time': 'session_start'}).set_index(['pid', 'session_start']))
+            suspicious_sessions = suspicious_sessions.sort_values(
+                by=['min_anomaly_score', 'critical_events'], ascending=[True, False]
+            ).reset_index()
+            if session_output_path is not None:
+                suspicious_sessions.to_csv(session_output_path, index=False)
+                print(f"\nSuspicious sessions saved to: {session_output_path}")
+
+            print("\nTop 5 suspicious sessions:")
+            print(suspicious_sessions.head(5).to_string(index=False))
             
             return final_report_df
         else:
@@ -144,4 +178,11 @@ def look_back_and_report_pids(anomaly_path, events_path, output_path, freq):
 # C. MAIN EXECUTION LOGIC
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
-    look_back_and_report_pids(ANOMALY_PATH, EVENTS_PATH, OUTPUT_PID_REPORT_PATH, RESAMPLE_FREQUENCY)
+    parser = argparse.ArgumentParser(description='Report the critical events of the anomalous windows.')
+    parser.add_argument('--resolution', default=RESAMPLE_FREQUENCY,
+                        help='Window size of the model whose anomalies are reported (see model_training.py --resolutions)')
+    args = parser.parse_args()
+
+    look_back_and_report_pids(anomaly_path(args.resolution), EVENTS_PATH, pid_report_path(args.resolution),
+                              args.resolution, session_report_path(args.resolution),
+                              template_report_path(args.resolution))
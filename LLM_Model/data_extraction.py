@@ -1,12 +1,27 @@
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+import argparse
+import hashlib
+import heapq
+import io
+import itertools
 import os
 import re 
+import time
+import numpy as np
 import pandas as pd 
-import sys 
+
+from event_store import (
+    EVENT_STORE_DIR, clear_store, parse_timestamps, read_checkpoint, write_checkpoint, write_events, write_query_templates
+)
+from query_fingerprint import QUERY_TEMPLATES
 
 # ----------------------------------------------------------------------
 # A. REGEX PATTERNS
 # ----------------------------------------------------------------------
+# Anchored on the timestamp digits, so a line that is not a record (an
+# indented continuation, garbage) is rejected on its first character
 LOG_PATTERN = re.compile(
     r'(?P<timestamp_base>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3})\s+' 
     r'(?P<tz_offset>[+-]\d{2})\s+'                                      
@@ -17,170 +32,834 @@ LOG_PATTERN = re.compile(
 DISCONNECT_PATTERN = re.compile(
     r'disconnection: session time: (?P<session_time>.*?) user=(?P<d_user>.*?) database=(?P<d_db>.*?) host=(?P<d_host>.*)'
 )
+# Client host of connection lines (the port, if logged, is left out)
+HOST_PATTERN = re.compile(r'host=(?P<host>\S+)')
 AUDIT_PATTERN = re.compile(
-    r'AUDIT: SESSION,\d+,\d+,(?P<audit_class>[^,]+),(?P<audit_type>[^,]+),.*?,.*?"(?P<audit_query>.*?)"'
+    r'AUDIT: SESSION,\d+,\d+,(?P<audit_class>[^,]+),(?P<audit_type>[^,]+),.*?,.*?"(?P<audit_query>.*?)"',
+    re.DOTALL  # multi-line queries are stitched into one message
 )
 # ----------------------------------------------------------------------
-# B. PARSING FUNCTION
+# B. SHARED EVENT TABLE
 # ----------------------------------------------------------------------
-def parse_postgresql_log(filepath):
+# Columns of the single event table built by one pass over the raw log.
+# The menu views (api/main.py) and the ML pipeline are all projections of it.
+EVENT_TABLE_COLUMNS = [
+    'timestamp', 'pid', 'user_db', 'user', 'database', 'host', 'level', 'message',
+    'event_type', 'session_duration_sec', 'query_command', 'query_text'
+]
+
+# Low-cardinality event table columns kept as categoricals (int codes + one copy of each value)
+EVENT_TABLE_CATEGORICAL_COLUMNS = ['user_db', 'user', 'database', 'host', 'level', 'event_type', 'query_command']
+
+# Number of log records per DataFrame batch in streaming mode
+CHUNK_SIZE = 100_000
+
+# Raw lines handed to the record assembler at a time
+LINE_BLOCK_SIZE = 8192
+
+# Maximum size of one byte range parsed by a worker in parallel mode
+RANGE_SIZE = 64 * 1024 * 1024
+
+# Levels PostgreSQL writes after a record of the same backend (ERROR, then
+# DETAIL/HINT/STATEMENT...): they are folded into that record
+CONTINUATION_LEVELS = frozenset({'DETAIL', 'HINT', 'STATEMENT', 'CONTEXT', 'QUERY', 'LOCATION'})
+
+# Records waiting for continuation lines; beyond this the oldest is completed
+MAX_PENDING_RECORDS = 1024
+
+# A record gets no continuation lines once a line this much newer is read
+RECORD_LATENESS = timedelta(seconds=5)
+
+# Columns of the ML events written to the event store; query_id is the
+# id of the query's normalized template (query_fingerprint.py), host the
+# client host of connection and disconnection events
+EVENT_COLUMNS = [
+    'pid', 'user', 'database', 'host', 'event_type', 'session_duration_sec',
+    'query_command', 'query_id', 'timestamp'
+]
+
+def parse_session_time(time_str):
+    """Converts a session time string (0:00:00.xxx format) to seconds."""
+    try:
+        if ' ' in time_str and time_str.count(':') == 3:
+            days, h, m, s = re.split(r'[: ]', time_str)
+            return float(s) + int(m) * 60 + int(h) * 3600 + int(days) * 86400
+        elif time_str.count(':') == 2:
+            h, m, s = time_str.split(':')
+            return float(s) + int(m) * 60 + int(h) * 3600
+        return 0.0
+    except Exception:
+        return 0.0
+
+def parse_log_line(line):
     """
-    Reads the raw log file, parses each line using Regex, and extracts 
-    key fields, including PID.
+    Parses one raw log line into a tuple ordered as EVENT_TABLE_COLUMNS,
+    or returns None if the line is not a log record.
     """
-    parsed_data = []
-    
+    match = LOG_PATTERN.match(line)
+    if not match:
+        return None
+    return build_record(*match.groups())
+
+def build_record(timestamp_base, tz, pid, user_db, level, message, statement=None):
+    """
+    Classifies one (possibly stitched) log record into a tuple ordered as
+    EVENT_TABLE_COLUMNS. statement is the text of its STATEMENT line.
+    """
+    # 1. Separate USER@DB
+    if user_db and '@' in user_db:
+        user, database = user_db.split('@')[:2]
+    else:
+        user = database = '[unknown]' if level == 'LOG' else None
+
+    event_type = level
+    host = None
+    session_duration_sec = 0.0
+    query_command = None
+    query_text = None
+
+    # 2. Process specific event types
+
+    # a) Disconnection
+    if 'disconnection: session time:' in message:
+        d_match = DISCONNECT_PATTERN.search(message)
+        if d_match:
+            event_type = 'DISCONNECT'
+            session_duration_sec = parse_session_time(d_match.group('session_time'))
+            host = d_match.group('d_host').split(' ', 1)[0] or None
+
+    # b) Audit
+    elif 'AUDIT: SESSION,' in message:
+        a_match = AUDIT_PATTERN.search(message)
+        if a_match:
+            event_type = f"AUDIT_{a_match.group('audit_type')}"
+            query_command = a_match.group('audit_type')
+            query_text = a_match.group('audit_query').strip()
+
+    # c) Fatal/Error (carries the failed statement, if PostgreSQL logged it)
+    elif level in ('FATAL', 'ERROR'):
+        event_type = level
+        query_text = statement
+
+    # d) Connection
+    elif 'connection received:' in message:
+        event_type = 'CONNECT_RECEIVED'
+        if user is None: user = '[unknown]'
+        if database is None: database = '[unknown]'
+        host_match = HOST_PATTERN.search(message)
+        if host_match:
+            host = host_match.group('host')
+
+    elif 'connection authorized:' in message:
+        event_type = 'CONNECT_AUTHORIZED'
+
+    return (
+        f'{timestamp_base} {tz}', int(pid), user_db, user, database, host, level, message,
+        event_type, session_duration_sec, query_command, query_text
+    )
+
+class _PendingRecord:
+    """A log record still collecting its continuation lines."""
+    __slots__ = ('groups', 'sections', 'complete', 'seq')
+
+    def __init__(self, groups, seq=0):
+        self.groups = groups
+        self.sections = [[None, [groups[-1]]]]  # [level, text lines]; None = the record's own message
+        self.complete = False
+        self.seq = seq                          # position in the assembler's output
+
+    def build(self):
+        if len(self.sections) == 1 and len(self.sections[0][1]) == 1:
+            return build_record(*self.groups)   # a one-line record
+        timestamp_base, tz, pid, user_db, level, _ = self.groups
+        message, statement = '\n'.join(self.sections[0][1]), None
+        for section_level, lines in self.sections[1:]:
+            text = '\n'.join(lines)
+            message += f'\n{section_level}: {text}'
+            if section_level == 'STATEMENT':
+                statement = text.strip()
+        return build_record(timestamp_base, tz, pid, user_db, level, message, statement)
+
+    def absorb(self, record):
+        """Appends the sections of a record cut off from this one (started by a continuation line)."""
+        record.sections[0][0] = record.groups[4]
+        self.sections += record.sections
+
+def record_cutoff(timestamp_base):
+    """Records that start before this are complete once a line at timestamp_base is read (second granularity)."""
+    second = datetime.strptime(timestamp_base[:19], '%Y-%m-%d %H:%M:%S') - RECORD_LATENESS
+    return second.strftime('%Y-%m-%d %H:%M:%S')
+
+class RecordAssembler:
+    """
+    Stitches multi-line log records in one pass over the raw lines.
+
+    A DETAIL/HINT/STATEMENT... line is folded into the open record of its
+    PID, and an indented line (the rest of a multi-line message or query)
+    into the section of the line before it. A record is complete when its
+    PID starts a new record, once a line RECORD_LATENESS newer is read or
+    once more than max_pending records wait behind it, so memory stays
+    bounded. Records come out in the order of their first line.
+
+    Pending records belong to the log, not to one read: keep one assembler
+    per log across reads (state()/from_state() carry it across runs) and
+    flush() only at the end of the log. With track_orphans, the lines that
+    may belong to records before the first line read (the records a PID
+    starts with a continuation line, leading indented lines) are kept for
+    stitch_byte_ranges().
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_RECORDS, track_orphans=False):
+        self.max_pending = max_pending
+        self.track_orphans = track_orphans
+        self.n_records = 0          # records started so far (seq of the next one)
+        self.newest = None          # timestamp_base of the newest line read
+        self.orphans = {}           # pid -> its first record, started by a continuation line
+        self.started = set()        # pids that started a record (track_orphans only)
+        self.leading_lines = []     # indented lines before the first record (track_orphans only)
+        self._pending = deque()     # _PendingRecord in first line order
+        self._open = {}             # pid -> record accepting continuation lines
+        self._last_section = None   # section the next indented line belongs to
+        self._cutoff_second = None
+        self._cutoff = ''
+
+    def __len__(self):
+        return len(self._pending)
+
+    def feed(self, line):
+        """Adds one raw line, returns the records it completed (EVENT_TABLE_COLUMNS tuples)."""
+        return self.feed_lines((line,))
+
+    def feed_lines(self, lines):
+        """
+        Adds raw lines, returns the records they completed. Indented lines
+        are appended in the loop; only record lines cost a regex match.
+        """
+        records = []
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                continue
+            if line[0] in ' \t':
+                if self._last_section is not None:
+                    self._last_section[1].append(line[1:] if line[0] == '\t' else line)
+                elif self.track_orphans and not self.n_records:
+                    self.leading_lines.append(line)
+                continue
+
+            match = LOG_PATTERN.match(line)
+            if match is None:
+                self._last_section = None
+            elif self._add_line(match.groups()):
+                records += self._pop_complete()
+        return records
+
+    def _add_line(self, groups):
+        """Starts a record or folds a continuation line into one; True if the oldest record is complete."""
+        pid, level = groups[2], groups[4]
+
+        # Records expire only when a newer second starts or the oldest one is past the cutoff
+        if self.newest is None or groups[0] > self.newest:
+            self._advance(groups[0])
+        if self._pending and self._pending[0].groups[0] < self._cutoff:
+            self._expire()
+
+        record = self._open.get(pid)
+        if record is not None and level in CONTINUATION_LEVELS:
+            self._last_section = [level, [groups[-1]]]
+            record.sections.append(self._last_section)
+            return self._pending[0].complete
+        if record is not None:
+            record.complete = True
+
+        record = self._open[pid] = _PendingRecord(groups, self.n_records)
+        self.n_records += 1
+        if self.track_orphans:
+            if pid not in self.started and level in CONTINUATION_LEVELS:
+                self.orphans[pid] = record
+            self.started.add(pid)
+        self._last_section = record.sections[0]
+        self._pending.append(record)
+        if len(self._pending) > self.max_pending:
+            self._complete(self._pending[0])
+        return self._pending[0].complete
+
+    def flush(self):
+        """Completes every pending record (the end of the log), returns them."""
+        for record in self._pending:
+            record.complete = True
+        self._open.clear()
+        self._last_section = None
+        return self._pop_complete()
+
+    def boundary(self):
+        """
+        What stitch_byte_ranges() needs to join these records to the records
+        before and after them (call it before flush()).
+        """
+        return {
+            'open': dict(self._open),
+            'last_section': self._last_section,
+            'orphans': self.orphans,
+            'started': self.started,
+            'leading_lines': self.leading_lines,
+            'newest': self.newest,
+        }
+
+    def state(self):
+        """The pending records as JSON data (e.g. for the extraction checkpoint)."""
+        records, last = [], None
+        for i, record in enumerate(self._pending):
+            for j, section in enumerate(record.sections):
+                if section is self._last_section:
+                    last = [i, j]
+            records.append([list(record.groups), record.sections, record.complete])
+        return {'records': records, 'last_section': last, 'newest': self.newest}
+
+    @classmethod
+    def from_state(cls, state, max_pending=MAX_PENDING_RECORDS):
+        """Rebuilds an assembler saved by state() (a new one if state is empty)."""
+        assembler = cls(max_pending)
+        if not state:
+            return assembler
+        for groups, sections, complete in state['records']:
+            record = _PendingRecord(tuple(groups), assembler.n_records)
+            record.sections, record.complete = sections, complete
+            assembler.n_records += 1
+            assembler._pending.append(record)
+            if not complete:
+                assembler._open[record.groups[2]] = record
+        if state['last_section']:
+            i, j = state['last_section']
+            assembler._last_section = assembler._pending[i].sections[j]
+        if state['newest'] is not None:
+            assembler._advance(state['newest'])
+        return assembler
+
+    def _advance(self, timestamp_base):
+        """Moves the newest line time forward; the cutoff is parsed once per second."""
+        self.newest = timestamp_base
+        if self._cutoff_second != timestamp_base[:19]:
+            self._cutoff_second = timestamp_base[:19]
+            self._cutoff = record_cutoff(timestamp_base)
+
+    def _expire(self):
+        """Completes the records that started more than RECORD_LATENESS before the newest line."""
+        for record in self._pending:
+            if record.groups[0] >= self._cutoff:
+                break
+            if not record.complete:
+                self._complete(record)
+
+    def _complete(self, record):
+        record.complete = True
+        pid = record.groups[2]
+        if self._open.get(pid) is record:
+            del self._open[pid]
+            if any(section is self._last_section for section in record.sections):
+                self._last_section = None
+
+    def _pop_complete(self):
+        records = []
+        while self._pending and self._pending[0].complete:
+            records.append(self._pending.popleft().build())
+        return records
+
+def is_continuation_line(line):
+    """True if a raw line belongs to the record before it (indented or DETAIL/STATEMENT... line)."""
+    if line[:1] in (' ', '\t'):
+        return bool(line.strip())
+    match = LOG_PATTERN.match(line.strip())
+    return match is not None and match.group('level') in CONTINUATION_LEVELS
+
+def parse_log_timestamps(timestamps):
+    """
+    Converts record timestamps in the fixed LOG_PATTERN layout (2025-10-04
+    20:59:26.038 +07) to datetime64[ns] values, like parse_timestamps():
+    NumPy parses the local times in one call and each UTC offset is
+    applied once (several offsets in one batch: normalised to UTC).
+    """
+    if not timestamps:
+        return parse_timestamps(timestamps)
+    local = pd.Series(np.array([timestamp[:23] for timestamp in timestamps], dtype='datetime64[ns]'))
+    codes, offsets = pd.factorize(pd.Series([timestamp[24:] for timestamp in timestamps]))
+    hours = offsets.astype('int64')
+    if len(hours) == 1:
+        return local.dt.tz_localize(timezone(timedelta(hours=int(hours[0]))))
+    return (local - pd.to_timedelta(hours[codes], unit='h')).dt.tz_localize('UTC')
+
+def _event_frame(records):
+    """
+    Builds a compact event table DataFrame from EVENT_TABLE_COLUMNS tuples:
+    timestamps become datetime64[ns] and low-cardinality columns categoricals.
+    """
+    df = pd.DataFrame(records, columns=EVENT_TABLE_COLUMNS)
+    df['timestamp'] = parse_log_timestamps([record[0] for record in records])
+    df['pid'] = df['pid'].astype('int64')
+    return categorize_events(df)
+
+def categorize_events(df):
+    """Stores the low-cardinality event columns of df as categoricals (in place)."""
+    for col in EVENT_TABLE_CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def format_log_timestamps(timestamps):
+    """
+    Formats event table timestamps back to the log form (2025-10-04 20:59:26.038 +07).
+    The local times are formatted by NumPy in one vectorized call and the
+    UTC offset labels once per distinct offset (strftime is per element).
+    """
+    local = timestamps.dt.tz_localize(None) if timestamps.dt.tz is not None else timestamps
+    text = pd.Series(np.datetime_as_string(local.to_numpy(), unit='ms'), index=timestamps.index)
+    text = text.str.replace('T', ' ', regex=False) + ' '
+    if timestamps.dt.tz is None:
+        return text
+    minutes = (local - timestamps.dt.tz_convert('UTC').dt.tz_localize(None)) // pd.Timedelta(minutes=1)
+    labels = {m: f"{'-' if m < 0 else '+'}{abs(m) // 60:02d}" for m in minutes.unique()}
+    return text + minutes.map(labels)
+
+def iter_event_batches(lines, chunk_size=CHUNK_SIZE, assembler=None, flush=True):
+    """
+    Parses an iterable of raw log lines in a single pass and yields the
+    shared event table in DataFrames of at most chunk_size rows, so memory
+    stays bounded by one batch (chunk_size=None yields a single batch).
+    Continuation lines are stitched into their record by assembler (a new
+    RecordAssembler by default); with flush=False the records still open
+    at the end stay in it for the next lines of the log.
+    """
+    if assembler is None:
+        assembler = RecordAssembler()
+    records = []
+    lines = iter(lines)
+    for block in iter(lambda: list(itertools.islice(lines, LINE_BLOCK_SIZE)), []):
+        records += assembler.feed_lines(block)
+        while chunk_size and len(records) >= chunk_size:
+            yield _event_frame(records[:chunk_size])
+            records = records[chunk_size:]
+
+    if flush:
+        records += assembler.flush()
+    if records:
+        yield _event_frame(records)
+
+def parse_log_lines(lines):
+    """
+    Parses an iterable of raw log lines in a single pass and returns the
+    shared event table (one row per log record, EVENT_TABLE_COLUMNS).
+    """
+    for batch in iter_event_batches(lines, chunk_size=None):
+        return batch
+    return _event_frame([])
+
+def read_event_table(source):
+    """
+    Reads a log source once and returns the shared event table. source is
+    a file path, or lines already in memory (a list of lines, a text
+    buffer such as io.StringIO, or an open file object).
+    """
+    if not isinstance(source, (str, os.PathLike)):
+        return parse_log_lines(source)
     try:
         # Use encoding='utf-8' when opening the raw log file
-        with open(filepath, 'r', encoding='utf-8') as f: 
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                    
-                match = LOG_PATTERN.match(line)
-                if match:
-                    data = match.groupdict()
-                    
-                    data['tz'] = data.pop('tz_offset', None)
-                    
-                    # 1. Separate USER@DB
-                    user_db = data.pop('user_db', None)
-                    if user_db and '@' in user_db:
-                        data['user'] = user_db.split('@')[0]
-                        data['database'] = user_db.split('@')[1]
-                    else:
-                        data['user'] = '[unknown]' if data['level'] == 'LOG' and data.get('pid') else None
-                        data['database'] = '[unknown]' if data['level'] == 'LOG' and data.get('pid') else None
-
-                    # Initialize feature fields
-                    data['event_type'] = data['level']
-                    data['session_duration_sec'] = 0.0
-                    data['query_command'] = None
-                    data['query_text'] = None
-                    
-                    message = data['message']
-                    
-                    # 2. Process specific event types
-                    
-                    # a) Disconnection
-                    if 'disconnection: session time:' in message:
-                        d_match = DISCONNECT_PATTERN.search(message)
-                        if d_match:
-                            data.update(d_match.groupdict())
-                            data['event_type'] = 'DISCONNECT'
-                            
-                            # Convert session_time (0:00:00.xxx format) to seconds
-                            try:
-                                time_str = data.get('session_time')
-                                if ' ' in time_str and time_str.count(':') == 3: 
-                                    days, h, m, s = re.split(r'[: ]', time_str)
-                                    data['session_duration_sec'] = float(s) + int(m) * 60 + int(h) * 3600 + int(days) * 86400
-                                elif time_str.count(':') == 2:
-                                    h, m, s = time_str.split(':')
-                                    data['session_duration_sec'] = float(s) + int(m) * 60 + int(h) * 3600
-                                else:
-                                    data['session_duration_sec'] = 0.0
-                            except Exception:
-                                data['session_duration_sec'] = 0.0
-                            
-                    # b) Audit
-                    elif 'AUDIT: SESSION,' in message:
-                        a_match = AUDIT_PATTERN.search(message)
-                        if a_match:
-                            audit_data = a_match.groupdict()
-                            data['event_type'] = f"AUDIT_{audit_data['audit_type']}"
-                            data['query_command'] = audit_data['audit_type']
-                            data['query_text'] = audit_data['audit_query'].strip()
-                    
-                    # c) Fatal/Error
-                    elif data['level'] in ['FATAL', 'ERROR']:
-                        data['event_type'] = data['level']
-                    
-                    # d) Connection
-                    elif 'connection received:' in message:
-                        data['event_type'] = 'CONNECT_RECEIVED'
-                        if data['user'] is None: data['user'] = '[unknown]'
-                        if data['database'] is None: data['database'] = '[unknown]'
-
-                    elif 'connection authorized:' in message:
-                        data['event_type'] = 'CONNECT_AUTHORIZED'
-                    # elif data['level'] == 'LOG':
-                    #     data['event_type'] = 'LOG_GENERIC'
-                    
-                    # Remove unnecessary fields from dict (before DataFrame creation)
-                    data.pop('message', None)
-                    data.pop('d_user', None)
-                    data.pop('d_db', None)
-                    data.pop('d_host', None)
-                    data.pop('session_time', None)
-                    
-                    parsed_data.append(data)
-                    
+        with open(source, 'r', encoding='utf-8') as f:
+            return parse_log_lines(f)
+    except FileNotFoundError:
+        print(f"ERROR: Log file not found at: {source}")
+        return pd.DataFrame(columns=EVENT_TABLE_COLUMNS)
+
+def to_ml_events(event_table):
+    """
+    Projects the shared event table onto the ML event columns. Query texts
+    are replaced by the id of their template in QUERY_TEMPLATES.
+    """
+    return event_table.assign(query_id=QUERY_TEMPLATES.ids_of(event_table['query_text']))[EVENT_COLUMNS]
+
+def query_templates_of(events_df):
+    """Template table rows (query_id, template, first_seen) of the queries of an ML event batch."""
+    first_seen = events_df.dropna(subset=['query_id']).groupby('query_id')['timestamp'].min()
+    return pd.DataFrame({
+        'query_id': first_seen.index.astype('int64'),
+        'template': [QUERY_TEMPLATES.templates[int(query_id)] for query_id in first_seen.index],
+        'first_seen': first_seen.to_numpy()
+    })
+
+# ----------------------------------------------------------------------
+# C. PARSING FUNCTION
+# ----------------------------------------------------------------------
+def parse_postgresql_log(source):
+    """
+    Reads the raw log (a file path, or in-memory lines / text buffer / file
+    object), parses each line using Regex, and extracts key fields,
+    including PID.
+    """
+    return to_ml_events(read_event_table(source))
+
+def iter_postgresql_log(filepath, chunk_size=CHUNK_SIZE):
+    """
+    Streaming version of parse_postgresql_log(): yields the ML event
+    DataFrame in batches of at most chunk_size rows while reading the file.
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for batch in iter_event_batches(f, chunk_size):
+                yield to_ml_events(batch)
     except FileNotFoundError:
         print(f"ERROR: Log file not found at: {filepath}")
-        return pd.DataFrame()
-                
-    # 3. Create and normalize DataFrame
-    df = pd.DataFrame(parsed_data)
-    
-    if df.empty:
-        return df
+# ----------------------------------------------------------------------
+# D. PARALLEL EXTRACTION
+# ----------------------------------------------------------------------
+def split_byte_ranges(filepath, range_size=RANGE_SIZE, min_ranges=1, start=0, end=None):
+    """
+    Splits the [start, end) part of a file (default: the whole file) into
+    byte ranges of about range_size bytes (at least min_ranges of them),
+    each aligned on a line boundary that does not split a multi-line record.
+    """
+    if end is None:
+        end = os.path.getsize(filepath)
+    size = end - start
+    n_ranges = max(min_ranges, -(-size // range_size), 1)
+    boundaries = [start]
+    with open(filepath, 'rb') as f:
+        for i in range(1, n_ranges):
+            f.seek(start + size * i // n_ranges)
+            f.readline()  # move to the start of the next line
+            boundary = f.tell()
+            line = f.readline()
+            while line and boundary < end and is_continuation_line(line.decode('utf-8', errors='replace')):
+                boundary = f.tell()
+                line = f.readline()
+            boundaries.append(min(max(boundary, boundaries[-1]), end))
+    boundaries.append(end)
+    return [(lo, hi) for lo, hi in zip(boundaries, boundaries[1:]) if hi > lo]
 
-    # --- TIMESTAMP CREATION (KEEPING ORIGINAL TZ OFFSET) ---
-    
-    # 1. Concatenate timestamp_base and tz into full ISO string (e.g., +07:00)
-    df['timestamp'] = df['timestamp_base'].astype(str) +' '+ df['tz'].astype(str) 
-    
-    # 2. Remove auxiliary columns
-    df.drop(columns=['timestamp_base', 'tz', 'level'], inplace=True, errors='ignore')
-    
-    # 3. Convert pid to integer
-    df['pid'] = pd.to_numeric(df['pid'], errors='coerce').fillna(0).astype(int)
-
-    # 4. Reorder columns as requested
-    final_cols = [
-        'pid', 'user', 'database', 'event_type', 'session_duration_sec', 
-        'query_command', 'query_text', 'timestamp'
-    ]
-    
-    for col in final_cols:
-        if col not in df.columns:
-            df[col] = None
+def read_byte_range(filepath, start, end):
+    """Raw lines of the [start, end) byte range of a file, decoded like the serial reader (utf-8, universal newlines)."""
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+    return io.TextIOWrapper(io.BytesIO(chunk), encoding='utf-8')
+
+def parse_byte_range(task):
+    """
+    Parses one (filepath, start, end) byte range in a worker process.
+    Returns (ML events numbered from 0, boundary of the range for
+    stitch_byte_ranges(), templates of the range's queries).
+    """
+    filepath, start, end = task
+    assembler = RecordAssembler(track_orphans=True)
+    records = assembler.feed_lines(read_byte_range(filepath, start, end))
+    boundary = assembler.boundary()
+    events_df = to_ml_events(_event_frame(records + assembler.flush()))
+    return events_df, boundary, QUERY_TEMPLATES.subset(events_df['query_id'].dropna().unique())
+
+def _still_open(record, record_no, orphan, orphan_no, newest):
+    """True if the serial parser would still fold the continuation record orphan into record."""
+    cutoff = record_cutoff(max(newest or '', orphan.groups[0]))
+    return orphan_no - record_no <= MAX_PENDING_RECORDS and record.groups[0] >= cutoff
+
+def stitch_byte_ranges(parts, assembler=None, flush=True):
+    """
+    Joins the parsed byte ranges of one file ((events, boundary) pairs of
+    parse_byte_range() in byte order) into the events the serial parser
+    gives: a record that a range starts with a continuation line (the
+    DETAIL/STATEMENT... of a PID whose record began in an earlier range)
+    and the range's leading indented lines are folded into the record
+    they belong to, when the serial parser would still have it open.
+
+    assembler holds the records pending before the first range (e.g. from
+    the checkpoint). With flush=False the records still open at the end
+    are left out of the events and returned in a new assembler.
+    Returns (events, assembler).
+    """
+    if assembler is not None and len(assembler):
+        # Its events start at the oldest pending record, not at record 0
+        boundary = dict(assembler.boundary(), base=assembler.n_records - len(assembler))
+        parts = [(to_ml_events(_event_frame(assembler.flush())), boundary)] + list(parts)
+
+    frames, rebuilt, dropped = [], {}, []
+    open_records = {}       # pid -> (record, number in the file's events)
+    last_section = None     # (section, record, number) the next indented line belongs to
+    newest, offset = None, 0
+    for events_df, boundary in parts:
+        base = boundary.get('base', 0)
+        if boundary['leading_lines'] and last_section is not None:
+            section, record, record_no = last_section
+            section[1] += [line[1:] if line[0] == '\t' else line for line in boundary['leading_lines']]
+            rebuilt[record_no] = record
+
+        folded = {}
+        for pid, orphan in boundary['orphans'].items():
+            orphan_no = offset + orphan.seq - base
+            record, record_no = open_records.get(pid, (None, None))
+            if record is not None and _still_open(record, record_no, orphan, orphan_no, newest):
+                record.absorb(orphan)
+                rebuilt[record_no] = record
+                dropped.append(orphan_no)
+                folded[pid] = (record, record_no)
+
+        for pid in boundary['started']:
+            open_records.pop(pid, None)
+        last_section = None
+        for pid, record in boundary['open'].items():
+            if boundary['orphans'].get(pid) is record and pid in folded:
+                open_records[pid] = folded[pid]
+            else:
+                open_records[pid] = (record, offset + record.seq - base)
+            if any(section is boundary['last_section'] for section in record.sections):
+                last_section = (boundary['last_section'],) + open_records[pid]
+
+        if boundary['newest'] is not None:
+            newest = max(newest or '', boundary['newest'])
+        frames.append(events_df.set_axis(pd.RangeIndex(offset, offset + len(events_df))))
+        offset += len(events_df)
+
+    carried = None
+    if not flush:
+        kept = sorted(open_records.values(), key=lambda item: item[1])
+        last = None
+        for i, (record, record_no) in enumerate(kept):
+            dropped.append(record_no)
+            rebuilt.pop(record_no, None)
+            if last_section is not None and last_section[1] is record:
+                last = [i, next(j for j, section in enumerate(record.sections) if section is last_section[0])]
+        carried = RecordAssembler.from_state({
+            'records': [[list(record.groups), record.sections, False] for record, _ in kept],
+            'last_section': last,
+            'newest': newest,
+        })
+
+    if not frames:
+        return pd.DataFrame(columns=EVENT_COLUMNS), carried or RecordAssembler()
+    events_df = pd.concat(frames).drop(index=dropped + list(rebuilt))
+    if rebuilt:
+        rebuilt_df = to_ml_events(_event_frame([record.build() for record in rebuilt.values()]))
+        events_df = pd.concat([events_df, rebuilt_df.set_axis(list(rebuilt))]).sort_index()
+    return categorize_events(events_df.reset_index(drop=True)), carried or RecordAssembler()
+
+def merge_by_timestamp(frames):
+    """
+    Merges per-file event frames in timestamp order. Rows of one file keep
+    their serial order.
+    """
+    frames = [df.reset_index(drop=True) for df in frames if not df.empty]
+    if len(frames) <= 1:
+        return frames[0] if frames else pd.DataFrame(columns=EVENT_COLUMNS)
+
+    merged = heapq.merge(
+        *[zip(df['timestamp'], [i] * len(df), range(len(df))) for i, df in enumerate(frames)]
+    )
+    order = [(i, row) for _, i, row in merged]
+    combined = pd.concat(frames, ignore_index=True)
+    offsets = [0]
+    for df in frames[:-1]:
+        offsets.append(offsets[-1] + len(df))
+    merged_df = combined.take([offsets[i] + row for i, row in order]).reset_index(drop=True)
+    # Frames with different categories concatenate to object columns
+    return categorize_events(merged_df)
+
+def parse_postgresql_logs_parallel(filepaths, workers=None, range_size=RANGE_SIZE, byte_ranges=None, assemblers=None):
+    """
+    Parallel version of parse_postgresql_log(): splits every file into
+    line-aligned byte ranges, parses them in a process pool and merges
+    the results. Each file gives the same rows as the serial parser.
+    byte_ranges optionally maps a file to the (start, end) part to parse.
+    assemblers optionally maps a file to the RecordAssembler of its
+    records pending before that part; it is replaced by the one of the
+    records still open at the end, which are then left out of the result.
+    """
+    byte_ranges = byte_ranges or {}
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+    workers = workers or os.cpu_count() or 1
+
+    tasks, task_file = [], []
+    for file_no, filepath in enumerate(filepaths):
+        if not os.path.exists(filepath):
+            print(f"ERROR: Log file not found at: {filepath}")
+            continue
+        start, end = byte_ranges.get(filepath, (0, None))
+        for lo, hi in split_byte_ranges(filepath, range_size, workers, start, end):
+            tasks.append((filepath, lo, hi))
+            task_file.append(file_no)
+
+    if not tasks:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        per_file = {}
+        for file_no, (events_df, boundary, templates) in zip(task_file, executor.map(parse_byte_range, tasks)):
+            QUERY_TEMPLATES.update(templates)
+            per_file.setdefault(file_no, []).append((events_df, boundary))
+
+    # Ranges of one file are stitched in byte order, files are merged by time
+    frames = []
+    for file_no, parts in sorted(per_file.items()):
+        filepath = filepaths[file_no]
+        if assemblers is None:
+            events_df, _ = stitch_byte_ranges(parts)
+        else:
+            events_df, assemblers[filepath] = stitch_byte_ranges(parts, assemblers.get(filepath), flush=False)
+        frames.append(events_df)
+    return merge_by_timestamp(frames)
 
-    return df[final_cols]
 # ----------------------------------------------------------------------
-# C. MAIN EXECUTION
+# E. INCREMENTAL EXTRACTION
+# ----------------------------------------------------------------------
+# Number of leading bytes hashed to recognise a log file after rotation
+HEAD_FINGERPRINT_SIZE = 256
+
+def head_fingerprint(filepath, length):
+    """Hashes the first length bytes of a file."""
+    with open(filepath, 'rb') as f:
+        return hashlib.sha1(f.read(length)).hexdigest()
+
+def last_line_end(filepath, start, file_size):
+    """Returns the offset just after the last complete line in [start, file_size)."""
+    with open(filepath, 'rb') as f:
+        end = file_size
+        while end > start:
+            block_start = max(start, end - 64 * 1024)
+            f.seek(block_start)
+            block = f.read(end - block_start)
+            newline = block.rfind(b'\n')
+            if newline != -1:
+                return block_start + newline + 1
+            end = block_start
+    return start
+
+def pending_byte_range(filepath, entry):
+    """
+    Returns (start, end, restarted): the complete lines appended since the
+    checkpoint entry. A different inode, a shrunk file or a changed head
+    means the log was rotated or truncated, so parsing restarts at byte 0.
+    """
+    st = os.stat(filepath)
+    start, restarted = 0, False
+    if entry:
+        head_len = min(entry['offset'], HEAD_FINGERPRINT_SIZE)
+        if (entry['inode'] == st.st_ino and entry['offset'] <= st.st_size
+                and entry['head'] == head_fingerprint(filepath, head_len)):
+            start = entry['offset']
+        else:
+            restarted = True
+    return start, last_line_end(filepath, start, st.st_size), restarted
+
+def checkpoint_entry(filepath, offset, assembler=None):
+    """
+    Builds the checkpoint entry of a log file parsed up to offset, with the
+    records still pending there (they get their continuation lines next run).
+    """
+    return {
+        'inode': os.stat(filepath).st_ino,
+        'offset': offset,
+        'head': head_fingerprint(filepath, min(offset, HEAD_FINGERPRINT_SIZE)),
+        'pending': assembler.state() if assembler is not None and len(assembler) else None,
+    }
+
+def iter_byte_range_batches(filepath, start, end, range_size=RANGE_SIZE, assembler=None):
+    """
+    Serially parses the [start, end) part of a log file, one block at a
+    time, through one RecordAssembler so records span the blocks. With
+    assembler (the records pending before start) the records still open
+    at end stay in it; otherwise they are flushed.
+    """
+    flush = assembler is None
+    lines = (line for lo, hi in split_byte_ranges(filepath, range_size, 1, start, end)
+             for line in read_byte_range(filepath, lo, hi))
+    for batch in iter_event_batches(lines, CHUNK_SIZE, assembler, flush):
+        yield to_ml_events(batch)
+
+def is_log_idle(filepath):
+    """True if a log was not written for RECORD_LATENESS: its pending records are complete."""
+    return time.time() - os.path.getmtime(filepath) >= RECORD_LATENESS.total_seconds()
+
+def flush_records(assembler):
+    """Yields the ML events of the records pending in an assembler (the end of its log)."""
+    for batch in iter_event_batches((), None, assembler):
+        yield to_ml_events(batch)
+
+# ----------------------------------------------------------------------
+# F. MAIN EXECUTION
 # ----------------------------------------------------------------------
 
 if __name__ == "__main__":
     base_dir = os.path.dirname(os.path.abspath(__file__))
     LOG_FILE_PATH = os.path.join(base_dir, '..', 'Log_Example', 'postgresql-official.log')
-    
-    time_str = datetime.now().strftime('%Y%m%d')
-    # Output directory 
-    # Adjusted path structure to avoid potential issues
-    CSV_DIR = os.path.join(base_dir, '..', 'CSV_FILE','OUTPUT_CSVFILE','LOG_EVENT') 
-
-    # Ensure output directory exists
-    if not os.path.exists(CSV_DIR):
-        os.makedirs(CSV_DIR)
-        
-    OUTPUT_CSV_PATH = os.path.join(CSV_DIR, f'postgresql_events-{time_str}.csv') 
 
-    print(f"Starting log parsing: {LOG_FILE_PATH}")
-    
-    # 1. Parse and create Event DataFrame
-    events_df = parse_postgresql_log(LOG_FILE_PATH)
+    parser = argparse.ArgumentParser(description='Extract events from PostgreSQL logs.')
+    parser.add_argument('log_files', nargs='*', default=[LOG_FILE_PATH],
+                        help='Log files to parse (default: Log_Example/postgresql-official.log)')
+    parser.add_argument('--parallel', action='store_true',
+                        help='Parse line-aligned byte ranges of the log files in a process pool')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of worker processes in parallel mode (default: CPU count)')
+    parser.add_argument('--full', action='store_true',
+                        help='Rebuild the event store from byte 0 instead of parsing only new lines')
+    args = parser.parse_args()
+    log_files = [os.path.abspath(path) for path in args.log_files]
+
+    print(f"Starting log parsing: {', '.join(log_files)}")
+
+    # 1. Find the new part of every log file since the last checkpoint
+    if args.full:
+        clear_store()
+    checkpoint = read_checkpoint()
+    byte_ranges, assemblers, rotated = {}, {}, []
+    for log_file in log_files:
+        if not os.path.exists(log_file):
+            print(f"ERROR: Log file not found at: {log_file}")
+            continue
+        entry = checkpoint.get(log_file)
+        start, end, restarted = pending_byte_range(log_file, entry)
+        # Records left open by the last run continue in the new lines
+        assemblers[log_file] = RecordAssembler.from_state(entry.get('pending') if entry else None)
+        if restarted:
+            print(f"Log rotation or truncation detected, parsing from byte 0: {log_file}")
+            rotated.append(assemblers[log_file])
+            assemblers[log_file] = RecordAssembler()
+        print(f"Parsing bytes {start}-{end} of {log_file}")
+        byte_ranges[log_file] = (start, end)
+
+    # 2. Parse the new lines in batches and append each batch to the event store
+    if args.parallel or len(byte_ranges) > 1:
+        batches = [parse_postgresql_logs_parallel(
+            list(byte_ranges), args.workers, byte_ranges=byte_ranges, assemblers=assemblers
+        )]
+    else:
+        batches = (batch for log_file, (start, end) in byte_ranges.items()
+                   for batch in iter_byte_range_batches(log_file, start, end, assembler=assemblers[log_file]))
+    # The records of rotated logs, and the open records of idle logs, are complete
+    idle = [assemblers[log_file] for log_file in byte_ranges if is_log_idle(log_file)]
+    batches = itertools.chain(
+        (batch for assembler in rotated for batch in flush_records(assembler)),
+        batches,
+        (batch for assembler in idle for batch in flush_records(assembler))
+    )
+
+    total_events = 0
+    first_batch = None
+    for events_df in batches:
+        if events_df.empty:
+            continue
+        # 3. Save result (partitioned by day)
+        write_events(events_df)
+        write_query_templates(query_templates_of(events_df))
+        if first_batch is None:
+            first_batch = events_df.head()
+        total_events += len(events_df)
+
+    # 4. Remember how far every log file has been parsed
+    for log_file, (start, end) in byte_ranges.items():
+        checkpoint[log_file] = checkpoint_entry(log_file, end, assemblers[log_file])
+    write_checkpoint(checkpoint)
     
-    if events_df.empty:
-        print("No valid events extracted. Stopping process.")
+    if first_batch is None:
+        print("No new events extracted. Stopping process.")
     else:
-        print(f"Parsing complete. Total events: {len(events_df)}")
-        
-        # 2. Save result
-        events_df.to_csv(OUTPUT_CSV_PATH, index=False)
+        print(f"Parsing complete. Total events: {total_events}")
         
-        print(f"\nEvent DataFrame saved to: {OUTPUT_CSV_PATH}")
+        print(f"\nEvent DataFrame saved to: {EVENT_STORE_DIR}")
         print("\nChecking first 5 data rows:")
-        print(events_df.head())
+        print(first_batch)
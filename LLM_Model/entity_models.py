@@ -0,0 +1,164 @@
+import argparse
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+
+from feature_schema import latest_schema
+from model_training import CONTAMINATION_RATE
+from preprocessing import (
+    INPUT_EVENTS_PATH, MODEL_DIR, RESAMPLE_FREQUENCY, create_entity_features, load_and_prepare_data, resolution_tag
+)
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+timestamp_str = datetime.now().strftime('%Y%m%d')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_DIR = os.path.join(BASE_DIR, '..', 'CSV_FILE', 'OUTPUT_CSVFILE', 'TRAIN_AI')
+
+# Event columns an entity can be (one feature stream and one set of models each)
+ENTITY_COLUMNS = ['user', 'database']
+ENTITY_EVENT_COLUMNS = ['timestamp', 'user', 'database', 'event_type', 'session_duration_sec']
+
+# Small forests: every entity has few active windows
+ENTITY_N_ESTIMATORS = 25
+
+# Entities with fewer active windows are scored by the shared model of their entity column
+MIN_ENTITY_WINDOWS = 20
+
+# One set of models per entity column and window size (see preprocessing.resolution_tag)
+def entity_model_path(entity_col, freq=RESAMPLE_FREQUENCY):
+    return os.path.join(MODEL_DIR, f'entity_models-{entity_col}{resolution_tag(freq)}-{timestamp_str}.pkl')
+
+def entity_anomaly_path(entity_col, freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, f'entity_anomaly_records-{entity_col}{resolution_tag(freq)}-{timestamp_str}.parquet')
+
+def latest_entity_models(entity_col, freq=RESAMPLE_FREQUENCY, model_dir=MODEL_DIR):
+    """Newest saved EntityModels of an entity column and window size (None if there is none)."""
+    pattern = re.compile(rf'entity_models-{re.escape(entity_col)}{re.escape(resolution_tag(freq))}-(\d{{8}})\.pkl')
+    names = sorted(name for name in os.listdir(model_dir) if pattern.fullmatch(name)) if os.path.isdir(model_dir) else []
+    return joblib.load(os.path.join(model_dir, names[-1])) if names else None
+
+# ----------------------------------------------------------------------
+# B. PER-ENTITY MODELS
+# ----------------------------------------------------------------------
+def fit_forest(X):
+    """Fits one small Isolation Forest (runs in the worker processes)."""
+    return IsolationForest(
+        contamination=CONTAMINATION_RATE,
+        n_estimators=ENTITY_N_ESTIMATORS,
+        random_state=42,
+        n_jobs=1
+    ).fit(X)
+
+class EntityModels:
+    """
+    One small Isolation Forest per entity (user or database) of an entity
+    feature frame (preprocessing.create_entity_features()), plus a shared
+    forest fitted on the windows of all entities that scores entities with
+    fewer than MIN_ENTITY_WINDOWS active windows and entities first seen
+    after training.
+
+    Isolation Forests split each feature between its min and max, so they
+    need no scaler. score() groups a batch by entity and runs each
+    entity's forest once on its rows: its cost follows the entities and
+    windows in the batch, not the history or the number of known entities.
+    """
+
+    def __init__(self, entity_col, columns):
+        self.entity_col = entity_col
+        self.columns = list(columns)
+        self.forests = {}   # entity -> IsolationForest
+        self.shared = None
+
+    def fit(self, entity_features_df, workers=None):
+        """Fits the shared forest and the forest of every entity with enough windows, in a process pool."""
+        X = entity_features_df.reindex(columns=self.columns, fill_value=0).to_numpy(np.float32)
+        entities, starts = np.unique(entity_features_df.index.get_level_values(0), return_index=True)
+        bounds = list(starts) + [len(X)]
+        blocks = {
+            entity: X[start:end] for entity, start, end in zip(entities, bounds, bounds[1:])
+            if end - start >= MIN_ENTITY_WINDOWS
+        }
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            shared = executor.submit(fit_forest, X)
+            self.forests = dict(zip(blocks, executor.map(fit_forest, blocks.values())))
+            self.shared = shared.result()
+        return self
+
+    def score(self, entity_features_df):
+        """Decision scores (< 0 is anomalous) of an entity feature frame, in its row order."""
+        X = entity_features_df.reindex(columns=self.columns, fill_value=0).to_numpy(np.float32)
+        scores = np.empty(len(X))
+        rows_by_entity = entity_features_df.groupby(level=0, sort=False, observed=True).indices
+        for entity, rows in rows_by_entity.items():
+            forest = self.forests.get(entity, self.shared)
+            scores[rows] = forest.decision_function(X[rows])
+        return pd.Series(scores, index=entity_features_df.index, name='anomaly_score')
+
+    def predict(self, entity_features_df):
+        return np.where(self.score(entity_features_df) < 0, -1, 1)
+
+    def detect(self, events_df, freq=RESAMPLE_FREQUENCY):
+        """
+        Scores the entity windows of a batch of events (timestamp index),
+        returns the anomaly scores of the anomalous (entity, window) pairs.
+        """
+        entity_features_df = create_entity_features(events_df, self.entity_col, freq)
+        if entity_features_df.empty:
+            return pd.Series(dtype='float64', name='anomaly_score')
+        scores = self.score(entity_features_df)
+        return scores[scores < 0]
+
+# ----------------------------------------------------------------------
+# C. MAIN EXECUTION LOGIC
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    # Pickle the models as entity_models.EntityModels (not __main__) so other modules can load them
+    import entity_models
+
+    parser = argparse.ArgumentParser(description='Train and apply one small anomaly model per user / database.')
+    parser.add_argument('--entity', nargs='+', choices=ENTITY_COLUMNS, default=ENTITY_COLUMNS,
+                        help='Entity columns to build feature streams and models for')
+    parser.add_argument('--freq', default=RESAMPLE_FREQUENCY, help='Window size (e.g. 30s, 5min)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    events_df = load_and_prepare_data(INPUT_EVENTS_PATH, columns=ENTITY_EVENT_COLUMNS)
+    if events_df is None or events_df.empty:
+        print("Invalid or empty event data. Stopping entity model training.")
+    else:
+        # Same feature columns as the global model when it has a schema
+        schema = latest_schema(MODEL_DIR)
+        pd.set_option('display.width', 1000)
+
+        for entity_col in args.entity:
+            print(f"\n=== {entity_col} ===")
+            entity_features_df = create_entity_features(events_df, entity_col, args.freq)
+            if entity_features_df.empty:
+                print(f"No {entity_col} windows. Skipping.")
+                continue
+            print(f"{args.freq} windows: {entity_features_df.index.get_level_values(0).nunique()} entities, "
+                  f"{len(entity_features_df)} active windows, {len(entity_features_df.columns)} features")
+            columns = schema.extend(entity_features_df.columns).columns if schema else entity_features_df.columns
+
+            # 1. Train the per-entity forests
+            models = entity_models.EntityModels(entity_col, columns).fit(entity_features_df, args.workers)
+            joblib.dump(models, entity_model_path(entity_col, args.freq))
+            print(f"{len(models.forests)} entity models (+1 shared) saved to: {entity_model_path(entity_col, args.freq)}")
+
+            # 2. Score every entity window and save the anomalous ones
+            entity_features_df['anomaly_score'] = models.score(entity_features_df)
+            anomalies_df = entity_features_df[entity_features_df['anomaly_score'] < 0]
+            anomalies_df.to_parquet(entity_anomaly_path(entity_col, args.freq))
+            print(f"{len(anomalies_df)} anomalous {entity_col} windows saved to: {entity_anomaly_path(entity_col, args.freq)}")
+
+            print(f"\nAnomalous windows per {entity_col}:")
+            print(anomalies_df.groupby(level=0).agg(
+                windows=('anomaly_score', 'size'), min_anomaly_score=('anomaly_score', 'min')
+            ).sort_values('min_anomaly_score').to_string())
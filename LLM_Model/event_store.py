@@ -0,0 +1,386 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CSV_DIR = os.path.join(BASE_DIR, '..', 'CSV_FILE', 'OUTPUT_CSVFILE')
+
+# Columnar event store written by data_extraction.py (one partition per day)
+EVENT_STORE_DIR = os.path.join(CSV_DIR, 'LOG_EVENT', 'event_store')
+
+# Parsed byte offset of every log file (ignored by Parquet readers: '_' prefix)
+CHECKPOINT_PATH = os.path.join(EVENT_STORE_DIR, '_checkpoint.json')
+
+# Row-group index of the store: time span and PIDs of every row group
+INDEX_FILE = '_index.sqlite'
+
+# Query template table of the store: every template once, events keep its integer id
+TEMPLATE_FILE = '_query_templates.sqlite'
+
+# Rows per Parquet row group (the unit read by indexed time/PID lookups)
+ROW_GROUP_SIZE = 16384
+
+# Partition column (event day, YYYY-MM-DD)
+PARTITION_COLUMN = 'day'
+
+# Low-cardinality columns stored as dictionary-encoded categoricals
+CATEGORICAL_COLUMNS = ['user', 'database', 'host', 'event_type', 'query_command']
+
+# ----------------------------------------------------------------------
+# B. WRITING
+# ----------------------------------------------------------------------
+def parse_timestamps(timestamps):
+    """
+    Converts log timestamps (e.g. 2025-10-04 20:59:26.038 +07) to
+    datetime64[ns] values (int64 nanoseconds).
+    """
+    try:
+        parsed = pd.to_datetime(pd.Series(timestamps), format='ISO8601')
+    except ValueError:
+        # Several UTC offsets in one batch: normalise them to UTC
+        parsed = pd.to_datetime(pd.Series(timestamps), format='ISO8601', utc=True)
+    return parsed.dt.as_unit('ns')
+
+def to_store_frame(events_df):
+    """Types an ML event DataFrame for the store (datetimes, categoricals, day)."""
+    df = events_df.copy()
+    if not pd.api.types.is_datetime64_any_dtype(df['timestamp']):
+        df['timestamp'] = parse_timestamps(df['timestamp'])
+    for col in CATEGORICAL_COLUMNS:
+        df[col] = df[col].astype('category')
+    df['pid'] = df['pid'].astype('int64')
+    df['session_duration_sec'] = df['session_duration_sec'].astype('float64')
+    df['query_id'] = df['query_id'].astype('Int64')
+    df[PARTITION_COLUMN] = df['timestamp'].dt.strftime('%Y-%m-%d')
+    return df
+
+def clear_store(store_dir=EVENT_STORE_DIR):
+    """Removes every partition of the event store and its checkpoint."""
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+
+def write_events(events_df, store_dir=EVENT_STORE_DIR):
+    """
+    Appends a batch of ML events to the store, partitioned by event day.
+    Part files are named by write time so the store reads back in write order.
+    """
+    if events_df.empty:
+        return
+    table = pa.Table.from_pandas(to_store_frame(events_df), preserve_index=False)
+    written_files = []
+    pq.write_to_dataset(
+        table, store_dir,
+        partition_cols=[PARTITION_COLUMN],
+        basename_template=f'part-{time.time_ns()}-{{i}}.parquet',
+        file_visitor=lambda written_file: written_files.append(written_file.path),
+        max_rows_per_group=ROW_GROUP_SIZE,
+        min_rows_per_group=ROW_GROUP_SIZE
+    )
+    index_files(written_files, store_dir)
+
+def read_checkpoint(path=CHECKPOINT_PATH):
+    """Loads the {log file: {inode, offset, head}} extraction checkpoint."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def write_checkpoint(checkpoint, path=CHECKPOINT_PATH):
+    """Saves the extraction checkpoint atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+def write_query_templates(templates_df, store_dir=EVENT_STORE_DIR):
+    """
+    Adds (query_id, template, first_seen) rows to the template table of the
+    store. A known template only has its first_seen moved earlier.
+    """
+    if templates_df.empty:
+        return
+    os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(store_dir, TEMPLATE_FILE))
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS query_templates (
+                query_id INTEGER PRIMARY KEY,
+                template TEXT NOT NULL,
+                first_seen INTEGER NOT NULL
+            )
+        ''')
+        conn.executemany(
+            '''INSERT INTO query_templates (query_id, template, first_seen) VALUES (?, ?, ?)
+               ON CONFLICT (query_id) DO UPDATE SET first_seen = MIN(first_seen, excluded.first_seen)''',
+            [(int(query_id), template, pd.Timestamp(first_seen).value)
+             for query_id, template, first_seen in templates_df[['query_id', 'template', 'first_seen']].itertuples(index=False)]
+        )
+    conn.close()
+
+def read_query_templates(query_ids=None, store_dir=EVENT_STORE_DIR):
+    """
+    Loads the template table (query_id, template, first_seen in UTC), or
+    only the given ids. Empty if no template has been stored yet.
+    """
+    path = os.path.join(store_dir, TEMPLATE_FILE)
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        templates_df = pd.read_sql_query('SELECT query_id, template, first_seen FROM query_templates', conn)
+        conn.close()
+    else:
+        templates_df = pd.DataFrame({'query_id': [], 'template': [], 'first_seen': []}).astype({'query_id': 'int64', 'first_seen': 'int64'})
+    if query_ids is not None:
+        templates_df = templates_df[templates_df['query_id'].isin([int(query_id) for query_id in query_ids])]
+    templates_df['first_seen'] = pd.to_datetime(templates_df['first_seen'], unit='ns', utc=True)
+    return templates_df.reset_index(drop=True)
+
+# ----------------------------------------------------------------------
+# C. ROW-GROUP INDEX
+# ----------------------------------------------------------------------
+def store_timezone(store_dir=EVENT_STORE_DIR):
+    """Time zone of the stored timestamps (e.g. +07:00), or None if they are naive or the store is empty."""
+    schema = pq.ParquetDataset(store_dir).schema
+    return schema.field('timestamp').type.tz if 'timestamp' in schema.names else None
+
+def to_store_time(timestamp, tz):
+    """A query bound in the store's time zone; naive bounds are taken as store-local times."""
+    timestamp = pd.Timestamp(timestamp)
+    if tz is None:
+        return timestamp.tz_localize(None) if timestamp.tzinfo else timestamp
+    return timestamp.tz_localize(tz) if timestamp.tzinfo is None else timestamp.tz_convert(tz)
+
+def open_index(store_dir=EVENT_STORE_DIR):
+    """Opens (and creates if needed) the SQLite row-group index of the store."""
+    os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(store_dir, INDEX_FILE))
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS row_groups (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            row_group INTEGER NOT NULL,
+            min_ts INTEGER NOT NULL,
+            max_ts INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS row_groups_time ON row_groups (min_ts, max_ts);
+        CREATE TABLE IF NOT EXISTS pid_row_groups (
+            pid INTEGER NOT NULL,
+            row_group_id INTEGER NOT NULL,
+            PRIMARY KEY (pid, row_group_id)
+        ) WITHOUT ROWID;
+    ''')
+    return conn
+
+def index_files(paths, store_dir=EVENT_STORE_DIR):
+    """Adds the row groups of newly written part files to the index."""
+    with open_index(store_dir) as conn:
+        for path in paths:
+            parquet_file = pq.ParquetFile(path)
+            rel_path = os.path.relpath(path, store_dir)
+            for row_group in range(parquet_file.num_row_groups):
+                rows = parquet_file.read_row_group(row_group, columns=['timestamp', 'pid']).to_pandas()
+                if rows.empty:
+                    continue
+                cursor = conn.execute(
+                    'INSERT INTO row_groups (path, row_group, min_ts, max_ts) VALUES (?, ?, ?, ?)',
+                    (rel_path, row_group, rows['timestamp'].min().value, rows['timestamp'].max().value)
+                )
+                conn.executemany(
+                    'INSERT INTO pid_row_groups (pid, row_group_id) VALUES (?, ?)',
+                    [(int(pid), cursor.lastrowid) for pid in rows['pid'].unique()]
+                )
+    conn.close()
+
+def rebuild_index(store_dir=EVENT_STORE_DIR):
+    """Rebuilds the index from every part file of the store."""
+    index_path = os.path.join(store_dir, INDEX_FILE)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    paths = []
+    for root, _, files in os.walk(store_dir):
+        paths += [os.path.join(root, name) for name in files if name.endswith('.parquet')]
+    index_files(sorted(paths), store_dir)
+
+def _read_row_groups(row_groups, columns, store_dir):
+    """Reads (path, row_group) pairs in store order into one DataFrame."""
+    by_path = {}
+    for path, row_group in sorted(set(row_groups)):
+        by_path.setdefault(path, []).append(row_group)
+    tables = [
+        pq.ParquetFile(os.path.join(store_dir, path)).read_row_groups(groups, columns=columns)
+        for path, groups in by_path.items()
+    ]
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pa.concat_tables(tables, promote_options='default').to_pandas()
+
+def read_events_in_windows(windows, columns=None, store_dir=EVENT_STORE_DIR, through_row_group=None):
+    """
+    Loads the events inside any of the [start, end) windows, reading only
+    the row groups whose time span overlaps a window (and, with
+    through_row_group, only those written up to that row group).
+    """
+    if not os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+        rebuild_index(store_dir)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + ['timestamp']))
+
+    # Index bounds are UTC nanoseconds: compare in the store's time zone (naive = store-local)
+    tz = store_timezone(store_dir)
+    windows = [(to_store_time(start, tz), to_store_time(end, tz)) for start, end in windows]
+    newest = -1 if through_row_group is None else through_row_group
+    with open_index(store_dir) as conn:
+        row_groups = []
+        for start, end in windows:
+            row_groups += conn.execute(
+                'SELECT path, row_group FROM row_groups WHERE min_ts < ? AND max_ts >= ? AND (? < 0 OR id <= ?)',
+                (end.value, start.value, newest, newest)
+            ).fetchall()
+    conn.close()
+
+    df = _read_row_groups(row_groups, read_columns, store_dir)
+    if df.empty:
+        return df[columns] if columns else df
+
+    # Merge overlapping windows, then match every row with one sorted lookup
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    starts = pd.DatetimeIndex([start for start, _ in merged])
+    ends = pd.DatetimeIndex([end for _, end in merged])
+    timestamps = pd.DatetimeIndex(df['timestamp'])
+    position = starts.searchsorted(timestamps, side='right') - 1
+    keep = position >= 0
+    keep[keep] = timestamps[keep] < ends[position[keep]]
+    df = df[keep].reset_index(drop=True)
+    return df[columns] if columns else df
+
+def last_row_group(store_dir=EVENT_STORE_DIR):
+    """Id of the newest indexed row group (0 for an empty store); later writes get larger ids."""
+    if not os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+        rebuild_index(store_dir)
+    with open_index(store_dir) as conn:
+        newest = conn.execute('SELECT MAX(id) FROM row_groups').fetchone()[0]
+    conn.close()
+    return newest or 0
+
+def read_late_events(before, after_row_group, columns=None, store_dir=EVENT_STORE_DIR):
+    """
+    Loads the events before a time that were written after a row group
+    (last_row_group() of an earlier run): events that arrived after their
+    windows were processed. Only those newer row groups are read.
+    """
+    if not os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+        rebuild_index(store_dir)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + ['timestamp']))
+    before = to_store_time(before, store_timezone(store_dir))
+    with open_index(store_dir) as conn:
+        row_groups = conn.execute(
+            'SELECT path, row_group FROM row_groups WHERE id > ? AND min_ts < ?',
+            (after_row_group, before.value)
+        ).fetchall()
+    conn.close()
+
+    df = _read_row_groups(row_groups, read_columns, store_dir)
+    if df.empty:
+        return df[columns] if columns else df
+    df = df[df['timestamp'] < before].reset_index(drop=True)
+    return df[columns] if columns else df
+
+def read_events_for_pid(pid, columns=None, store_dir=EVENT_STORE_DIR):
+    """Loads every event of one PID, reading only the row groups that contain it."""
+    return read_events_for_pids([pid], columns, store_dir)
+
+def read_events_for_pids(pids, columns=None, store_dir=EVENT_STORE_DIR):
+    """Loads every event of several PIDs, reading only the row groups that contain one of them."""
+    if not os.path.exists(os.path.join(store_dir, INDEX_FILE)):
+        rebuild_index(store_dir)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + ['pid']))
+    pids = sorted({int(pid) for pid in pids})
+
+    with open_index(store_dir) as conn:
+        row_groups = []
+        for pid in pids:
+            row_groups += conn.execute(
+                '''SELECT path, row_group FROM row_groups
+                   JOIN pid_row_groups ON pid_row_groups.row_group_id = row_groups.id
+                   WHERE pid_row_groups.pid = ?''',
+                (pid,)
+            ).fetchall()
+    conn.close()
+
+    df = _read_row_groups(row_groups, read_columns, store_dir)
+    if df.empty:
+        return df[columns] if columns else df
+    df = df[df['pid'].isin(pids)].reset_index(drop=True)
+    return df[columns] if columns else df
+
+# ----------------------------------------------------------------------
+# D. READING
+# ----------------------------------------------------------------------
+def read_events(columns=None, start=None, end=None, store_dir=EVENT_STORE_DIR):
+    """
+    Loads events from the store. Only the requested columns are read and,
+    when start/end are given, only the day partitions and rows in
+    [start, end) are scanned.
+    """
+    if not os.path.exists(store_dir):
+        raise FileNotFoundError(f"Event store not found at: {store_dir}")
+
+    # Day partitions are named in the store's time zone: compare in that zone
+    filters = []
+    tz = store_timezone(store_dir) if start is not None or end is not None else None
+    if start is not None:
+        start = to_store_time(start, tz)
+        filters += [(PARTITION_COLUMN, '>=', start.strftime('%Y-%m-%d')), ('timestamp', '>=', start)]
+    if end is not None:
+        end = to_store_time(end, tz)
+        filters += [(PARTITION_COLUMN, '<=', end.strftime('%Y-%m-%d')), ('timestamp', '<', end)]
+
+    df = pd.read_parquet(store_dir, columns=columns, filters=filters or None)
+    return df.drop(columns=[PARTITION_COLUMN], errors='ignore')
+
+# ----------------------------------------------------------------------
+# E. MAIN EXECUTION (investigation lookups)
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Look up events in the event store.')
+    parser.add_argument('--pid', type=int, help='Show every event of this PID')
+    parser.add_argument('--start', help='Start of the time range (e.g. "2025-10-04 21:00:00+07:00")')
+    parser.add_argument('--end', help='End of the time range (exclusive)')
+    parser.add_argument('--rebuild-index', action='store_true', help='Rebuild the row-group index')
+    args = parser.parse_args()
+
+    if args.rebuild_index:
+        rebuild_index()
+        print(f"Index rebuilt: {os.path.join(EVENT_STORE_DIR, INDEX_FILE)}")
+
+    if args.pid is not None:
+        result = read_events_for_pid(args.pid)
+        if args.start or args.end:
+            tz = store_timezone()
+            start = to_store_time(args.start, tz) if args.start else result['timestamp'].min()
+            end = to_store_time(args.end, tz) if args.end else result['timestamp'].max() + pd.Timedelta(1, 'us')
+            result = result[(result['timestamp'] >= start) & (result['timestamp'] < end)]
+    elif args.start and args.end:
+        result = read_events_in_windows([(args.start, args.end)])
+    else:
+        result = None
+        if not args.rebuild_index:
+            parser.error('give --pid and/or --start/--end')
+
+    if result is not None:
+        pd.set_option('display.width', 1000)
+        print(result.to_string(index=False))
+        print(f"\nTotal events: {len(result)}")
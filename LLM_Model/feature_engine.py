@@ -0,0 +1,127 @@
+import pandas as pd
+
+from feature_schema import count_feature_name
+from preprocessing import RESAMPLE_FREQUENCY
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# How long a window stays open after its end for out-of-order log lines
+ALLOWED_LATENESS = '5s'
+
+# Non-count features, in the column order of create_time_series_features()
+WINDOW_FEATURES = ['avg_session_duration', 'max_session_duration', 'total_session_time', 'ratio_fatal_to_total',
+                   'new_query_templates']
+
+# ----------------------------------------------------------------------
+# B. STREAMING FEATURE ENGINE
+# ----------------------------------------------------------------------
+class StreamingFeatureEngine:
+    """
+    Incremental version of preprocessing.create_time_series_features().
+
+    Every event updates running aggregates of its window in O(1): counts per
+    event type, number of events, sum and max of session_duration_sec. A
+    window is emitted once the newest event is ALLOWED_LATENESS past its
+    end; windows without events in between are emitted as zero rows, like
+    resample() does. Events for an already emitted window are counted in
+    late_events and ignored. A query template id not in the known set
+    (e.g. the template table of the store) counts as a new template once.
+    """
+
+    def __init__(self, freq=RESAMPLE_FREQUENCY, allowed_lateness=ALLOWED_LATENESS, keep_events=False,
+                 known_query_ids=()):
+        self.freq = freq
+        self.window_delta = pd.Timedelta(freq)
+        self.allowed_lateness = pd.Timedelta(allowed_lateness)
+        self.keep_events = keep_events
+        self.late_events = 0
+        self._windows = {}          # window start -> running aggregates
+        self._next_window = None    # start of the next window to emit
+        self._emitting = False
+        self._max_timestamp = None
+        self._event_types = {}      # count feature name -> event type (for column order)
+        self._known_query_ids = set(known_query_ids)
+
+    def update(self, timestamp, event_type, session_duration_sec, event=None, query_id=None):
+        """Adds one event, returns the windows it closes as (start, features, events)."""
+        window = timestamp.floor(self.freq)
+        if self._emitting and window < self._next_window:
+            self.late_events += 1
+            return []
+        if self._next_window is None or window < self._next_window:
+            self._next_window = window
+
+        state = self._windows.get(window)
+        if state is None:
+            state = self._windows[window] = {'counts': {}, 'n': 0, 'sum': 0.0, 'max': 0.0, 'new': 0, 'events': []}
+        state['counts'][event_type] = state['counts'].get(event_type, 0) + 1
+        state['n'] += 1
+        state['sum'] += session_duration_sec
+        state['max'] = session_duration_sec if state['n'] == 1 else max(state['max'], session_duration_sec)
+        if query_id is not None and not pd.isna(query_id) and query_id not in self._known_query_ids:
+            self._known_query_ids.add(query_id)
+            state['new'] += 1
+        if self.keep_events:
+            state['events'].append(event)
+
+        if self._max_timestamp is None or timestamp > self._max_timestamp:
+            self._max_timestamp = timestamp
+        return self._emit_until(self._max_timestamp - self.allowed_lateness)
+
+    def update_frame(self, events_df):
+        """Adds the events of a parsed DataFrame (timestamp column as datetimes), in row order."""
+        closed = []
+        for event in events_df.itertuples(index=False):
+            closed.extend(self.update(
+                event.timestamp, event.event_type, event.session_duration_sec,
+                event if self.keep_events else None, getattr(event, 'query_id', None)
+            ))
+        return closed
+
+    def flush(self):
+        """Emits every remaining window, including the one still open."""
+        if not self._windows:
+            return []
+        return self._emit_until(max(self._windows) + self.window_delta)
+
+    def _emit_until(self, watermark):
+        """Emits, in time order, every window that ends at or before watermark."""
+        closed = []
+        while self._next_window is not None and self._next_window + self.window_delta <= watermark:
+            window = self._next_window
+            state = self._windows.pop(window, None)
+            closed.append((window, self._features(state), state['events'] if state else []))
+            self._emitting = True
+            self._next_window = window + self.window_delta
+        return closed
+
+    def _features(self, state):
+        """Turns running window aggregates into a feature dict."""
+        if state is None:
+            return dict.fromkeys(WINDOW_FEATURES, 0.0)
+
+        features = {}
+        for event_type, count in state['counts'].items():
+            name = count_feature_name(event_type)
+            self._event_types.setdefault(name, event_type)
+            features[name] = features.get(name, 0) + count
+        n = state['n']
+        features['avg_session_duration'] = state['sum'] / n
+        features['max_session_duration'] = state['max']
+        features['total_session_time'] = state['sum']
+        features['ratio_fatal_to_total'] = features.get('count_fatal', 0) / n
+        features['new_query_templates'] = state['new']
+        return features
+
+    def to_frame(self, windows):
+        """
+        Builds a feature DataFrame from emitted windows, with the columns of
+        create_time_series_features() for the event types seen so far.
+        """
+        count_cols = sorted(self._event_types, key=self._event_types.get)
+        index = pd.DatetimeIndex([window for window, _, _ in windows], name='timestamp')
+        df = pd.DataFrame([features for _, features, _ in windows], index=index,
+                          columns=count_cols + WINDOW_FEATURES)
+        df[count_cols] = df[count_cols].fillna(0).astype('int64')
+        return df
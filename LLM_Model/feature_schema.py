@@ -0,0 +1,114 @@
+import json
+import os
+import re
+import numpy as np
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# Schema saved next to the scaler and model of the same version (YYYYMMDD);
+# tag marks the schemas of extra window sizes (e.g. feature_schema-5min-YYYYMMDD.json)
+SCHEMA_FILE_TEMPLATE = 'feature_schema{tag}-{version}.json'
+SCHEMA_FILE_PATTERN = re.compile(r'feature_schema-(\d{8})\.json')
+
+def count_feature_name(event_type):
+    """Name of the count feature of an event type (e.g. FATAL -> count_fatal)."""
+    return f'count_{event_type.lower().replace(" ", "_")}'
+
+# ----------------------------------------------------------------------
+# B. FEATURE SCHEMA
+# ----------------------------------------------------------------------
+class FeatureSchema:
+    """
+    Fixed, ordered feature columns shared by training and realtime scoring.
+
+    Every feature (and so every event type's count_* feature) has a fixed
+    column index. The schema only grows: extend() appends new columns and
+    bumps the schema version, existing indexes never move. Realtime
+    feature dicts are written straight into a preallocated NumPy array
+    in this column order.
+    """
+
+    def __init__(self, columns, version=1, freq=None):
+        self.columns = list(columns)
+        self.version = version
+        self.freq = freq
+        self.index = {name: i for i, name in enumerate(self.columns)}
+        self._event_type_index = {}
+
+    def __len__(self):
+        return len(self.columns)
+
+    def __eq__(self, other):
+        return isinstance(other, FeatureSchema) and self.columns == other.columns
+
+    def event_type_index(self, event_type):
+        """Column index of an event type's count feature (None if not in the schema)."""
+        if event_type not in self._event_type_index:
+            self._event_type_index[event_type] = self.index.get(count_feature_name(event_type))
+        return self._event_type_index[event_type]
+
+    def extend(self, columns):
+        """Returns the schema with the unknown columns appended (self if there are none)."""
+        new_columns = [col for col in columns if col not in self.index]
+        if not new_columns:
+            return self
+        return FeatureSchema(self.columns + new_columns, self.version + 1, self.freq)
+
+    def align(self, df):
+        """Orders a feature DataFrame by the schema (missing features are 0)."""
+        return df.reindex(columns=self.columns, fill_value=0)
+
+    def vectorize(self, features, out=None):
+        """
+        Writes a list of {feature name: value} dicts into an (n, len(schema))
+        float array (out, if given, is reused). Features outside the schema
+        are ignored, missing ones are 0.
+        """
+        if out is None:
+            out = np.zeros((len(features), len(self.columns)))
+        else:
+            out = out[:len(features)]
+            out.fill(0.0)
+        index = self.index
+        for i, row in enumerate(features):
+            for name, value in row.items():
+                j = index.get(name)
+                if j is not None:
+                    out[i, j] = value
+        return out
+
+    def save(self, path):
+        """Saves the schema as JSON."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'freq': self.freq, 'columns': self.columns}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a schema saved by save()."""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data['columns'], data.get('version', 1), data.get('freq'))
+
+def schema_path(model_dir, version, tag=''):
+    """Path of the schema of a model version."""
+    return os.path.join(model_dir, SCHEMA_FILE_TEMPLATE.format(tag=tag, version=version))
+
+def load_schema(model_dir, version, scaler=None):
+    """
+    Loads the schema of a model version. Versions trained before schemas
+    were saved get one built from their scaler's feature names.
+    """
+    path = schema_path(model_dir, version)
+    if os.path.exists(path):
+        return FeatureSchema.load(path)
+    if scaler is not None:
+        return FeatureSchema(scaler.feature_names_in_.tolist())
+    return None
+
+def latest_schema(model_dir):
+    """Loads the newest schema saved in model_dir (None if there is none)."""
+    versions = [
+        match.group(1) for match in map(SCHEMA_FILE_PATTERN.fullmatch, os.listdir(model_dir)) if match
+    ] if os.path.isdir(model_dir) else []
+    return FeatureSchema.load(schema_path(model_dir, max(versions))) if versions else None
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# Number of forests kept (one per incremental retraining); older ones are dropped
+ROLLING_HORIZON = 5
+
+# ----------------------------------------------------------------------
+# B. ROLLING FOREST ENSEMBLE
+# ----------------------------------------------------------------------
+def scaling_of(scaler, forest):
+    """(columns, mean, scale) of a fitted StandardScaler on a forest's columns (None without a scaler)."""
+    if scaler is None:
+        return None
+    names = list(getattr(forest, 'feature_names_in_', scaler.feature_names_in_))
+    positions = {name: i for i, name in enumerate(scaler.feature_names_in_)}
+    columns = [positions[name] for name in names]
+    return np.array(names, dtype=object), scaler.mean_[columns].copy(), scaler.scale_[columns].copy()
+
+class RollingForestEnsemble:
+    """
+    Isolation Forest ensemble over a rolling horizon of training runs.
+
+    Every incremental retraining adds one forest fitted on the new windows
+    only and drops the oldest forest beyond the horizon. The anomaly score
+    is the tree-weighted mean of the forests' score_samples(); offset_ is
+    set from the newest training windows, like IsolationForest.fit()
+    does. It exposes the IsolationForest scoring API (score_samples,
+    decision_function, predict, offset_, n_features_in_,
+    feature_names_in_), so it is saved and served like a single model.
+
+    The feature schema may grow between runs (new count_* columns are
+    appended): each forest scores the columns it was fitted on, picked by
+    name from a DataFrame or by position from an array in the newest
+    forest's column order.
+
+    The scaler is updated with partial_fit() between runs, so each forest
+    keeps the mean and scale of the scaler its windows were scaled with.
+    X is scaled with the newest forest's scaler; every older forest gets
+    it back on its own scaling before scoring.
+    """
+
+    def __init__(self, horizon=ROLLING_HORIZON, contamination='auto'):
+        self.horizon = horizon
+        self.contamination = contamination
+        self.forests = []
+        self.scalings = []      # per forest: (mean, scale) of its columns, None if unknown
+        self.offset_ = None
+
+    @classmethod
+    def from_model(cls, model, horizon=ROLLING_HORIZON, scaler=None):
+        """Wraps a single IsolationForest (trained on data scaled by scaler) as the first member of an ensemble."""
+        if isinstance(model, cls):
+            model.horizon = horizon
+            model.scalings = getattr(model, 'scalings', [None] * len(model.forests))
+            return model
+        ensemble = cls(horizon, model.contamination)
+        ensemble.forests = [model]
+        ensemble.scalings = [scaling_of(scaler, model)]
+        ensemble.offset_ = model.offset_
+        return ensemble
+
+    @property
+    def n_features_in_(self):
+        return self.forests[-1].n_features_in_
+
+    @property
+    def feature_names_in_(self):
+        return getattr(self.forests[-1], 'feature_names_in_', None)
+
+    @property
+    def n_estimators(self):
+        return sum(forest.n_estimators for forest in self.forests)
+
+    def add_forest(self, forest, X, scaler=None):
+        """Adds a forest fitted on X (scaled by scaler), drops the oldest ones, recomputes offset_ on X."""
+        if self.forests and forest.n_features_in_ < self.n_features_in_:
+            raise ValueError(f"forest has {forest.n_features_in_} features, ensemble has {self.n_features_in_}")
+        self.forests.append(forest)
+        self.scalings.append(scaling_of(scaler, forest))
+        del self.forests[:-self.horizon]
+        del self.scalings[:-self.horizon]
+        if self.contamination == 'auto':
+            self.offset_ = -0.5
+        else:
+            self.offset_ = np.percentile(self.score_samples(X), 100.0 * self.contamination)
+        return self
+
+    def score_samples(self, X):
+        """Tree-weighted mean of the forests' anomaly scores (lower is more abnormal)."""
+        weights = np.array([forest.n_estimators for forest in self.forests], dtype=float)
+        scores = np.array([
+            forest.score_samples(self._rescale(scaling, self._columns_of(forest, X)))
+            for forest, scaling in zip(self.forests, self.scalings)
+        ])
+        return weights @ scores / weights.sum()
+
+    def _columns_of(self, forest, X):
+        """The columns of X a forest was fitted on."""
+        names = getattr(forest, 'feature_names_in_', None)
+        if names is None or len(names) == X.shape[1]:
+            return X
+        if hasattr(X, 'columns'):
+            return X[list(names)]
+        return X[:, self._positions(names)]
+
+    def _positions(self, names):
+        positions = {name: i for i, name in enumerate(self.feature_names_in_)}
+        return [positions[name] for name in names]
+
+    def _rescale(self, scaling, X):
+        """Moves X (a forest's columns, on the newest scaling) to the scaling the forest was fitted on."""
+        newest = self.scalings[-1]
+        if scaling is None or newest is None or scaling is newest:
+            return X
+        columns = self._positions(scaling[0])
+        mean, scale = newest[1][columns], newest[2][columns]
+        rescaled = (np.asarray(X, dtype=float) * scale + mean - scaling[1]) / scaling[2]
+        if hasattr(X, 'columns'):
+            return pd.DataFrame(rescaled, index=X.index, columns=X.columns)
+        return rescaled
+
+    def decision_function(self, X):
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X):
+        return np.where(self.decision_function(X) < 0, -1, 1)
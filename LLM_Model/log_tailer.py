@@ -0,0 +1,121 @@
+import os
+import time
+
+# inotify is optional (Linux only): without it the tailer polls os.stat()
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# Maximum number of bytes read from the log per read_lines() call
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Interval between os.stat() checks while waiting without inotify
+STAT_INTERVAL = 0.25  # seconds
+
+# ----------------------------------------------------------------------
+# B. LOG TAILER
+# ----------------------------------------------------------------------
+class LogTailer:
+    """
+    Follows a growing log file through a persistent handle.
+
+    Lines are returned in bounded chunks and only once complete (a partial
+    last line is kept until its newline arrives). A new inode at the log
+    path means the file was rotated: the old handle is drained, then the
+    new file is read from byte 0. A file shorter than the read position
+    was truncated and is read again from byte 0.
+    """
+
+    def __init__(self, path, chunk_size=READ_CHUNK_SIZE, from_end=False, use_inotify=True):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.from_end = from_end
+        self._file = None
+        self._inode = None
+        self._partial = b''
+        self._inotify = None
+        if use_inotify and INotify is not None:
+            self._inotify = INotify()
+            watch_flags = flags.MODIFY | flags.CREATE | flags.MOVED_TO | flags.DELETE
+            self._inotify.add_watch(os.path.dirname(os.path.abspath(path)), watch_flags)
+
+    def _open(self):
+        """Opens the log file if it exists, returns True when a handle is open."""
+        if self._file is not None:
+            return True
+        try:
+            self._file = open(self.path, 'rb')
+        except FileNotFoundError:
+            return False
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        if self.from_end:
+            self._file.seek(0, os.SEEK_END)
+            self.from_end = False  # files appearing after a rotation are read fully
+        self._partial = b''
+        return True
+
+    def _reopen_if_rotated(self):
+        """
+        Switches to the file currently at the path after rotation or
+        truncation. Returns the unterminated last line of a rotated file.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return b''  # rotated away and not recreated yet: keep draining the old handle
+        if st.st_ino != self._inode:
+            last_line = self._partial + b'\n' if self._partial else b''
+            self.close()
+            self._open()
+            return last_line
+        if st.st_size < self._file.tell():
+            self._file.seek(0)
+            self._partial = b''
+        return b''
+
+    def read_lines(self):
+        """Returns up to chunk_size bytes of new complete lines (possibly none)."""
+        if not self._open():
+            return []
+
+        data = self._file.read(self.chunk_size)
+        if not data:
+            # Old file fully drained: look for rotation/truncation before the next read
+            data = self._reopen_if_rotated()
+            if self._file is not None:
+                data += self._file.read(self.chunk_size)
+
+        data = self._partial + data
+        last_newline = data.rfind(b'\n')
+        if last_newline == -1:
+            self._partial = data
+            return []
+        self._partial = data[last_newline + 1:]
+        return data[:last_newline + 1].decode('utf-8', errors='replace').splitlines(keepends=True)
+
+    def wait(self, timeout):
+        """Blocks until the log directory changes (inotify) or the file grows, at most timeout seconds."""
+        if self._inotify is not None:
+            self._inotify.read(timeout=int(timeout * 1000))
+            return
+
+        deadline = time.monotonic() + timeout
+        position = self._file.tell() if self._file is not None else None
+        while time.monotonic() < deadline:
+            time.sleep(STAT_INTERVAL)
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                continue
+            if position is None or st.st_ino != self._inode or st.st_size != position:
+                return
+
+    def close(self):
+        """Closes the current file handle."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
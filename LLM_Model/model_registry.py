@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+import joblib
+
+from data_extraction import CONTINUATION_LEVELS
+from feature_schema import count_feature_name, load_schema
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_DIR = os.path.join(BASE_DIR, 'trained_model')
+
+# Artifacts written by preprocessing.py and model_training.py (version = YYYYMMDD)
+SCALER_FILE_PATTERN = re.compile(r'scaler-(\d{8})\.pkl')
+MODEL_FILE_PATTERN = re.compile(r'isolation_forest_model-(\d{8})\.pkl')
+
+# Minimum time between two scans of MODEL_DIR for a new version
+RELOAD_INTERVAL = 30  # seconds
+
+# Features the pipeline no longer produces: DETAIL/STATEMENT... lines are
+# folded into their record, so their count_* features would always be 0.
+# A model trained on them has to be retrained.
+RETIRED_FEATURES = frozenset(count_feature_name(level) for level in CONTINUATION_LEVELS)
+
+# A loaded scaler + model pair, the feature columns they expect and their schema
+ModelBundle = namedtuple('ModelBundle', ['version', 'scaler', 'model', 'features', 'schema'])
+
+# ----------------------------------------------------------------------
+# B. VERSION DISCOVERY AND LOADING
+# ----------------------------------------------------------------------
+def list_versions(model_dir=MODEL_DIR):
+    """
+    Returns {version: (scaler path, model path, signature)} for every
+    version that has both files. The signature (mtimes and sizes) changes
+    when a version is retrained on the same day.
+    """
+    scalers, models = {}, {}
+    if not os.path.isdir(model_dir):
+        return {}
+    for entry in os.scandir(model_dir):
+        for pattern, found in ((SCALER_FILE_PATTERN, scalers), (MODEL_FILE_PATTERN, models)):
+            match = pattern.fullmatch(entry.name)
+            if match:
+                st = entry.stat()
+                found[match.group(1)] = (entry.path, (st.st_mtime_ns, st.st_size))
+    return {
+        version: (scalers[version][0], models[version][0], (scalers[version][1], models[version][1]))
+        for version in scalers.keys() & models.keys()
+    }
+
+def load_bundle(version, scaler_path, model_path):
+    """Loads one scaler + model pair and its feature schema, and checks that their features match."""
+    scaler = joblib.load(scaler_path)
+    model = joblib.load(model_path)
+    features = scaler.feature_names_in_.tolist()
+    schema = load_schema(os.path.dirname(scaler_path), version, scaler)
+    if schema.columns != features:
+        raise ValueError("feature schema and scaler columns differ")
+    retired = [feature for feature in features if feature in RETIRED_FEATURES]
+    if retired:
+        raise ValueError(f"trained on features no longer produced ({', '.join(retired)}), retrain it")
+    if model.n_features_in_ != len(features):
+        raise ValueError(f"model expects {model.n_features_in_} features, scaler gives {len(features)}")
+    model_features = getattr(model, 'feature_names_in_', None)
+    if model_features is not None and model_features.tolist() != features:
+        raise ValueError("model and scaler feature names differ")
+    return ModelBundle(version, scaler, model, features, schema)
+
+# ----------------------------------------------------------------------
+# C. MODEL REGISTRY
+# ----------------------------------------------------------------------
+class ModelRegistry:
+    """
+    Serves the latest compatible scaler + model pair of MODEL_DIR.
+
+    The loaded pair is cached in memory. refresh() rescans the directory
+    (at most every reload_interval seconds) and, when a newer version or a
+    retrained one appears, loads it completely before swapping it in with
+    a single reference assignment, so callers never see a half-loaded
+    pair and scoring never pauses. A version that fails to load or
+    validate is skipped (and retried only once its files change); the
+    previous pair stays in service.
+    """
+
+    def __init__(self, model_dir=MODEL_DIR, reload_interval=RELOAD_INTERVAL):
+        self.model_dir = model_dir
+        self.reload_interval = reload_interval
+        self._bundle = None
+        self._signature = None
+        self._rejected = {}         # version -> signature that failed to load
+        self._last_scan = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """Returns the cached ModelBundle (None before the first successful load)."""
+        return self._bundle
+
+    def refresh(self, force=False):
+        """Loads a newer version if one appeared, returns the current ModelBundle."""
+        now = time.monotonic()
+        if not force and self._last_scan is not None and now - self._last_scan < self.reload_interval:
+            return self._bundle
+        if not self._lock.acquire(blocking=False):
+            return self._bundle  # another thread is already loading
+        try:
+            self._last_scan = now
+            versions = list_versions(self.model_dir)
+            current_version = self._bundle.version if self._bundle else None
+            for version in sorted(versions, reverse=True):
+                scaler_path, model_path, signature = versions[version]
+                if version == current_version and signature == self._signature:
+                    break  # newest valid version already in service
+                if current_version is not None and version < current_version:
+                    break
+                if self._rejected.get(version) == signature:
+                    continue
+                try:
+                    bundle = load_bundle(version, scaler_path, model_path)
+                except Exception as e:
+                    print(f"WARNING: Skipping model version {version}: {e}")
+                    self._rejected[version] = signature
+                    continue
+                self._bundle, self._signature = bundle, signature
+                print(f"Model version {version} loaded ({len(bundle.features)} features, schema v{bundle.schema.version}).")
+                break
+            return self._bundle
+        finally:
+            self._lock.release()
+
+# In-process cache: one registry per model directory
+_registries = {}
+
+def get_registry(model_dir=MODEL_DIR):
+    """Returns the shared ModelRegistry of model_dir, loading its latest version."""
+    registry = _registries.get(model_dir)
+    if registry is None:
+        registry = _registries[model_dir] = ModelRegistry(model_dir)
+        registry.refresh(force=True)
+    return registry
+
+# ----------------------------------------------------------------------
+# D. MAIN EXECUTION (list versions)
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    versions = list_versions()
+    for version in sorted(versions):
+        print(f"{version}: {os.path.basename(versions[version][0])}, {os.path.basename(versions[version][1])}")
+    bundle = get_registry().current()
+    print(f"Resolved version: {bundle.version if bundle else 'none'}")
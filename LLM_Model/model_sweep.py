@@ -0,0 +1,208 @@
+import argparse
+import itertools
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.preprocessing import StandardScaler
+
+from event_store import read_query_templates
+from model_training import CONTAMINATION_RATE
+from preprocessing import INPUT_EVENTS_PATH, RESAMPLE_FREQUENCY, create_time_series_features, load_and_prepare_data
+from scoring_service import MAX_BATCH_SIZE
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+timestamp_str = datetime.now().strftime('%Y%m%d')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_DIR = os.path.join(BASE_DIR, '..', 'CSV_FILE', 'OUTPUT_CSVFILE', 'REPORT')
+OUTPUT_SWEEP_REPORT_PATH = os.path.join(REPORT_DIR, f'model_sweep_report-{timestamp_str}.csv')
+
+# Default search grid
+CONTAMINATION_GRID = [0.005, 0.01, 0.02]
+N_ESTIMATORS_GRID = [25, 50, 100, 200]
+MAX_SAMPLES_GRID = ['auto', 128, 512]
+FREQUENCY_GRID = ['30s', '1min', '5min']
+
+# Reference model (the production configuration of model_training.py)
+REFERENCE_PARAMS = {'freq': RESAMPLE_FREQUENCY, 'contamination': CONTAMINATION_RATE,
+                    'n_estimators': 100, 'max_samples': 'auto'}
+REFERENCE_SEED = 42
+
+# Every candidate is fitted once per seed to measure how stable its flags are
+STABILITY_SEEDS = [0, 1, 2]
+
+# Scoring latency is measured on realtime-sized micro-batches, serially
+# after the pool (no contention), as the median of LATENCY_ROUNDS runs
+LATENCY_BATCHES = 20
+LATENCY_ROUNDS = 5
+
+# A candidate keeps detection quality if it finds this share of the
+# reference model's anomalous windows, with stable flags across seeds
+MIN_RECALL = 0.8
+MIN_STABILITY = 0.8
+
+# ----------------------------------------------------------------------
+# B. CANDIDATE EVALUATION (runs in the worker processes)
+# ----------------------------------------------------------------------
+_scaled_by_freq = {}
+
+def _init_worker(scaled_by_freq):
+    """Receives the scaled feature frames once per worker process."""
+    global _scaled_by_freq
+    _scaled_by_freq = scaled_by_freq
+
+def jaccard(a, b):
+    """Jaccard similarity of two sets of flagged windows (1.0 if both are empty)."""
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+def evaluate_candidate(params):
+    """
+    Fits one candidate for every stability seed and measures fit time,
+    serialized model size and the windows it flags. The last fitted model
+    is returned for score_latency().
+    """
+    X = _scaled_by_freq[params['freq']]
+    fit_times, flagged = [], []
+    for seed in params.get('seeds', STABILITY_SEEDS):
+        model = IsolationForest(
+            contamination=params['contamination'],
+            n_estimators=params['n_estimators'],
+            max_samples=min(params['max_samples'], len(X)) if params['max_samples'] != 'auto' else 'auto',
+            random_state=seed,
+            n_jobs=1
+        )
+        start = time.perf_counter()
+        model.fit(X)
+        fit_times.append(time.perf_counter() - start)
+        flagged.append(frozenset(X.index[model.predict(X) == -1]))
+
+    stability = np.mean([jaccard(a, b) for a, b in itertools.combinations(flagged, 2)]) if len(flagged) > 1 else 1.0
+    return {
+        **{key: params[key] for key in ('freq', 'contamination', 'n_estimators', 'max_samples')},
+        'fit_time_s': np.mean(fit_times),
+        'model_size_kb': len(pickle.dumps(model)) / 1024,
+        'stability': stability,
+        'flagged_windows': flagged,
+        'model': model
+    }
+
+def score_latency(model, X):
+    """Median micro-batch scoring latency per window (microseconds) over LATENCY_ROUNDS runs."""
+    batches = [X.iloc[i:i + MAX_BATCH_SIZE] for i in range(0, min(len(X), LATENCY_BATCHES * MAX_BATCH_SIZE), MAX_BATCH_SIZE)]
+    n_windows = sum(len(batch) for batch in batches)
+    rounds = []
+    for _ in range(LATENCY_ROUNDS):
+        start = time.perf_counter()
+        for batch in batches:
+            model.score_samples(batch)
+        rounds.append((time.perf_counter() - start) / n_windows * 1e6)
+    return float(np.median(rounds))
+
+# ----------------------------------------------------------------------
+# C. SWEEP AND RANKING
+# ----------------------------------------------------------------------
+def scale_for_sweep(events_df, freq, template_first_seen=None):
+    """Builds and scales the features of one resample frequency, like preprocessing.py (nothing is saved)."""
+    features_df = create_time_series_features(events_df, freq, template_first_seen)
+    return pd.DataFrame(StandardScaler().fit_transform(features_df), index=features_df.index, columns=features_df.columns)
+
+def reference_recall(flagged_windows, freq, reference_windows, reference_freq=REFERENCE_PARAMS['freq']):
+    """
+    Share of the reference model's anomalous windows that overlap a window
+    flagged by the candidate (windows of any resample frequency, finer or
+    coarser than the reference ones).
+    """
+    if len(reference_windows) == 0:
+        return 1.0
+    reference_starts = pd.DatetimeIndex(reference_windows)
+    reference_ends = reference_starts + pd.Timedelta(reference_freq)
+    recalls = []
+    for flagged in flagged_windows:
+        starts = pd.DatetimeIndex(sorted(flagged))
+        # First flagged window ending after the reference window starts; it overlaps if it starts before its end
+        first = starts.searchsorted(reference_starts - pd.Timedelta(freq), side='right')
+        overlaps = first < len(starts)
+        overlaps[overlaps] = starts[first[overlaps]] < reference_ends[overlaps]
+        recalls.append(overlaps.mean())
+    return np.mean(recalls)
+
+def rank_candidates(results, reference_windows):
+    """
+    Ranks candidates: those that keep detection quality (MIN_RECALL,
+    MIN_STABILITY) first, each group from the cheapest (scoring latency,
+    then model size, then fit time).
+    """
+    report_df = pd.DataFrame(results)
+    report_df['recall_vs_reference'] = [
+        reference_recall(row.flagged_windows, row.freq, reference_windows) for row in report_df.itertuples()
+    ]
+    report_df['keeps_quality'] = (report_df['recall_vs_reference'] >= MIN_RECALL) & (report_df['stability'] >= MIN_STABILITY)
+    report_df = report_df.drop(columns=['flagged_windows']).sort_values(
+        by=['keeps_quality', 'score_latency_us_per_window', 'model_size_kb', 'fit_time_s'],
+        ascending=[False, True, True, True]
+    ).reset_index(drop=True)
+    report_df.insert(0, 'rank', report_df.index + 1)
+    return report_df
+
+def run_sweep(grid, workers=None):
+    """Evaluates every candidate of the grid in a process pool, returns the ranked report."""
+    events_df = load_and_prepare_data(INPUT_EVENTS_PATH)
+    if events_df is None or events_df.empty:
+        print("Invalid or empty event data. Stopping sweep.")
+        return None
+
+    freqs = list(dict.fromkeys(grid['freq'] + [REFERENCE_PARAMS['freq']]))
+    template_first_seen = read_query_templates(store_dir=INPUT_EVENTS_PATH)['first_seen']
+    scaled_by_freq = {freq: scale_for_sweep(events_df, freq, template_first_seen) for freq in freqs}
+
+    candidates = [
+        dict(zip(('freq', 'contamination', 'n_estimators', 'max_samples'), values))
+        for values in itertools.product(grid['freq'], grid['contamination'], grid['n_estimators'], grid['max_samples'])
+    ]
+    print(f"Evaluating {len(candidates)} candidates x {len(STABILITY_SEEDS)} seeds...")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(scaled_by_freq,)) as executor:
+        reference = executor.submit(evaluate_candidate, {**REFERENCE_PARAMS, 'seeds': [REFERENCE_SEED]})
+        results = list(executor.map(evaluate_candidate, candidates))
+        reference_windows = pd.DatetimeIndex(sorted(reference.result()['flagged_windows'][0]))
+
+    # Latency is timed one candidate at a time, once the pool no longer competes for the CPU
+    print("Timing scoring latency...")
+    for result in results:
+        result['score_latency_us_per_window'] = score_latency(result.pop('model'), scaled_by_freq[result['freq']])
+
+    return rank_candidates(results, reference_windows)
+
+# ----------------------------------------------------------------------
+# D. MAIN EXECUTION LOGIC
+# ----------------------------------------------------------------------
+def _max_samples(value):
+    return value if value == 'auto' else int(value)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep Isolation Forest hyperparameters and rank the candidates.')
+    parser.add_argument('--contamination', type=float, nargs='+', default=CONTAMINATION_GRID)
+    parser.add_argument('--n-estimators', type=int, nargs='+', default=N_ESTIMATORS_GRID)
+    parser.add_argument('--max-samples', type=_max_samples, nargs='+', default=MAX_SAMPLES_GRID)
+    parser.add_argument('--freq', nargs='+', default=FREQUENCY_GRID, help='Resample frequencies (e.g. 30s 1min)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    args = parser.parse_args()
+
+    grid = {'contamination': args.contamination, 'n_estimators': args.n_estimators,
+            'max_samples': args.max_samples, 'freq': args.freq}
+    report_df = run_sweep(grid, args.workers)
+
+    if report_df is not None:
+        os.makedirs(REPORT_DIR, exist_ok=True)
+        report_df.to_csv(OUTPUT_SWEEP_REPORT_PATH, index=False)
+        print(f"\nSweep report saved to: {OUTPUT_SWEEP_REPORT_PATH}")
+
+        pd.set_option('display.width', 1000)
+        print("\nTop 10 candidates (cheapest that keep detection quality first):")
+        print(report_df.head(10).to_string(index=False))
@@ -1,9 +1,15 @@
 import os 
+import sys
+import argparse
 import pandas as pd
 from datetime import datetime
 from sklearn.ensemble import IsolationForest
 import joblib
 
+from event_store import read_checkpoint
+from forest_ensemble import ROLLING_HORIZON, RollingForestEnsemble
+from preprocessing import FEATURE_CHECKPOINT_PATH, RESAMPLE_FREQUENCY, resolution_tag, scaler_path
+
 # ----------------------------------------------------------------------
 # A. CONFIGURATION AND PATH SETUP
 # ----------------------------------------------------------------------
@@ -15,33 +21,42 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CSV_DIR = os.path.join(BASE_DIR, '..','CSV_FILE','OUTPUT_CSVFILE','TRAIN_AI') 
 MODEL_DIR = os.path.join(BASE_DIR,'trained_model')
 
-# Define input/output file names
-INPUT_SCALED_DATA_FILE = f'processed_scaled_features-{timestamp_str}.csv'
-MODEL_FILE_NAME = f'isolation_forest_model-{timestamp_str}.pkl'
+# Define input/output file names (one set per window size, see preprocessing.resolution_tag)
+def input_scaled_data_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, f'processed_scaled_features{resolution_tag(freq)}-{timestamp_str}.parquet')
+
+def model_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(MODEL_DIR, f'isolation_forest_model{resolution_tag(freq)}-{timestamp_str}.pkl')
 
-INPUT_SCALED_DATA_PATH = os.path.join(CSV_DIR, INPUT_SCALED_DATA_FILE)
-MODEL_PATH = os.path.join(MODEL_DIR, MODEL_FILE_NAME)
+def anomaly_output_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, f'anomaly_records{resolution_tag(freq)}-{timestamp_str}.parquet')
+
+INPUT_SCALED_DATA_PATH = input_scaled_data_path()
+MODEL_PATH = model_path()
 
 # Model parameters
 CONTAMINATION_RATE = 0.01
 
+# Trees added per incremental retraining (ROLLING_HORIZON forests are kept)
+INCREMENTAL_N_ESTIMATORS = 20
+
 # ----------------------------------------------------------------------
 # B. DATA LOADING FUNCTION
 # ----------------------------------------------------------------------
 def load_scaled_data(file_path):
-    """Loads the scaled feature data from CSV."""
+    """Loads the scaled feature data (Parquet, indexed by timestamp)."""
     if not os.path.exists(file_path):
         print(f"ERROR: Scaled data file not found at: {file_path}")
         return None
         
     print(f"Loading data from: {file_path}") 
     try:
-        # Read data, set 'timestamp' as index
-        df = pd.read_csv(file_path, index_col='timestamp', parse_dates=True)
+        # Read data, 'timestamp' index is restored from the Parquet metadata
+        df = pd.read_parquet(file_path)
         print(f"Loading successful. Data shape: {df.shape}") 
         return df
     except Exception as e:
-        print(f"ERROR reading CSV file: {e}")
+        print(f"ERROR reading Parquet file: {e}")
         return None
 # ----------------------------------------------------------------------
 # C. MODEL TRAINING FUNCTION
@@ -64,6 +79,31 @@ def train_anomaly_model(data_df):
 
     print("Training complete.")
     return model
+
+def update_anomaly_model(data_df, base_model_path, base_scaler=None, scaler=None):
+    """
+    Incremental version of train_anomaly_model(): fits a small forest on
+    the new windows only and adds it to the previous model's rolling
+    ensemble (the oldest forest beyond ROLLING_HORIZON is dropped).
+    data_df is scaled by scaler (the base scaler after partial_fit()); the
+    forests of the previous model keep the scaling they were fitted on.
+    """
+    ensemble = RollingForestEnsemble.from_model(joblib.load(base_model_path), ROLLING_HORIZON, base_scaler)
+    print(f"\nAdding {INCREMENTAL_N_ESTIMATORS} trees fitted on {len(data_df)} new windows "
+          f"to the previous model ({ensemble.n_estimators} trees)...")
+
+    forest = IsolationForest(
+        contamination=CONTAMINATION_RATE,
+        random_state=42,
+        n_estimators=INCREMENTAL_N_ESTIMATORS,
+        n_jobs=-1
+    )
+    forest.fit(data_df)
+    ensemble.contamination = CONTAMINATION_RATE
+    ensemble.add_forest(forest, data_df, scaler)
+
+    print(f"Training complete. {len(ensemble.forests)} forests, {ensemble.n_estimators} trees.")
+    return ensemble
 # ----------------------------------------------------------------------
 # D. MODEL SAVING FUNCTION
 # ----------------------------------------------------------------------
@@ -82,68 +122,95 @@ def save_model(model, model_path):
 # E. MAIN EXECUTION LOGIC
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
-    
-    # 1. Load input data
-    scaled_data_df = load_scaled_data(INPUT_SCALED_DATA_PATH)
-
-    if scaled_data_df is None or scaled_data_df.empty:
-        print("Invalid or empty input data. Stopping training process.")
-    else:
-        # Create feature dataframe copy
-        X_features = scaled_data_df.copy()
+    parser = argparse.ArgumentParser(description='Train the Isolation Forest anomaly model.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Extend the previous model with trees fitted on the new windows only '
+                             '(run after preprocessing.py --incremental)')
+    parser.add_argument('--resolutions', nargs='+', default=[RESAMPLE_FREQUENCY],
+                        help='Window sizes to train one model each for (built by preprocessing.py --resolutions)')
+    args = parser.parse_args()
+
+    resolutions = list(dict.fromkeys(args.resolutions))
+    if args.incremental and resolutions != [RESAMPLE_FREQUENCY]:
+        parser.error(f'--incremental only supports the {RESAMPLE_FREQUENCY} windows')
+
+    if args.incremental:
+        checkpoint = read_checkpoint(FEATURE_CHECKPOINT_PATH)
+        base_version = checkpoint.get('base_version') if checkpoint.get('version') == timestamp_str else None
+        base_model_path = os.path.join(MODEL_DIR, f'isolation_forest_model-{base_version}.pkl')
+        if base_version is None or not os.path.exists(base_model_path):
+            print("No previous model to extend. Run preprocessing.py --incremental (or a full training) first.")
+            sys.exit(1)
+        # Scaler of the previous model and the one updated by preprocessing.py --incremental
+        base_scaler = joblib.load(os.path.join(MODEL_DIR, f'scaler-{base_version}.pkl'))
+        scaler = joblib.load(scaler_path())
+
+    for freq in resolutions:
+        # 1. Load input data
+        print(f"\n=== {freq} windows ===")
+        scaled_data_df = load_scaled_data(input_scaled_data_path(freq))
+
+        if scaled_data_df is None or scaled_data_df.empty:
+            print("Invalid or empty input data. Skipping this window size.")
+        else:
+            # Create feature dataframe copy
+            X_features = scaled_data_df.copy()
         
-        # 2. Train the model
-        anomaly_model = train_anomaly_model(X_features) 
+            # 2. Train the model
+            if args.incremental:
+                anomaly_model = update_anomaly_model(X_features, base_model_path, base_scaler, scaler)
+            else:
+                anomaly_model = train_anomaly_model(X_features) 
         
-        # 3. Save the trained model
-        save_model(anomaly_model, MODEL_PATH)
+            # 3. Save the trained model
+            save_model(anomaly_model, model_path(freq))
         
-        # 4. Model check and anomaly extraction
-        print("\n--- Quick check of classification results on training data ---")
+            # 4. Model check and anomaly extraction
+            print("\n--- Quick check of classification results on training data ---")
         
-        # Calculate anomaly score and prediction
-        scaled_data_df['anomaly_score'] = anomaly_model.decision_function(X_features)
-        scaled_data_df['anomaly'] = anomaly_model.predict(X_features)
+            # Calculate anomaly score and prediction
+            scaled_data_df['anomaly_score'] = anomaly_model.decision_function(X_features)
+            scaled_data_df['anomaly'] = anomaly_model.predict(X_features)
 
-        # Calculate results
-        num_anomalies = (scaled_data_df['anomaly'] == -1).sum()
-        total_samples = len(scaled_data_df)
+            # Calculate results
+            num_anomalies = (scaled_data_df['anomaly'] == -1).sum()
+            total_samples = len(scaled_data_df)
 
-        print(f"Total data samples (30s)): {total_samples}")
-        print(f"Number of anomalies found: {num_anomalies}")
-        print(f"Anomaly ratio (Model): {num_anomalies/total_samples:.2%}")
-        print(f"Anomaly ratio (Config): {CONTAMINATION_RATE:.2%}")
+            print(f"Total data samples ({freq}): {total_samples}")
+            print(f"Number of anomalies found: {num_anomalies}")
+            print(f"Anomaly ratio (Model): {num_anomalies/total_samples:.2%}")
+            print(f"Anomaly ratio (Config): {CONTAMINATION_RATE:.2%}")
 
-        # 5. SAVE ANOMALY RECORDS TO CSV
-        anomalies_df = scaled_data_df[scaled_data_df['anomaly'] == -1].copy()
+            # 5. SAVE ANOMALY RECORDS TO PARQUET
+            anomalies_df = scaled_data_df[scaled_data_df['anomaly'] == -1].copy()
         
-        if not anomalies_df.empty:
-            # Output path for anomaly records (relative to CSV_DIR)
-            ANOMALY_OUTPUT_PATH = os.path.join(os.path.dirname(INPUT_SCALED_DATA_PATH), f'anomaly_records-{timestamp_str}.csv')
+            if not anomalies_df.empty:
+                # Output path for anomaly records (relative to CSV_DIR)
+                ANOMALY_OUTPUT_PATH = anomaly_output_path(freq)
             
-            anomalies_df.to_csv(ANOMALY_OUTPUT_PATH)
+                anomalies_df.to_parquet(ANOMALY_OUTPUT_PATH)
             
-            print(f"\nSuccessfully saved {len(anomalies_df)} anomaly records to: {ANOMALY_OUTPUT_PATH}")
+                print(f"\nSuccessfully saved {len(anomalies_df)} anomaly records to: {ANOMALY_OUTPUT_PATH}")
             
-            # --- OPTIMIZED DISPLAY ---
-            base_cols = ['avg_session_duration', 'max_session_duration', 'ratio_fatal_to_total', 'anomaly_score']
-            count_cols = [col for col in anomalies_df.columns if col.startswith('count_') and ('error' in col or 'fatal' in col or 'connect' in col)]
+                # --- OPTIMIZED DISPLAY ---
+                base_cols = ['avg_session_duration', 'max_session_duration', 'ratio_fatal_to_total', 'anomaly_score']
+                count_cols = [col for col in anomalies_df.columns if col.startswith('count_') and ('error' in col or 'fatal' in col or 'connect' in col)]
             
-            display_cols = base_cols + count_cols
-            available_cols = [col for col in display_cols if col in anomalies_df.columns]
+                display_cols = base_cols + count_cols
+                available_cols = [col for col in display_cols if col in anomalies_df.columns]
             
-            print("\n5 most severe anomaly records:")
+                print("\n5 most severe anomaly records:")
             
-            # Sort and select top anomalies
-            top_anomalies = anomalies_df.sort_values(by='anomaly_score').head(5)
+                # Sort and select top anomalies
+                top_anomalies = anomalies_df.sort_values(by='anomaly_score').head(5)
             
-            # ⚠️ FIX: Đặt lại index để 'timestamp' trở thành cột, cho phép truy cập nó
-            top_anomalies = top_anomalies.reset_index()
+                # ⚠️ FIX: Đặt lại index để 'timestamp' trở thành cột, cho phép truy cập nó
+                top_anomalies = top_anomalies.reset_index()
             
-            # ⚠️ FIX: Thay thế 'timestamp' bằng 'index' trong list cột nếu index ban đầu không tên
-            final_display_cols = ['timestamp'] + available_cols
+                # ⚠️ FIX: Thay thế 'timestamp' bằng 'index' trong list cột nếu index ban đầu không tên
+                final_display_cols = ['timestamp'] + available_cols
             
-            # In ra console
-            print(top_anomalies[final_display_cols].to_string())
+                # In ra console
+                print(top_anomalies[final_display_cols].to_string())
         
-        print("\nModel training process complete.")
+    print("\nModel training process complete.")
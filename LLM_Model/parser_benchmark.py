@@ -0,0 +1,131 @@
+import argparse
+import glob
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import data_extraction
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOG_EXAMPLE_DIR = os.path.join(BASE_DIR, '..', 'Log_Example')
+
+# The example logs are small: each one is benchmarked as REPEAT copies of itself
+REPEAT = 20
+
+# Every timing is the best of ROUNDS runs (CPU time)
+ROUNDS = 5
+
+# Times the public entry point of the data_extraction.py of the working
+# directory, in a process of its own: argv = log file, rounds
+ENTRY_POINT_SCRIPT = """
+import sys, time
+sys.path.insert(0, '.')
+import data_extraction
+best = None
+for _ in range(int(sys.argv[2])):
+    start = time.process_time()
+    data_extraction.parse_postgresql_log(sys.argv[1])
+    elapsed = time.process_time() - start
+    best = elapsed if best is None else min(best, elapsed)
+print(max(best, 1e-9))
+"""
+
+# ----------------------------------------------------------------------
+# B. BENCHMARKS
+# ----------------------------------------------------------------------
+def export_revision(revision):
+    """Extracts this directory as it was at a git revision (e.g. HEAD~1) into a temporary directory."""
+    archive = subprocess.run(
+        ['git', 'archive', '--format=tar', revision, '.'],
+        cwd=BASE_DIR, check=True, capture_output=True
+    ).stdout
+    directory = tempfile.mkdtemp(prefix='parser-baseline-')
+    with tarfile.open(fileobj=io.BytesIO(archive)) as archive_file:
+        archive_file.extractall(directory)
+    return directory
+
+def entry_point_rate(module_dir, path, n_lines):
+    """
+    Lines per second of parse_postgresql_log(path), the public entry point
+    of the data_extraction.py in module_dir, run in a process of its own
+    (so each revision imports its own modules).
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', ENTRY_POINT_SCRIPT, path, str(ROUNDS)],
+        cwd=module_dir, check=True, capture_output=True, text=True
+    )
+    return n_lines / float(result.stdout.split()[-1])
+
+def best_time(func, *args):
+    """Best CPU time of ROUNDS calls of func(*args)."""
+    best = None
+    for _ in range(ROUNDS):
+        start = time.process_time()
+        func(*args)
+        elapsed = time.process_time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return max(best, 1e-9)
+
+def benchmark_file(path, repeat=REPEAT, baseline_dir=None):
+    """
+    Returns {stage: lines per second} of the current parser on one log file
+    (repeat copies of it): splitting lines with LOG_PATTERN, the full parse
+    into the event table, formatting the event timestamps back to log text
+    (the menu views) and the public entry point parse_postgresql_log().
+    With baseline_dir, 'baseline' is the entry point of that revision.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.readlines() * repeat
+    log_pattern = data_extraction.LOG_PATTERN
+    events_df = data_extraction.parse_log_lines(lines)
+    result = {
+        'lines': len(lines),
+        'split': len(lines) / best_time(lambda: [log_pattern.match(line.strip()) for line in lines]),
+        'parse': len(lines) / best_time(data_extraction.parse_log_lines, lines),
+        'format': len(lines) / best_time(data_extraction.format_log_timestamps, events_df['timestamp']),
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        repeated_path = os.path.join(tmp_dir, os.path.basename(path))
+        with open(repeated_path, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+        result['entry'] = entry_point_rate(BASE_DIR, repeated_path, len(lines))
+        if baseline_dir:
+            result['baseline'] = entry_point_rate(baseline_dir, repeated_path, len(lines))
+    return result
+
+# ----------------------------------------------------------------------
+# C. MAIN EXECUTION LOGIC
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure log parsing throughput (lines/sec).')
+    parser.add_argument('log_files', nargs='*', help='Log files (default: Log_Example/*.log)')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='Copies of each file to parse')
+    parser.add_argument('--baseline', default=None,
+                        help='Also time parse_postgresql_log() of this git revision (e.g. HEAD~1)')
+    args = parser.parse_args()
+
+    baseline_dir = export_revision(args.baseline) if args.baseline else None
+
+    log_files = args.log_files or sorted(glob.glob(os.path.join(LOG_EXAMPLE_DIR, '*.log')))
+    header = f"{'file':<26}{'lines':>8}{'split':>13}{'parse':>13}{'ts format':>13}{'entry':>13}"
+    print(header + (f"{args.baseline[:12]:>13}" if args.baseline else ''))
+    try:
+        for log_file in log_files:
+            result = benchmark_file(log_file, args.repeat, baseline_dir)
+            print(f"{os.path.basename(log_file):<26}{result['lines']:>8}{result['split']:>13,.0f}{result['parse']:>13,.0f}"
+                  f"{result['format']:>13,.0f}{result['entry']:>13,.0f}"
+                  + (f"{result['baseline']:>13,.0f}" if baseline_dir else ''))
+    finally:
+        if baseline_dir:
+            shutil.rmtree(baseline_dir, ignore_errors=True)
+    print("\nlines/sec (ts format: lines whose events are formatted per second; "
+          "entry: parse_postgresql_log() of the file, run in its own process)")
@@ -1,15 +1,28 @@
+import numpy as np
 import pandas as pd
+import argparse
 import os
+import sys
 import joblib
 from datetime import datetime
+from pandas.tseries.frequencies import to_offset
 from sklearn.preprocessing import StandardScaler
 
+from event_store import (
+    EVENT_STORE_DIR, last_row_group, read_checkpoint, read_events, read_events_in_windows, read_late_events,
+    read_query_templates, write_checkpoint
+)
+from feature_schema import FeatureSchema, count_feature_name, latest_schema, load_schema, schema_path
+
 # ----------------------------------------------------------------------
 # A. CONFIGURATION AND PATH SETUP
 # ----------------------------------------------------------------------
-# Resample frequency (must match across all modules)
+# Resample frequency of the main model (imported by every module that needs it)
 RESAMPLE_FREQUENCY = '30s'
 
+# Window sizes that can be built together (--resolutions); each gets its own scaler and model
+FEATURE_RESOLUTIONS = ['10s', '30s', '5min', '1h']
+
 base_dir = os.path.dirname(os.path.abspath(__file__))
 timestamp_str = datetime.now().strftime("%Y%m%d")
 
@@ -18,11 +31,26 @@ CSV_DIR = os.path.join(base_dir, '..', 'CSV_FILE', 'OUTPUT_CSVFILE')
 MODEL_DIR = os.path.join(base_dir, 'trained_model') 
 
 # Define input/output paths (Must match the directory structure used in main.py)
-INPUT_EVENTS_FILE = f'postgresql_events-{timestamp_str}.csv'
-INPUT_EVENTS_PATH = os.path.join(CSV_DIR, 'LOG_EVENT', INPUT_EVENTS_FILE)
+INPUT_EVENTS_PATH = EVENT_STORE_DIR
+
+# Only these event columns are needed to build the time series features
+FEATURE_EVENT_COLUMNS = ['timestamp', 'event_type', 'session_duration_sec']
+
+def resolution_tag(freq):
+    """File name tag of a window size: none for RESAMPLE_FREQUENCY, e.g. '-5min' otherwise."""
+    return '' if freq == RESAMPLE_FREQUENCY else f'-{freq}'
+
+def scaled_data_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(CSV_DIR, 'TRAIN_AI', f'processed_scaled_features{resolution_tag(freq)}-{timestamp_str}.parquet')
 
-OUTPUT_SCALED_DATA_PATH = os.path.join(CSV_DIR, 'TRAIN_AI', f'processed_scaled_features-{timestamp_str}.csv')
-OUTPUT_SCALER_PATH = os.path.join(MODEL_DIR, f'scaler-{timestamp_str}.pkl')
+def scaler_path(freq=RESAMPLE_FREQUENCY):
+    return os.path.join(MODEL_DIR, f'scaler{resolution_tag(freq)}-{timestamp_str}.pkl')
+
+OUTPUT_SCALED_DATA_PATH = scaled_data_path()
+OUTPUT_SCALER_PATH = scaler_path()
+
+# Last processed window and the model version an incremental run builds on
+FEATURE_CHECKPOINT_PATH = os.path.join(CSV_DIR, 'TRAIN_AI', '_feature_checkpoint.json')
 
 # Ensure Model and Train directories exist
 if not os.path.exists(MODEL_DIR): os.makedirs(MODEL_DIR)
@@ -31,18 +59,17 @@ if not os.path.exists(os.path.join(CSV_DIR, 'TRAIN_AI')): os.makedirs(os.path.jo
 # ----------------------------------------------------------------------
 # B. DATA LOADING AND PREPARATION
 # ----------------------------------------------------------------------
-def load_and_prepare_data(filepath):
-    """Loads event data and sets the timestamp column as the index."""
+def load_and_prepare_data(filepath, columns=FEATURE_EVENT_COLUMNS, start=None):
+    """Loads event data (from start on, if given) and sets the timestamp column as the index."""
     if not os.path.exists(filepath):
-        print(f"ERROR: Event file not found at: {filepath}")
+        print(f"ERROR: Event store not found at: {filepath}")
         return None
         
     print(f"Loading data from: {filepath}")
     
     try:
-        # 1. Read CSV and Parse Dates (essential for time series)
-        # Assuming 01_data_extraction.py outputs timestamp in a parsable format
-        df = pd.read_csv(filepath, parse_dates=['timestamp'])
+        # 1. Read the typed event columns (timestamps are stored natively)
+        df = read_events(columns=columns, start=start, store_dir=filepath)
         
         # 2. Set Index
         df = df.set_index('timestamp')
@@ -50,59 +77,118 @@ def load_and_prepare_data(filepath):
         print(f"Loading successful. Data shape: {df.shape}")
         return df
     except Exception as e:
-        print(f"ERROR reading or preparing CSV: {e}")
+        print(f"ERROR reading or preparing event data: {e}")
         return None
 
 # ----------------------------------------------------------------------
 # C. TIME SERIES FEATURE ENGINEERING
 # ----------------------------------------------------------------------
-def create_time_series_features(df, freq=RESAMPLE_FREQUENCY):
+def create_multi_resolution_features(df, freqs, template_first_seen=None):
     """
-    Creates time series features by resampling log data into aggregate 
-    windows (e.g., 5-minute windows).
+    Creates the time series features of several window sizes in one pass
+    over the events: events are grouped once into the finest window that
+    divides every size, and these fine aggregates are rolled up into each
+    coarser window (sums, counts and max add up exactly).
+    template_first_seen (first_seen of the store's query templates) adds
+    the number of query templates seen for the first time per window.
     """
     # Drop non-feature ID columns that were retained from 01_data_extraction.py
-    features_df = df.drop(columns=['pid', 'user', 'database', 'query_command', 'query_text'], errors='ignore')
+    features_df = df.drop(columns=['pid', 'user', 'database', 'query_command', 'query_id'], errors='ignore')
+    fine_freq = to_offset(pd.Timedelta(np.gcd.reduce([pd.Timedelta(freq).value for freq in freqs])))
 
-    # 1. Create Count Features
+    # 1. Create Count Features (per fine window)
     # Group by event_type to count different log levels/actions
     count_features = features_df['event_type'].groupby(level=0).value_counts().unstack(fill_value=0)
     
     # Rename columns (e.g., FATAL -> count_fatal)
-    count_features.columns = [f'count_{col.lower().replace(" ", "_")}' for col in count_features.columns]
+    count_features.columns = [count_feature_name(col) for col in count_features.columns]
+    count_features = count_features.resample(fine_freq).sum()
     
     # Add total events (for ratio calculation)
     count_features['count_total_events'] = count_features.sum(axis=1)
 
-    # 2. Create Time Features
-    # Aggregate statistics on session_duration_sec
-    time_features = features_df['session_duration_sec'].resample(freq).agg({
-        'avg_session_duration': 'mean',
-        'max_session_duration': 'max',
-        'total_session_time': 'sum'
-    }).fillna(0)
-
-    # 3. Combine Features
-    # Resample and combine count features (summing up counts within the window)
-    final_features_df = count_features.resample(freq).sum().fillna(0)
-    final_features_df = final_features_df.join(time_features)
-
-    # 4. Create Ratio Features
-    # Ratio of fatal errors to total events
-    final_features_df['ratio_fatal_to_total'] = (
-        final_features_df.get('count_fatal', 0) / final_features_df['count_total_events']
-    ).fillna(0)
-    
-    # Drop the auxiliary 'count_total_events' column
-    final_features_df = final_features_df.drop(columns=['count_total_events'], errors='ignore')
+    # New query templates per fine window (first_seen outside the loaded events is dropped)
+    if template_first_seen is not None:
+        first_seen = pd.DatetimeIndex(template_first_seen).tz_convert(count_features.index.tz)
+        count_features['new_query_templates'] = (
+            pd.Series(1, index=first_seen).resample(fine_freq).sum()
+            .reindex(count_features.index, fill_value=0).astype('int64')
+        )
+
+    # 2. Aggregate session_duration_sec per fine window
+    duration = features_df['session_duration_sec'].resample(fine_freq).agg(['sum', 'max', 'count'])
+
+    features_by_freq = {}
+    for freq in freqs:
+        # 3. Roll the fine windows up into this window size
+        final_features_df = count_features.resample(freq).sum()
+        window_duration = duration.resample(freq).agg({'sum': 'sum', 'max': 'max', 'count': 'sum'})
 
-    print(f"Feature Engineering complete. Number of features: {len(final_features_df.columns)}")
-    return final_features_df
+        # 4. Create Time Features
+        final_features_df['avg_session_duration'] = (window_duration['sum'] / window_duration['count']).fillna(0)
+        final_features_df['max_session_duration'] = window_duration['max'].fillna(0)
+        final_features_df['total_session_time'] = window_duration['sum'].fillna(0)
+
+        # 5. Create Ratio Features
+        # Ratio of fatal errors to total events
+        final_features_df['ratio_fatal_to_total'] = (
+            final_features_df.get('count_fatal', 0) / final_features_df['count_total_events']
+        ).fillna(0)
+        
+        # Drop the auxiliary 'count_total_events' column
+        final_features_df = final_features_df.drop(columns=['count_total_events'], errors='ignore')
+        if 'new_query_templates' in final_features_df.columns:
+            final_features_df['new_query_templates'] = final_features_df.pop('new_query_templates')
+
+        print(f"Feature Engineering complete ({freq} windows). Number of features: {len(final_features_df.columns)}")
+        features_by_freq[freq] = final_features_df
+    return features_by_freq
+
+def create_time_series_features(df, freq=RESAMPLE_FREQUENCY, template_first_seen=None):
+    """
+    Creates time series features by resampling log data into aggregate 
+    windows (e.g., 30-second windows).
+    """
+    return create_multi_resolution_features(df, [freq], template_first_seen)[freq]
+
+def create_entity_features(df, entity_col, freq=RESAMPLE_FREQUENCY):
+    """
+    Creates the time series features of create_time_series_features() per
+    entity (a user or a database) in one grouped pass over the events.
+
+    The result is the compact form of an entity x window x feature cube: a
+    DataFrame indexed by (entity, window) with one row per window in which
+    the entity has events, sorted by entity. Idle windows of an entity are
+    not stored, so its size follows the events, not entities x windows.
+    Events without a known entity ('[unknown]', e.g. before authentication)
+    are left to the global model.
+    """
+    entity = df[entity_col].astype(str)
+    known = entity.ne('[unknown]') & df[entity_col].notna().to_numpy()
+    keys = [entity[known].rename(entity_col), df.index[known].floor(freq).rename(df.index.name or 'timestamp')]
+
+    # 1. Count Features per (entity, window), e.g. FATAL -> count_fatal
+    count_features = df.loc[known, 'event_type'].astype(str).groupby(keys).value_counts().unstack(fill_value=0)
+    count_features.columns = [count_feature_name(col) for col in count_features.columns]
+    count_total_events = count_features.sum(axis=1)
+
+    # 2. Time Features per (entity, window)
+    duration = df.loc[known, 'session_duration_sec'].groupby(keys).agg(['sum', 'max', 'count'])
+    entity_features_df = count_features
+    entity_features_df['avg_session_duration'] = (duration['sum'] / duration['count']).fillna(0)
+    entity_features_df['max_session_duration'] = duration['max'].fillna(0)
+    entity_features_df['total_session_time'] = duration['sum'].fillna(0)
+
+    # 3. Ratio Features
+    entity_features_df['ratio_fatal_to_total'] = (
+        entity_features_df.get('count_fatal', 0) / count_total_events
+    ).fillna(0)
+    return entity_features_df.sort_index()
 
 # ----------------------------------------------------------------------
 # D. DATA SCALING
 # ----------------------------------------------------------------------
-def scale_features(df):
+def scale_features(df, output_path=OUTPUT_SCALER_PATH):
     """Scales features using StandardScaler and saves the fitted scaler."""
     scaler = StandardScaler()
     
@@ -113,34 +199,223 @@ def scale_features(df):
     scaled_df = pd.DataFrame(scaled_data, index=df.index, columns=df.columns)
     
     # Save the scaler for use in real-time detection
-    joblib.dump(scaler, OUTPUT_SCALER_PATH)
-    print(f"Standard Scaler saved to: {OUTPUT_SCALER_PATH}")
+    joblib.dump(scaler, output_path)
+    print(f"Standard Scaler saved to: {output_path}")
     
     return scaled_df
 
+def extend_scaler(scaler, columns):
+    """
+    Adds the columns unknown to a fitted scaler after its current ones
+    (existing column order never changes). Every window seen so far counts
+    as 0 for them, so their running mean and variance start at 0.
+    """
+    new_columns = [col for col in columns if col not in set(scaler.feature_names_in_)]
+    if not new_columns:
+        return scaler
+    n_new = len(new_columns)
+    scaler.feature_names_in_ = np.concatenate([scaler.feature_names_in_, np.array(new_columns, dtype=object)])
+    scaler.n_features_in_ += n_new
+    scaler.mean_ = np.concatenate([scaler.mean_, np.zeros(n_new)])
+    scaler.var_ = np.concatenate([scaler.var_, np.zeros(n_new)])
+    scaler.scale_ = np.concatenate([scaler.scale_, np.ones(n_new)])
+    if np.ndim(scaler.n_samples_seen_):
+        scaler.n_samples_seen_ = np.concatenate([scaler.n_samples_seen_, np.full(n_new, scaler.n_samples_seen_.max())])
+    print(f"New features added to the scaler: {new_columns}")
+    return scaler
+
+def unfit_scaler(scaler, df):
+    """
+    Takes windows counted by an earlier partial_fit() back out of the
+    running mean and variance (df holds them as they were counted), so
+    they can be fitted again once rebuilt.
+    """
+    if not len(df):
+        return scaler
+    df = df.reindex(columns=scaler.feature_names_in_.tolist(), fill_value=0)
+    n_seen, n_removed = scaler.n_samples_seen_, len(df)
+    n_left = n_seen - n_removed
+    removed_mean = df.to_numpy(dtype=float).mean(axis=0)
+    removed_var = df.to_numpy(dtype=float).var(axis=0)
+
+    # Inverse of the pairwise mean/variance update used by partial_fit()
+    mean = (scaler.mean_ * n_seen - removed_mean * n_removed) / n_left
+    sum_of_squares = (scaler.var_ * n_seen - removed_var * n_removed
+                      - (mean - removed_mean) ** 2 * n_left * n_removed / n_seen)
+    scaler.mean_ = mean
+    scaler.var_ = np.maximum(sum_of_squares / n_left, 0)
+    scaler.n_samples_seen_ = n_left
+    return scaler
+
+def update_scaler(df, scaler, counted_df=None):
+    """
+    Incremental version of scale_features(): updates the running mean and
+    variance of the previous scaler with partial_fit() on the new windows
+    only, then scales them. New count_* features are appended to the
+    scaler's columns. Windows of df that the previous scaler already
+    counted (counted_df, as counted then) are taken out before refitting.
+    """
+    scaler = extend_scaler(scaler, df.columns)
+    features = scaler.feature_names_in_.tolist()
+    df = df.reindex(columns=features, fill_value=0)
+    if counted_df is not None:
+        scaler = unfit_scaler(scaler, counted_df)
+
+    scaler.partial_fit(df)
+    scaled_df = pd.DataFrame(scaler.transform(df), index=df.index, columns=features)
+
+    joblib.dump(scaler, OUTPUT_SCALER_PATH)
+    print(f"Standard Scaler updated ({scaler.n_samples_seen_} windows seen) and saved to: {OUTPUT_SCALER_PATH}")
+    return scaled_df
+
+def apply_feature_schema(df, base_schema, freq=RESAMPLE_FREQUENCY):
+    """
+    Extends the previous feature schema with the new columns of df, orders
+    df by it and saves it for this version and window size (None: start a
+    new schema). Every window size shares the same columns.
+    """
+    if base_schema is None:
+        schema = FeatureSchema(df.columns, freq=freq)
+    else:
+        schema = base_schema.extend(df.columns)
+        schema = FeatureSchema(schema.columns, schema.version, freq)
+    output_path = schema_path(MODEL_DIR, timestamp_str, resolution_tag(freq))
+    schema.save(output_path)
+    print(f"Feature schema v{schema.version} ({len(schema)} features) saved to: {output_path}")
+    return schema.align(df)
+
 # ----------------------------------------------------------------------
-# E. MAIN EXECUTION LOGIC
+# E. INCREMENTAL RUNS
+# ----------------------------------------------------------------------
+def incremental_start(checkpoint):
+    """
+    Returns (base version, first window, last row group of the store seen
+    by the base run) of an incremental run. A rerun on the same day
+    repeats that day's run; otherwise the run continues after the last
+    processed window.
+    """
+    if checkpoint.get('version') == timestamp_str:
+        return checkpoint.get('base_version'), checkpoint.get('start'), checkpoint.get('base_row_group', 0)
+    return checkpoint.get('version'), checkpoint.get('next_window'), checkpoint.get('row_group', 0)
+
+def find_late_windows(start, base_row_group, freq=RESAMPLE_FREQUENCY):
+    """
+    Windows before start that got events after they were processed (by
+    the run that saw the store up to base_row_group).
+    """
+    late_df = read_late_events(start, base_row_group, columns=['timestamp'], store_dir=INPUT_EVENTS_PATH)
+    if late_df.empty:
+        return pd.DatetimeIndex([])
+    windows = pd.DatetimeIndex(late_df['timestamp'].dt.floor(freq).unique()).sort_values()
+    print(f"{len(late_df)} events arrived after their window was processed: "
+          f"{len(windows)} windows are rebuilt and processed again")
+    return windows
+
+def read_window_events(windows, freq=RESAMPLE_FREQUENCY, through_row_group=None):
+    """Loads the feature events of the given windows (written up to through_row_group, if given)."""
+    return read_events_in_windows(
+        [(window, window + pd.Timedelta(freq)) for window in windows], FEATURE_EVENT_COLUMNS, INPUT_EVENTS_PATH,
+        through_row_group
+    ).set_index('timestamp')
+
+def add_late_windows(df, windows, freq=RESAMPLE_FREQUENCY):
+    """Merges all the events of the late windows, so every such window is rebuilt with the new ones."""
+    if not len(windows):
+        return df
+    return pd.concat([read_window_events(windows, freq), df]).sort_index(kind='stable')
+
+def counted_window_features(windows, base_row_group, template_first_seen=None, freq=RESAMPLE_FREQUENCY):
+    """Features of the late windows as the earlier run counted them: from the row groups it saw."""
+    events_df = read_window_events(windows, freq, through_row_group=base_row_group)
+    if events_df.empty:
+        return pd.DataFrame(index=windows)
+    features_df = create_time_series_features(events_df, freq, template_first_seen)
+    return features_df.reindex(windows, fill_value=0)
+
+def pad_windows(df, start, late_windows=(), freq=RESAMPLE_FREQUENCY):
+    """
+    Adds the empty windows between start and the first event, like a full
+    run has. Before start only the late windows are kept: the windows
+    between them were processed already.
+    """
+    windows = pd.date_range(pd.Timestamp(start), df.index.max(), freq=freq, name=df.index.name)
+    return df.reindex(windows.union(late_windows), fill_value=0)
+
+def save_feature_checkpoint(base_version, start, base_row_group, row_group, features_df, freq=RESAMPLE_FREQUENCY):
+    """Records the windows processed today, the store row groups they saw and the version they build on."""
+    write_checkpoint({
+        'version': timestamp_str,
+        'base_version': base_version,
+        'start': start,
+        'base_row_group': base_row_group,
+        'row_group': row_group,
+        'next_window': (features_df.index.max() + pd.Timedelta(freq)).isoformat()
+    }, FEATURE_CHECKPOINT_PATH)
+
+# ----------------------------------------------------------------------
+# F. MAIN EXECUTION LOGIC
 # ----------------------------------------------------------------------
 if __name__ == "__main__":
-    
-    # 1. Load and prepare data
-    events_df = load_and_prepare_data(INPUT_EVENTS_PATH)
+    parser = argparse.ArgumentParser(description='Build and scale the time series features.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Process only the windows since the last run and update the previous scaler')
+    parser.add_argument('--resolutions', nargs='+', default=[RESAMPLE_FREQUENCY],
+                        help=f'Window sizes to build in one pass, each with its own scaler (e.g. {" ".join(FEATURE_RESOLUTIONS)})')
+    args = parser.parse_args()
+
+    resolutions = list(dict.fromkeys(args.resolutions))
+    if args.incremental and resolutions != [RESAMPLE_FREQUENCY]:
+        parser.error(f'--incremental only supports the {RESAMPLE_FREQUENCY} windows')
+
+    base_version, start, base_row_group = None, None, 0
+    if args.incremental:
+        base_version, start, base_row_group = incremental_start(read_checkpoint(FEATURE_CHECKPOINT_PATH))
+        base_scaler_path = os.path.join(MODEL_DIR, f'scaler-{base_version}.pkl')
+        if base_version is None or not os.path.exists(base_scaler_path):
+            print("No previous scaler to update. Run a full preprocessing first.")
+            sys.exit(1)
+        print(f"Incremental run on version {base_version}, from window {start}")
+
+    # 1. Load and prepare data (row groups written later are for the next run)
+    row_group = last_row_group(INPUT_EVENTS_PATH) if os.path.exists(INPUT_EVENTS_PATH) else 0
+    events_df = load_and_prepare_data(INPUT_EVENTS_PATH, start=start)
+    late_windows = pd.DatetimeIndex([])
+    if args.incremental and events_df is not None:
+        late_windows = find_late_windows(start, base_row_group)
+        events_df = add_late_windows(events_df, late_windows)
     
     if events_df is None or events_df.empty:
         print("Invalid or empty event data. Stopping preprocessing.")
     else:
-        # 2. Feature Engineering
-        features_df = create_time_series_features(events_df)
-        
-        # Check if any features were created
-        if features_df.empty:
-            print("No features were created after resampling. Stopping preprocessing.")
-        else:
-            # 3. Scale data and save scaler
-            scaled_features_df = scale_features(features_df)
+        # 2. Feature Engineering (every window size from one pass over the events)
+        template_first_seen = read_query_templates(store_dir=INPUT_EVENTS_PATH)['first_seen']
+        features_by_freq = create_multi_resolution_features(events_df, resolutions, template_first_seen)
+        base_schema = latest_schema(MODEL_DIR)
+
+        for freq, features_df in features_by_freq.items():
+            if start is not None and not features_df.empty:
+                features_df = pad_windows(features_df, start, late_windows)
+            
+            # Check if any features were created
+            if features_df.empty:
+                print(f"No features were created after resampling ({freq}). Skipping this window size.")
+                continue
+
+            # 3. Fix the column order with the feature schema, scale data and save scaler
+            if args.incremental:
+                base_scaler = joblib.load(base_scaler_path)
+                features_df = apply_feature_schema(features_df, load_schema(MODEL_DIR, base_version, base_scaler))
+                counted_df = counted_window_features(late_windows, base_row_group, template_first_seen)
+                scaled_features_df = update_scaler(features_df, base_scaler, counted_df)
+            else:
+                features_df = apply_feature_schema(features_df, base_schema, freq)
+                scaled_features_df = scale_features(features_df, scaler_path(freq))
             
             # 4. Save scaled data for model training
-            scaled_features_df.to_csv(OUTPUT_SCALED_DATA_PATH)
-            print(f"Scaled data saved to: {OUTPUT_SCALED_DATA_PATH}")
+            output_path = scaled_data_path(freq)
+            scaled_features_df.to_parquet(output_path)
+            print(f"Scaled data saved to: {output_path}")
+            if freq == RESAMPLE_FREQUENCY:
+                save_feature_checkpoint(base_version, start, base_row_group, row_group, features_df)
             
-            print("\nPreprocessing complete. Ready for 03_model_training.py")
+        print("\nPreprocessing complete. Ready for 03_model_training.py")
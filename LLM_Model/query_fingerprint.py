@@ -0,0 +1,125 @@
+import hashlib
+import re
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# Distinct raw query texts whose template id is cached (most recently used kept)
+QUERY_CACHE_SIZE = 65536
+
+# One alternative per SQL token kind; literals and comments are replaced, the rest is kept
+QUERY_TOKEN_PATTERN = re.compile(r"""
+      (?P<dollar>\$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$)   # $$...$$, $body$...$body$
+    | (?P<string>(?:[EeBbXxNnUu]&?)?'(?:[^']|'')*'?)          # 'text', E'text', x'0f'
+    | (?P<identifier>"(?:[^"]|"")*"?)                          # "Quoted Name"
+    | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+    | (?P<param>\$\d+)                                         # bind parameter, kept
+    | (?P<number>(?<![\w.])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    | (?P<word>[^\W\d][\w$]*)                                 # keyword or name, lowercased
+    | (?P<operator>[-+*/<>=~!@#%^&|`?]+)                       # spaced: 'a=1' -> 'a = ?'
+    | (?P<space>\s+)
+""", re.VERBOSE | re.DOTALL)
+
+# (?, ?, ...) lists after IN and repeated VALUES tuples collapse to one element
+IN_LIST_PATTERN = re.compile(r'\bin ?\((?:\?|\$\d+)(?:, (?:\?|\$\d+))*\)')
+ARRAY_LIST_PATTERN = re.compile(r'\[\?(?:, \?)*\]')
+VALUES_LIST_PATTERN = re.compile(r'(\((?:\?|\$\d+)(?:, (?:\?|\$\d+))*\))(?:, \1)+')
+
+# Spacing inside parentheses and around commas is normalized ('f( a,b )' -> 'f(a, b)')
+COMMA_SPACE_PATTERN = re.compile(r' ?, ?')
+PAREN_SPACE_PATTERN = re.compile(r'(?<=\() | (?=\))')
+
+# ----------------------------------------------------------------------
+# B. NORMALIZATION
+# ----------------------------------------------------------------------
+def _normalize_token(match):
+    kind = match.lastgroup
+    if kind in ('string', 'number', 'dollar'):
+        return '?'
+    if kind in ('space', 'comment'):
+        return ' '
+    if kind == 'word':
+        return match.group().lower()
+    if kind == 'operator':
+        return f' {match.group()} '
+    return match.group()
+
+def normalize_query(query):
+    """
+    Returns the template of a SQL statement: literals (strings, numbers,
+    dollar-quoted bodies) become ?, comments are dropped, whitespace and
+    unquoted words are normalized and IN (...) / VALUES (...), (...) lists
+    collapse to a single element. Quoted identifiers and $n parameters
+    are kept.
+    """
+    template = QUERY_TOKEN_PATTERN.sub(_normalize_token, query)
+    template = ' '.join(template.split())
+    template = PAREN_SPACE_PATTERN.sub('', COMMA_SPACE_PATTERN.sub(', ', template)).rstrip('; ')
+    template = IN_LIST_PATTERN.sub('in (?)', template)
+    template = ARRAY_LIST_PATTERN.sub('[?]', template)
+    return VALUES_LIST_PATTERN.sub(r'\1', template)
+
+def fingerprint(template):
+    """Stable 63-bit id of a template (the same in every process and run)."""
+    return int.from_bytes(hashlib.blake2b(template.encode('utf-8'), digest_size=8).digest(), 'big') >> 1
+
+# ----------------------------------------------------------------------
+# C. TEMPLATE TABLE
+# ----------------------------------------------------------------------
+class QueryTemplates:
+    """
+    Template table of the queries seen by a process: id -> template, each
+    template stored once however many events use it.
+
+    id_of() normalizes a raw query only the first time it is seen: an LRU
+    cache of cache_size raw texts maps repeated queries straight to their
+    template id. Ids are fingerprints of the template, so parser workers
+    and later runs give the same id without sharing the table.
+    """
+
+    def __init__(self, cache_size=QUERY_CACHE_SIZE):
+        self.templates = {}
+        self._cached_id_of = lru_cache(maxsize=cache_size)(self._id_of)
+
+    def __len__(self):
+        return len(self.templates)
+
+    def id_of(self, query):
+        """Template id of a raw query (None if there is no query)."""
+        if not isinstance(query, str) or not query:
+            return None
+        return self._cached_id_of(query)
+
+    def template_of(self, query):
+        """Shared template string of a raw query (None if there is no query)."""
+        query_id = self.id_of(query)
+        return None if query_id is None else self.templates[query_id]
+
+    def _id_of(self, query):
+        template = normalize_query(query)
+        query_id = fingerprint(template)
+        self.templates.setdefault(query_id, template)
+        return query_id
+
+    def ids_of(self, queries):
+        """Template ids of a Series of raw queries (nullable Int64), one lookup per distinct text."""
+        codes, uniques = pd.factorize(queries.where(queries != ''))
+        unique_ids = np.array([self.id_of(query) for query in uniques], dtype='int64')
+        missing = codes < 0
+        ids = pd.arrays.IntegerArray(np.where(missing, 0, unique_ids[codes] if len(uniques) else 0), missing)
+        return pd.Series(ids, index=queries.index, name='query_id')
+
+    def subset(self, query_ids):
+        """{id: template} of the given ids (e.g. the ids of one event batch)."""
+        return {int(query_id): self.templates[int(query_id)] for query_id in query_ids}
+
+    def update(self, templates):
+        """Adds {id: template} entries built by another process."""
+        for query_id, template in templates.items():
+            self.templates.setdefault(query_id, template)
+
+# Template table of this process (data_extraction, the menu)
+QUERY_TEMPLATES = QueryTemplates()
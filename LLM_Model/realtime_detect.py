@@ -1,102 +1,155 @@
 # A. IMPORTS
+import argparse
+import glob
 import os
+import queue
 import sys
+import threading
 import time
 import pandas as pd
-from datetime import datetime
-import joblib
 
 # Add parser directory to sys.path
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
-from data_extraction import parse_postgresql_log  # reuse the parser function
+from data_extraction import RECORD_LATENESS, RecordAssembler, iter_event_batches, to_ml_events  # reuse the parser functions
+from entity_models import ENTITY_COLUMNS, latest_entity_models
+from event_store import read_query_templates
+from feature_engine import StreamingFeatureEngine
+from log_tailer import LogTailer
+from model_registry import MODEL_DIR, get_registry
+from scoring_service import ScoringService
 
 # B. CONFIGURATION
-timestamp_str = datetime.now().strftime('%Y%m%d')
-MODEL_DIR = os.path.join(BASE_DIR, 'trained_model')
 LOG_FILE_PATH = os.path.join(BASE_DIR, '..', 'Log_Example', 'postgresql-official.log')
 
-# File paths
-SCALER_PATH = os.path.join(MODEL_DIR, f'scaler-{timestamp_str}.pkl')
-MODEL_PATH = os.path.join(MODEL_DIR, f'isolation_forest_model-{timestamp_str}.pkl')
-
-# Monitoring interval
+# Maximum wait for new log lines (returns earlier as soon as the log grows)
 POLL_INTERVAL = 5  # seconds
 
+# Log files picked up when a directory is given as a source
+LOG_FILE_GLOB = '*.log'
+
 # C. LOAD MODEL & SCALER
-try:
-    scaler = joblib.load(SCALER_PATH)
-    model = joblib.load(MODEL_PATH)
-    EXPECTED_FEATURES = scaler.feature_names_in_.tolist()
-    print("Model and scaler loaded successfully.")
-except Exception as e:
-    print(f"Error loading model or scaler: {e}")
+# Latest compatible version of MODEL_DIR, swapped in when a retrained one appears
+registry = get_registry()
+if registry.current() is None:
+    print(f"Error loading model or scaler: no compatible scaler/model pair in {MODEL_DIR}")
     sys.exit(1)
 
-# D. MONITORING LOOP
-def monitor_log():
-    print("Starting real-time log monitoring. Press Ctrl + C to stop.")
-    last_position = 0
+# Query templates already in the event store are not new to the model
+KNOWN_QUERY_IDS = frozenset(read_query_templates()['query_id'])
 
-    try:
-        while True:
-            with open(LOG_FILE_PATH, 'r', encoding='utf-8') as f:
-                f.seek(last_position)
-                new_lines = f.readlines()
-                last_position = f.tell()
+# Per-user / per-database models of the realtime window size (entity_models.py), if trained
+ENTITY_MODELS = [models for models in map(latest_entity_models, ENTITY_COLUMNS) if models is not None]
 
+# D. MONITORING LOOP
+def report_anomalies(scored_windows):
+    """Prints the events of the anomalous windows of a scored micro-batch."""
+    for scored in scored_windows:
+        if scored.is_anomaly:
+            print(f"\nAnomaly detected in {scored.source}, window {scored.window} | Score: {scored.score:.4f}")
+            if scored.events:
+                print(pd.DataFrame(scored.events)[['pid', 'user', 'database', 'query_command']].to_string(index=False))
+
+def report_entity_anomalies(scored_windows):
+    """Scores the user/database windows of a scored micro-batch with the per-entity models."""
+    events_by_source = {}
+    for scored in scored_windows:
+        events_by_source.setdefault(scored.source, []).extend(scored.events or [])
+    for source, events in events_by_source.items():
+        if not events:
+            continue
+        events_df = pd.DataFrame(events).set_index('timestamp')
+        for models in ENTITY_MODELS:
+            for (entity, window), score in models.detect(events_df).items():
+                print(f"\nAnomalous {models.entity_col} in {source}: {entity}, window {window} | Score: {score:.4f}")
+
+def report(scored_windows):
+    report_anomalies(scored_windows)
+    report_entity_anomalies(scored_windows)
+
+def resolve_sources(paths):
+    """Expands log directories to the LOG_FILE_GLOB files they contain."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            sources += sorted(glob.glob(os.path.join(path, LOG_FILE_GLOB)))
+        else:
+            sources.append(path)
+    return [os.path.abspath(source) for source in dict.fromkeys(sources)]
+
+def watch_source(log_path, closed_queue, stop_event):
+    """
+    Tails one log in its own thread with its own window state, and queues
+    every closed feature window as (log path, closed windows).
+    """
+    tailer = LogTailer(log_path)
+    # Same RESAMPLE_FREQUENCY windows as training, updated event by event
+    feature_engine = StreamingFeatureEngine(keep_events=True, known_query_ids=KNOWN_QUERY_IDS)
+    # One assembler for the whole log: a record's DETAIL/STATEMENT lines may come in a later read
+    assembler = RecordAssembler()
+    last_line_time = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            new_lines = tailer.read_lines()
             if new_lines:
-                temp_log_path = os.path.join(BASE_DIR, 'temp_log_chunk.log')
-                with open(temp_log_path, 'w', encoding='utf-8') as temp_f:
-                    temp_f.writelines(new_lines)
-
-                parsed_df = parse_postgresql_log(temp_log_path)
-
-                if not parsed_df.empty:
-                    parsed_df = parsed_df.set_index('timestamp')
-                    features_df = parsed_df.drop(columns=['pid', 'user', 'database', 'query_command', 'query_text'], errors='ignore')
-
-                    count_features = features_df['event_type'].value_counts().to_frame().T
-                    count_features.columns = [f'count_{col.lower().replace(" ", "_")}' for col in count_features.columns]
-                    count_features['count_total_events'] = count_features.sum(axis=1)
-
-                    count_features['ratio_fatal_to_total'] = (
-                        count_features.get('count_fatal', 0) / count_features['count_total_events']
-                    ).fillna(0)
-
-                    if 'session_duration_sec' in features_df.columns:
-                        count_features['avg_session_duration'] = features_df['session_duration_sec'].mean()
-                        count_features['max_session_duration'] = features_df['session_duration_sec'].max()
-                        count_features['total_session_time'] = features_df['session_duration_sec'].sum()
-                    else:
-                        count_features['avg_session_duration'] = 0.0
-                        count_features['max_session_duration'] = 0.0
-                        count_features['total_session_time'] = 0.0
-
-                    # Add missing expected features
-                    for col in EXPECTED_FEATURES:
-                        if col not in count_features.columns:
-                            count_features[col] = 0.0
-
-                    # Ensure correct column order
-                    count_features = count_features[EXPECTED_FEATURES]
-
-                    # Scale and predict
-                    scaled = scaler.transform(count_features)
-                    score = model.decision_function(scaled)[0]
-                    prediction = model.predict(scaled)[0]
-
-                    if prediction == -1:
-                        print(f"\nAnomaly detected at {datetime.now().strftime('%H:%M:%S')} | Score: {score:.4f}")
-                        print(parsed_df[['pid', 'user', 'database', 'query_command']].to_string(index=False))
-
-            time.sleep(POLL_INTERVAL)
+                last_line_time = time.monotonic()
+            # Parse the new lines straight from memory; a log idle for RECORD_LATENESS completes its open records
+            idle = time.monotonic() - last_line_time >= RECORD_LATENESS.total_seconds()
+            for batch in iter_event_batches(new_lines, None, assembler, flush=idle):
+                late_events = feature_engine.late_events
+                closed_windows = feature_engine.update_frame(to_ml_events(batch))
+                if closed_windows:
+                    closed_queue.put((log_path, closed_windows))
+                if feature_engine.late_events > late_events:
+                    print(f"{feature_engine.late_events - late_events} events of {log_path} arrived after "
+                          f"their window was scored and are not in it ({feature_engine.late_events} so far)")
+            if not new_lines:
+                tailer.wait(POLL_INTERVAL)
+    finally:
+        tailer.close()
+
+def monitor_log(log_paths=(LOG_FILE_PATH,)):
+    """
+    Watches every log concurrently (one tailing thread per log) and scores
+    their closed windows with the single shared model in this thread.
+    """
+    print(f"Starting real-time log monitoring of {len(log_paths)} log(s). Press Ctrl + C to stop.")
+    if ENTITY_MODELS:
+        print(f"Per-entity models: {', '.join(models.entity_col for models in ENTITY_MODELS)}")
+    closed_queue = queue.Queue()
+    stop_event = threading.Event()
+    for log_path in log_paths:
+        print(f"Watching: {log_path}")
+        threading.Thread(target=watch_source, args=(log_path, closed_queue, stop_event), daemon=True).start()
+
+    # Closed windows of all logs are scored in micro-batches (one model call per batch)
+    scoring = ScoringService(registry)
+    try:
+        while True:
+            # Wake up in time to score a pending batch within its latency bound
+            due = scoring.time_until_due()
+            try:
+                source, closed_windows = closed_queue.get(timeout=POLL_INTERVAL if due is None else max(due, 0.01))
+                report(scoring.submit(source, closed_windows))
+            except queue.Empty:
+                pass
+            report(scoring.poll())
 
     except KeyboardInterrupt:
+        stop_event.set()
+        report(scoring.flush())
         print("\nMonitoring stopped by user (Ctrl + C). Goodbye!")
 
 # E. MAIN EXECUTION
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Real-time anomaly detection on PostgreSQL logs.')
+    parser.add_argument('sources', nargs='*', default=[LOG_FILE_PATH],
+                        help=f'Log files or directories of logs ({LOG_FILE_GLOB}) to watch (default: the official log)')
+    args = parser.parse_args()
+
+    log_paths = resolve_sources(args.sources)
+    if not log_paths:
+        parser.error('no log file found in the given sources')
     print('Start Realtime Detection')
-    monitor_log()
+    monitor_log(log_paths)
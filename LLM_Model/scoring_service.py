@@ -0,0 +1,93 @@
+import time
+import warnings
+from collections import namedtuple
+import numpy as np
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION
+# ----------------------------------------------------------------------
+# A micro-batch is scored once it holds MAX_BATCH_SIZE windows...
+MAX_BATCH_SIZE = 64
+
+# ...or once its oldest window has waited MAX_LATENCY seconds
+MAX_LATENCY = 1.0  # seconds
+
+# Score of one closed feature window (score < 0 means anomalous, like decision_function)
+ScoredWindow = namedtuple('ScoredWindow', ['source', 'window', 'score', 'is_anomaly', 'events'])
+
+# ----------------------------------------------------------------------
+# B. SCORING SERVICE
+# ----------------------------------------------------------------------
+def score_features(bundle, features, out=None):
+    """
+    Scores a list of feature dicts with one scaler/model bundle in a single
+    vectorized pass. The dicts are written into an array in the bundle's
+    feature schema order (out, if given, is reused) and standardized in
+    place with the scaler's statistics. The Isolation Forest is walked
+    once (score_samples); decision scores and predictions are derived from
+    the model's offset_.
+    """
+    X = bundle.schema.vectorize(features, out)
+    X -= bundle.scaler.mean_
+    X /= bundle.scaler.scale_
+    with warnings.catch_warnings():
+        # Windows are scored as arrays in feature schema order, not as named DataFrames
+        warnings.filterwarnings('ignore', message='X does not have valid feature names', category=UserWarning)
+        scores = bundle.model.score_samples(X) - bundle.model.offset_
+    return scores, scores < 0
+
+class ScoringService:
+    """
+    Collects closed feature windows from one or more log sources into
+    micro-batches and scores each batch with one model call.
+
+    submit() queues windows and scores the batch as soon as it is full;
+    poll() also scores it once the oldest queued window is max_latency
+    seconds old. The model bundle is taken from the registry once per
+    batch.
+    """
+
+    def __init__(self, registry, batch_size=MAX_BATCH_SIZE, max_latency=MAX_LATENCY):
+        self.registry = registry
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._pending = []          # (source, window start, features, events)
+        self._oldest = None         # monotonic time of the oldest pending window
+        self._buffer = None         # feature array reused across batches
+
+    def submit(self, source, closed_windows):
+        """Queues (window start, features, events) tuples of a source, returns any scored windows."""
+        if closed_windows and self._oldest is None:
+            self._oldest = time.monotonic()
+        self._pending.extend((source, window, features, events) for window, features, events in closed_windows)
+        if len(self._pending) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def poll(self):
+        """Scores the pending batch if its oldest window has waited max_latency."""
+        if self._pending and self.time_until_due() <= 0:
+            return self.flush()
+        return []
+
+    def time_until_due(self):
+        """Seconds until the pending batch must be scored (None when nothing is pending)."""
+        if not self._pending:
+            return None
+        return max(0.0, self._oldest + self.max_latency - time.monotonic())
+
+    def flush(self):
+        """Scores every pending window, returns a list of ScoredWindow."""
+        if not self._pending:
+            return []
+        pending, self._pending, self._oldest = self._pending, [], None
+
+        bundle = self.registry.refresh()
+        if (self._buffer is None or self._buffer.shape[1] != len(bundle.schema)
+                or self._buffer.shape[0] < len(pending)):
+            self._buffer = np.empty((max(self.batch_size, len(pending)), len(bundle.schema)))
+        scores, anomalies = score_features(bundle, [features for _, _, features, _ in pending], self._buffer)
+        return [
+            ScoredWindow(source, window, score, is_anomaly, events)
+            for (source, window, _, events), score, is_anomaly in zip(pending, scores, np.asarray(anomalies))
+        ]
@@ -0,0 +1,216 @@
+import argparse
+import os
+from collections import OrderedDict
+from datetime import datetime
+import pandas as pd
+
+from event_store import EVENT_STORE_DIR, read_events
+
+# ----------------------------------------------------------------------
+# A. CONFIGURATION AND PATH SETUP
+# ----------------------------------------------------------------------
+timestamp_str = datetime.now().strftime('%Y%m%d')
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REPORT_DIR = os.path.join(BASE_DIR, '..', 'CSV_FILE', 'OUTPUT_CSVFILE', 'REPORT')
+OUTPUT_SESSION_REPORT_PATH = os.path.join(REPORT_DIR, f'session_report-{timestamp_str}.csv')
+
+# A session without any event for this long is closed (its disconnection line is missing)
+SESSION_TIMEOUT = '1h'
+
+# Event columns the sessions are built from (host: client host of connection events)
+SESSION_EVENT_COLUMNS = [
+    'timestamp', 'pid', 'user', 'database', 'host', 'event_type', 'session_duration_sec', 'query_command'
+]
+
+# pgaudit statement classes, counted per session
+AUDIT_CLASSES = ['READ', 'WRITE', 'FUNCTION', 'ROLE', 'DDL', 'MISC']
+AUDIT_CLASS_OF_COMMAND = {
+    'SELECT': 'READ',
+    'INSERT': 'WRITE', 'UPDATE': 'WRITE', 'DELETE': 'WRITE', 'TRUNCATE': 'WRITE', 'COPY': 'WRITE', 'MERGE': 'WRITE',
+    'DO': 'FUNCTION', 'CALL': 'FUNCTION', 'EXECUTE': 'FUNCTION',
+    'GRANT': 'ROLE', 'REVOKE': 'ROLE', 'CREATE ROLE': 'ROLE', 'ALTER ROLE': 'ROLE', 'DROP ROLE': 'ROLE',
+}
+DDL_PREFIXES = ('CREATE', 'ALTER', 'DROP', 'COMMENT')
+
+# Columns of a closed session record
+SESSION_COLUMNS = [
+    'pid', 'user', 'database', 'host', 'start_time', 'end_time', 'end_reason', 'session_duration_sec',
+    'n_events', 'n_errors', 'n_fatal'
+] + [f'audit_{audit_class.lower()}' for audit_class in AUDIT_CLASSES]
+
+def audit_class(command):
+    """pgaudit class of an audited command (e.g. SELECT -> READ, CREATE TABLE -> DDL)."""
+    audit_class = AUDIT_CLASS_OF_COMMAND.get(command)
+    if audit_class is None:
+        audit_class = 'DDL' if command.startswith(DDL_PREFIXES) else 'MISC'
+    return audit_class
+
+_AUDIT_CLASS_INDEX = {audit_class: i for i, audit_class in enumerate(AUDIT_CLASSES)}
+
+# ----------------------------------------------------------------------
+# B. SESSION ENGINE
+# ----------------------------------------------------------------------
+class _Session:
+    """Running state of one open session."""
+    __slots__ = ('user', 'database', 'host', 'start_time', 'last_time', 'duration',
+                 'n_events', 'n_errors', 'n_fatal', 'audit')
+
+    def __init__(self, start_time):
+        self.user = self.database = self.host = None
+        self.start_time = self.last_time = start_time
+        self.duration = None
+        self.n_events = self.n_errors = self.n_fatal = 0
+        self.audit = [0] * len(AUDIT_CLASSES)
+
+class SessionEngine:
+    """
+    Rebuilds client sessions from the event stream in one pass.
+
+    Every event updates the open session of its PID in O(1): user,
+    database and host, counts of events, errors and audited commands by
+    class. A session opens at its connection line, or at the first user
+    event of a PID connected before the log starts (events of server
+    processes without a user are only counted in ignored_events). It is
+    emitted as one record when it ends: at its disconnection line (whose
+    session time is used), at a FATAL error (the backend exits), when its
+    PID connects again, or after SESSION_TIMEOUT without events. Open
+    sessions are kept in one table ordered by last activity, so timed
+    out sessions are found at its front.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT):
+        self.timeout = pd.Timedelta(timeout)
+        self.ignored_events = 0
+        self._open = OrderedDict()  # pid -> _Session, least recently active first
+
+    def __len__(self):
+        return len(self._open)
+
+    def update(self, timestamp, pid, event_type, user=None, database=None,
+               session_duration_sec=0.0, query_command=None, host=None):
+        """Adds one event, returns the session records it closes."""
+        closed = self._expire(timestamp - self.timeout)
+
+        session = self._open.get(pid)
+        if session is not None and event_type == 'CONNECT_RECEIVED':
+            closed.append(self._close(pid, session.last_time, 'pid_reused'))
+            session = None
+        if session is None:
+            if event_type != 'CONNECT_RECEIVED' and not (isinstance(user, str) and user != '[unknown]'):
+                self.ignored_events += 1
+                return closed
+            session = self._open[pid] = _Session(timestamp)
+        else:
+            self._open.move_to_end(pid)
+
+        session.last_time = timestamp
+        session.n_events += 1
+        if isinstance(user, str) and user != '[unknown]':
+            session.user = user
+        if isinstance(database, str) and database != '[unknown]':
+            session.database = database
+        if isinstance(host, str) and session.host is None:
+            session.host = host
+
+        if event_type == 'ERROR':
+            session.n_errors += 1
+        elif event_type == 'FATAL':
+            session.n_fatal += 1
+            closed.append(self._close(pid, timestamp, 'fatal'))
+        elif event_type.startswith('AUDIT_'):
+            command = query_command if isinstance(query_command, str) else event_type[6:]
+            session.audit[_AUDIT_CLASS_INDEX[audit_class(command)]] += 1
+        elif event_type == 'DISCONNECT':
+            session.duration = session_duration_sec
+            closed.append(self._close(pid, timestamp, 'disconnect'))
+        return closed
+
+    def update_frame(self, events_df):
+        """Adds the events of a DataFrame (SESSION_EVENT_COLUMNS; host may be missing), in row order."""
+        columns = [
+            events_df[col] if col in events_df.columns else [None] * len(events_df)
+            for col in SESSION_EVENT_COLUMNS
+        ]
+        closed = []
+        for timestamp, pid, user, database, host, event_type, duration, query_command in zip(*columns):
+            closed.extend(self.update(
+                timestamp, pid, event_type, user, database, duration, query_command, host
+            ))
+        return closed
+
+    def flush(self):
+        """Emits every session still open (end_reason 'open')."""
+        return [self._close(pid, session.last_time, 'open') for pid, session in list(self._open.items())]
+
+    def _expire(self, watermark):
+        """Closes the sessions without events since watermark."""
+        closed = []
+        while self._open:
+            pid, session = next(iter(self._open.items()))
+            if session.last_time >= watermark:
+                break
+            closed.append(self._close(pid, session.last_time, 'timeout'))
+        return closed
+
+    def _close(self, pid, end_time, reason):
+        """Removes the session of pid from the open table, returns its record."""
+        session = self._open.pop(pid)
+        duration = session.duration
+        if duration is None:
+            duration = (end_time - session.start_time).total_seconds()
+        return (
+            pid, session.user, session.database, session.host, session.start_time, end_time, reason,
+            duration, session.n_events, session.n_errors, session.n_fatal, *session.audit
+        )
+
+    @staticmethod
+    def to_frame(sessions):
+        """Builds a session DataFrame (SESSION_COLUMNS) from emitted session records."""
+        return pd.DataFrame(sessions, columns=SESSION_COLUMNS)
+
+def build_sessions(events_df, timeout=SESSION_TIMEOUT):
+    """Rebuilds every session of an event DataFrame (in time order) in one pass."""
+    engine = SessionEngine(timeout)
+    sessions = engine.update_frame(events_df)
+    sessions += engine.flush()
+    return SessionEngine.to_frame(sessions)
+
+def session_of_events(events_df, sessions_df):
+    """
+    Adds the start time of the session each event belongs to (the last
+    session of its PID started at or before it) as 'session_start'.
+    """
+    starts = sessions_df[['pid', 'start_time']].rename(columns={'start_time': 'session_start'})
+    matched = pd.merge_asof(
+        events_df.reset_index().sort_values('timestamp'), starts.sort_values('session_start'),
+        left_on='timestamp', right_on='session_start', by='pid'
+    )
+    return matched.set_index('index').sort_index().rename_axis(events_df.index.name)
+
+# ----------------------------------------------------------------------
+# C. MAIN EXECUTION LOGIC
+# ----------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Rebuild client sessions from the events and report them.')
+    parser.add_argument('log_files', nargs='*',
+                        help='Parse these log files instead of reading the event store')
+    parser.add_argument('--timeout', default=SESSION_TIMEOUT, help='Close sessions idle for this long (e.g. 30min)')
+    args = parser.parse_args()
+
+    if args.log_files:
+        from data_extraction import read_event_table
+        events_df = pd.concat([read_event_table(path) for path in args.log_files], ignore_index=True)
+    else:
+        print(f"Loading events from: {EVENT_STORE_DIR}")
+        events_df = read_events(columns=SESSION_EVENT_COLUMNS)
+    events_df = events_df.sort_values('timestamp', kind='stable')
+
+    sessions_df = build_sessions(events_df, args.timeout)
+    os.makedirs(REPORT_DIR, exist_ok=True)
+    sessions_df.to_csv(OUTPUT_SESSION_REPORT_PATH, index=False)
+    print(f"{len(sessions_df)} sessions from {len(events_df)} events saved to: {OUTPUT_SESSION_REPORT_PATH}")
+    print(sessions_df['end_reason'].value_counts().to_string())
+
+    pd.set_option('display.width', 1000)
+    print("\nTop 10 sessions by errors:")
+    print(sessions_df.sort_values(['n_fatal', 'n_errors'], ascending=False).head(10).to_string(index=False))
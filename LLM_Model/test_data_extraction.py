@@ -0,0 +1,80 @@
+import json
+import os
+
+import pandas as pd
+
+from data_extraction import (
+    RecordAssembler, categorize_events, checkpoint_entry, flush_records, iter_byte_range_batches,
+    parse_postgresql_log, parse_postgresql_logs_parallel
+)
+
+# ----------------------------------------------------------------------
+# A. TEST LOG
+# ----------------------------------------------------------------------
+# An ERROR whose STATEMENT (with an indented second line) comes after a line of another backend
+RECORD_LINES = [
+    '2025-10-04 21:00:{second:02d}.{ms:03d} +07 [100] postgres@db ERROR:  relation "t{i}" does not exist\n',
+    '2025-10-04 21:00:{second:02d}.{ms:03d} +07 [200] LOG:  checkpoint starting: time\n',
+    '2025-10-04 21:00:{second:02d}.{ms:03d} +07 [100] postgres@db STATEMENT:  select *\n',
+    '\t  from t{i};\n',
+]
+
+def write_interleaved_log(path, n_records=200):
+    lines = []
+    for i in range(n_records):
+        ms = i * 37
+        lines += [line.format(i=i, second=ms // 1000, ms=ms % 1000) for line in RECORD_LINES]
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    return lines
+
+def comparable(events_df):
+    return events_df.drop(columns='query_id').astype(str).reset_index(drop=True)
+
+# ----------------------------------------------------------------------
+# B. RECORDS CUT BY BYTE RANGES AND CHECKPOINTS
+# ----------------------------------------------------------------------
+def test_range_split_matches_serial(tmp_path):
+    path = str(tmp_path / 'interleaved.log')
+    write_interleaved_log(path)
+    serial_df = parse_postgresql_log(path)
+    assert len(serial_df) == 400 and not (serial_df['event_type'] == 'STATEMENT').any()
+
+    for range_size in (300, 700, 2000):
+        parallel_df = parse_postgresql_logs_parallel([path], workers=2, range_size=range_size)
+        pd.testing.assert_frame_equal(comparable(parallel_df), comparable(serial_df))
+
+        blocks = pd.concat(iter_byte_range_batches(path, 0, os.path.getsize(path), range_size))
+        pd.testing.assert_frame_equal(comparable(blocks), comparable(serial_df))
+
+def test_checkpoint_carries_open_records(tmp_path):
+    path = str(tmp_path / 'interleaved.log')
+    lines = write_interleaved_log(path)
+    serial_df = parse_postgresql_log(path)
+
+    # Cut after the ERROR, after the STATEMENT (before its indented line) and between records
+    for cut in (1, 3, 4, 301):
+        for parallel in (False, True):
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(lines[:cut])
+            first_end = os.path.getsize(path)
+            assemblers = {path: RecordAssembler()}
+            if parallel:
+                batches = [parse_postgresql_logs_parallel([path], 2, 300, {path: (0, first_end)}, assemblers)]
+            else:
+                batches = list(iter_byte_range_batches(path, 0, first_end, 300, assemblers[path]))
+            entry = json.loads(json.dumps(checkpoint_entry(path, first_end, assemblers[path])))
+
+            with open(path, 'a', encoding='utf-8') as f:
+                f.writelines(lines[cut:])
+            end = os.path.getsize(path)
+            assemblers = {path: RecordAssembler.from_state(entry['pending'])}
+            if parallel:
+                batches.append(parse_postgresql_logs_parallel([path], 2, 300, {path: (first_end, end)}, assemblers))
+            else:
+                batches += list(iter_byte_range_batches(path, first_end, end, 300, assemblers[path]))
+            batches += list(flush_records(assemblers[path]))
+
+            events_df = pd.concat([batch for batch in batches if not batch.empty])
+            events_df = categorize_events(events_df.sort_values('timestamp', kind='stable'))
+            pd.testing.assert_frame_equal(comparable(events_df), comparable(serial_df))
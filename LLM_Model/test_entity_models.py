@@ -0,0 +1,46 @@
+import joblib
+import numpy as np
+import pandas as pd
+
+from entity_models import MIN_ENTITY_WINDOWS, EntityModels, latest_entity_models
+from preprocessing import create_entity_features
+
+# ----------------------------------------------------------------------
+# A. TEST EVENTS
+# ----------------------------------------------------------------------
+def make_events(n_windows=60, seed=0):
+    """A busy user with steady traffic, a quiet user and one ERROR burst of the busy user."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    start = pd.Timestamp('2025-10-04 21:00:00+07:00')
+    for window in range(n_windows):
+        window_start = start + pd.Timedelta(seconds=30 * window)
+        for _ in range(rng.integers(3, 6)):
+            rows.append((window_start + pd.Timedelta(seconds=int(rng.integers(30))), 'app', 'appdb', 'AUDIT', 1.0))
+        if window % 10 == 0:
+            rows.append((window_start, 'report', 'appdb', 'CONNECT_AUTHORIZED', 5.0))
+    burst = start + pd.Timedelta(seconds=30 * (n_windows - 1))
+    rows += [(burst, 'app', 'appdb', 'ERROR', 0.0)] * 40
+    events_df = pd.DataFrame(rows, columns=['timestamp', 'user', 'database', 'event_type', 'session_duration_sec'])
+    return events_df.sort_values('timestamp', kind='stable').set_index('timestamp')
+
+# ----------------------------------------------------------------------
+# B. SAVE, LOAD AND SCORE
+# ----------------------------------------------------------------------
+def test_saved_models_load_and_score(tmp_path):
+    events_df = make_events()
+    entity_features_df = create_entity_features(events_df, 'user')
+    models = EntityModels('user', entity_features_df.columns).fit(entity_features_df, workers=1)
+    assert list(models.forests) == ['app'] and len(entity_features_df.loc['report']) < MIN_ENTITY_WINDOWS
+
+    joblib.dump(models, tmp_path / 'entity_models-user-20251004.pkl')
+    joblib.dump(models, tmp_path / 'entity_models-user-5min-20251005.pkl')   # other window size, not picked
+    loaded = latest_entity_models('user', model_dir=str(tmp_path))
+    assert type(loaded).__module__ == 'entity_models' and loaded.entity_col == 'user'
+    pd.testing.assert_series_equal(loaded.score(entity_features_df), models.score(entity_features_df))
+
+    # New windows are scored from their events: the ERROR burst is flagged for its user
+    anomalies = loaded.detect(events_df)
+    assert (anomalies < 0).all()
+    assert ('app', events_df.index.max().floor('30s')) in anomalies.index
+    assert latest_entity_models('database', model_dir=str(tmp_path)) is None
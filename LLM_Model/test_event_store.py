@@ -0,0 +1,44 @@
+import pandas as pd
+
+from event_store import read_events, read_events_in_windows, read_late_events, write_events
+
+# ----------------------------------------------------------------------
+# A. TEST STORE
+# ----------------------------------------------------------------------
+# One event per minute around local midnight (+07): two day partitions, one UTC day
+def write_test_store(store_dir, n_events=120):
+    local = pd.date_range('2025-10-04 23:00:00', periods=n_events, freq='1min')
+    write_events(pd.DataFrame({
+        'pid': range(n_events),
+        'user': 'postgres',
+        'database': 'db',
+        'host': None,
+        'event_type': 'LOG',
+        'session_duration_sec': 0.0,
+        'query_command': None,
+        'query_id': None,
+        'timestamp': [f"{timestamp:%Y-%m-%d %H:%M:%S}.000 +07" for timestamp in local],
+    }), store_dir)
+    return read_events(store_dir=store_dir)
+
+def between(events_df, start, end):
+    return events_df[(events_df['timestamp'] >= start) & (events_df['timestamp'] < end)].reset_index(drop=True)
+
+# ----------------------------------------------------------------------
+# B. NAIVE AND UTC BOUNDS
+# ----------------------------------------------------------------------
+def test_bounds_are_read_in_the_store_time_zone(tmp_path):
+    store_dir = str(tmp_path / 'event_store')
+    events_df = write_test_store(store_dir)
+    start, end = pd.Timestamp('2025-10-04 23:30:00+07:00'), pd.Timestamp('2025-10-05 00:30:00+07:00')
+    expected = between(events_df, start, end)
+    assert len(expected) == 60
+
+    # Aware (+07 or UTC) and naive (store-local) bounds select the same events
+    for bounds in [(start, end), (start.tz_convert('UTC'), end.tz_convert('UTC')),
+                   (start.tz_localize(None), end.tz_localize(None)), ('2025-10-04 23:30', '2025-10-05 00:30')]:
+        pd.testing.assert_frame_equal(read_events_in_windows([bounds], store_dir=store_dir), expected)
+        pd.testing.assert_frame_equal(read_events(start=bounds[0], end=bounds[1], store_dir=store_dir), expected)
+
+    late_df = read_late_events('2025-10-05 00:30', 0, store_dir=store_dir)
+    pd.testing.assert_frame_equal(late_df, between(events_df, events_df['timestamp'].min(), end))
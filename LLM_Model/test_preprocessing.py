@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+import preprocessing
+from event_store import last_row_group, read_events, write_events
+from preprocessing import (
+    add_late_windows, counted_window_features, create_time_series_features, find_late_windows,
+    load_and_prepare_data, pad_windows, update_scaler
+)
+
+# ----------------------------------------------------------------------
+# A. TEST STORE
+# ----------------------------------------------------------------------
+def write_test_events(store_dir, timestamps, event_types, seed=0):
+    rng = np.random.default_rng(seed)
+    n_events = len(timestamps)
+    write_events(pd.DataFrame({
+        'pid': range(n_events),
+        'user': 'postgres',
+        'database': 'db',
+        'host': None,
+        'event_type': event_types,
+        'session_duration_sec': rng.uniform(0, 60, n_events).round(3),
+        'query_command': None,
+        'query_id': None,
+        'timestamp': [f"{timestamp:%Y-%m-%d %H:%M:%S}.000 +07" for timestamp in timestamps],
+    }), store_dir)
+
+def scratch_scaler(store_dir, columns):
+    """The scaler a full run fits on every window of the store."""
+    features_df = create_time_series_features(read_events(store_dir=store_dir).set_index('timestamp'))
+    return StandardScaler().fit(features_df.reindex(columns=columns, fill_value=0))
+
+# ----------------------------------------------------------------------
+# B. INCREMENTAL SCALER WITH LATE EVENTS
+# ----------------------------------------------------------------------
+def test_late_windows_are_not_counted_twice(tmp_path, monkeypatch):
+    store_dir = str(tmp_path / 'event_store')
+    monkeypatch.setattr(preprocessing, 'INPUT_EVENTS_PATH', store_dir)
+    monkeypatch.setattr(preprocessing, 'OUTPUT_SCALER_PATH', str(tmp_path / 'scaler.pkl'))
+
+    # 1. First run: every other 30s window of 10 minutes has events
+    first = pd.date_range('2025-10-04 21:00:00', '2025-10-04 21:10:00', freq='1min')
+    write_test_events(store_dir, first, ['LOG', 'AUDIT'] * (len(first) // 2) + ['LOG'], seed=1)
+    base_row_group = last_row_group(store_dir)
+    base_features_df = create_time_series_features(read_events(store_dir=store_dir).set_index('timestamp'))
+    base_scaler = StandardScaler().fit(base_features_df)
+    start = (base_features_df.index.max() + pd.Timedelta('30s')).isoformat()
+
+    # 2. Late events (in a processed window and in an empty one, with a new type), then new events after a gap
+    late = pd.to_datetime(['2025-10-04 21:02:10', '2025-10-04 21:02:40', '2025-10-04 21:07:45'])
+    new = pd.date_range('2025-10-04 21:13:00', periods=8, freq='20s')
+    write_test_events(store_dir, late.append(new), ['ERROR', 'FATAL', 'LOG'] + ['LOG'] * len(new), seed=2)
+
+    # 3. Incremental run
+    events_df = load_and_prepare_data(store_dir, start=start)
+    late_windows = find_late_windows(start, base_row_group)
+    assert len(late_windows) == 3
+    features_df = create_time_series_features(add_late_windows(events_df, late_windows))
+    features_df = pad_windows(features_df, start, late_windows)
+    update_scaler(features_df, base_scaler, counted_window_features(late_windows, base_row_group))
+
+    expected = scratch_scaler(store_dir, base_scaler.feature_names_in_)
+    assert base_scaler.n_samples_seen_ == expected.n_samples_seen_
+    np.testing.assert_allclose(base_scaler.mean_, expected.mean_)
+    np.testing.assert_allclose(base_scaler.var_, expected.var_)
+    np.testing.assert_allclose(base_scaler.scale_, expected.scale_)
@@ -1,5 +1,6 @@
 from collections import defaultdict, Counter
 import csv
+import gzip
 import os
 import re
 import time
@@ -38,6 +39,11 @@ SCRIPT_02 = os.path.join(ML_SCRIPT_DIR, 'preprocessing.py')
 SCRIPT_03 = os.path.join(ML_SCRIPT_DIR, 'model_training.py')
 SCRIPT_04 = os.path.join(ML_SCRIPT_DIR, 'anomaly_reporting.py')
 SCRIPT_05 = os.path.join(ML_SCRIPT_DIR, 'realtime_detect.py')
+
+# Dùng chung bộ phân tích log của pipeline ML
+sys.path.append(ML_SCRIPT_DIR)
+from data_extraction import format_log_timestamps, read_event_table
+from query_fingerprint import QUERY_TEMPLATES
 # Hàm chạy file Python bên ngoài
 def run_python_script(script_path):
     """Chạy một file Python bên ngoài bằng subprocess."""
@@ -56,135 +62,155 @@ def run_python_script(script_path):
         console.print(f"[{EXIT_RGB}]LỖI: Không tìm thấy file script tại đường dẫn: {script_path}[/]", style=ERROR)
 
 
-# Regex Pattern để trích xuất các trường thông tin chính
-# Nhóm 1: Timestamp
-# Nhóm 2: PID
-# Nhóm 3: User
-# Nhóm 4: Database
-# Nhóm 5: CẤP ĐỘ LOG (LOG|ERROR|FATAL|STATEMENT) <--- ĐƯỢC TRÍCH XUẤT LÀM GROUP
-# Nhóm 6: Log Content (phần còn lại của dòng log)
-POSTGRES_LOG_PATTERN = re.compile(
-    r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}\.\d{3}\s+[+\-]\d{2})\s+\[(\d+)\]\s+'  # Group 1, 2: Timestamp and PID
-    r'(?:(\w+))?@(\w+)\s+'                                                     # Group 3, 4: User@Database
-    r'((?:LOG|ERROR|FATAL|STATEMENT)(?::))?\s*'                                 # Group 5: Cấp độ Log (LOG:|ERROR:|...)
-    r'(.*)'                                                                   # Group 6: The rest of the log message (Content)
-)
-
-def readFile(Path) -> list:
-    """Đọc file log và trả về list các dòng log (strings). File được đóng tự động."""
-    logCollection = []
-    try:
-        # File sẽ tự động đóng khi khối 'with' kết thúc
-        with open(Path, 'r', encoding='utf-8') as file:
-            # print(f"Đã mở file thành công: {os.path.basename(Path)}")
-            for line in file:
-                text = line.strip()
-                if text:
-                    logCollection.append(text)
-        return logCollection
-    except FileNotFoundError:
-        print(f"Lỗi: Không tìm thấy file '{Path}'. Vui lòng kiểm tra lại đường dẫn.")
-        return []
-    except Exception as e:
-        print(f"Đã xảy ra lỗi: {e}")
-        return []
+# Regex trích xuất loại hành động AUDIT và nội dung SQL từ phần nội dung log
+AUDIT_ACTION_GENERAL_PATTERN = re.compile(r'AUDIT:\s+SESSION,\d+,\d+,(\w+),')
+AUDIT_ACTION_SPECIFIC_PATTERN = re.compile(r'AUDIT:\s+SESSION,\d+,\d+,\w+,(\w+),')
+# Câu SQL nhiều dòng đã được ghép vào cùng một bản ghi
+QUERY_TEXT_PATTERN = re.compile(r'"(.*?)"', re.DOTALL)
+SQL_COMMAND_PATTERN = re.compile(r'(\w+)')
+# User@Database hợp lệ (ví dụ: postgres@testdb), [unknown]@[unknown] bị loại
+USER_DB_PATTERN = re.compile(r'(\w*)@(\w+)')
 
+# Các cấp độ log được tách riêng ở menu (các cấp độ khác nằm trong nội dung)
+MENU_LEVELS = ['LOG', 'ERROR', 'FATAL', 'STATEMENT']
+# Các cấp độ log hiển thị trong danh sách theo PID
+PID_VIEW_LEVELS = ['LOG', 'FATAL', 'ERROR', 'DETAIL']
 
-def filter_and_parse_logs(logs: list) -> list:
-    """Phân tích cú pháp mỗi dòng log và trích xuất các trường chính."""
+def get_log_file_path() -> str:
+    """Đường dẫn file log PostgreSQL dùng cho menu."""
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, '..', 'Log_Example', 'postgresql-official.log')
+
+
+class LogRecord:
+    """
+    Một dòng log đã phân tích của menu. Dùng __slots__ (không có __dict__)
+    và chuỗi intern cho các giá trị lặp lại (PID, user, database, cấp độ,
+    loại hành động) để giữ bộ nhớ nhỏ với log lớn. query là mẫu câu SQL đã
+    chuẩn hóa (bỏ giá trị literal), mỗi mẫu chỉ lưu một lần trong
+    QUERY_TEMPLATES; câu gốc của dòng AUDIT vẫn nằm trong raw_content.
+    """
+    __slots__ = ('timestamp', 'pid', 'user', 'database', 'level_final', 'level_1',
+                 'action_type', 'query', 'raw_content', 'raw_log')
+
+    def __init__(self, timestamp=None, pid=None, user=None, database=None, level_final=None,
+                 level_1=None, action_type=None, query=None, raw_content=None, raw_log=None):
+        self.timestamp = timestamp
+        self.pid = pid
+        self.user = user
+        self.database = database
+        self.level_final = level_final
+        self.level_1 = level_1
+        self.action_type = action_type
+        self.query = query
+        self.raw_content = raw_content
+        self.raw_log = raw_log
+
+    @property
+    def level_2(self) -> str:
+        # Level 2 là AUDIT đúng khi cấp độ Final là AUDIT
+        return 'AUDIT' if self.level_final == 'AUDIT' else ''
+
+
+def filter_and_parse_logs(events_df: pd.DataFrame) -> list:
+    """Chuyển bảng sự kiện dùng chung thành danh sách LogRecord cho menu."""
     parsed_data = []
-    for log_line in logs:
-        # Sửa lỗi: Sử dụng re.match() hoặc re.search() với regex chính
-        match = POSTGRES_LOG_PATTERN.search(log_line)
-        if match:
-            # Trích xuất 6 nhóm từ regex (Timestamp, PID, User, DB, Level_raw, Content)
-            timestamp, pid, user, db, level_raw, content = match.groups()
-
-            # --- LOGIC PHÂN LOẠI CẤP ĐỘ MỚI ---
-            
-            # Xử lý level_raw: chỉ lấy từ khóa (ví dụ: 'LOG:' -> 'LOG')
-            level_1 = level_raw.strip(':') if level_raw else 'UNKNOWN'
-            level_2 = ''
-            
-            # Tìm kiếm AUDIT (Cấp độ 2)
-            if 'AUDIT:' in content:
-                level_2 = 'AUDIT'
-            
-            # Nếu có Level 2 (AUDIT) thì Final là AUDIT, ngược lại là Level 1
-            if level_2 == 'AUDIT':
-                final_level = 'AUDIT'
-            else:
-                final_level = level_1
-
-
-            # Cố gắng trích xuất loại hành động SQL chi tiết từ nội dung AUDIT
-            # 1. Trích xuất loại hành động chung (DDL, READ, WRITE, ROLE)
-            action_match_general = re.search(r'AUDIT:\s+SESSION,\d+,\d+,(\w+),', content)
-            action_type_general = action_match_general.group(1) if action_match_general else ''
-
-            # 2. Cố gắng trích xuất tên lệnh SQL thực tế (SELECT, INSERT, CREATE, DELETE, GRANT, v.v.)
-            # Tên lệnh SQL luôn nằm ngay sau loại hành động chung trong log AUDIT
-            action_match_specific = re.search(r'AUDIT:\s+SESSION,\d+,\d+,\w+,(\w+),', content)
-            action_type_specific = action_match_specific.group(1) if action_match_specific else action_type_general
-
-            # Cố gắng trích xuất Nội dung SQL (nằm trong dấu "")
-            query_match = re.search(r'"(.*?)"', content)
-            query_text = query_match.group(1) if query_match else ''
-            
-            # Cố gắng trích xuất lệnh SQL từ STATEMENT hoặc ERROR/FATAL
-            if final_level in ['STATEMENT', 'ERROR', 'FATAL'] and query_text:
-                # Lấy từ khóa đầu tiên của câu lệnh SQL
-                specific_command_match = re.match(r'(\w+)', query_text.strip())
-                action_type = specific_command_match.group(1).upper() if specific_command_match else action_type_general
-            else:
-                # Nếu là AUDIT, ưu tiên tên lệnh SQL cụ thể (ví dụ: CREATE TABLE, SELECT)
-                action_type = action_type_specific
-
-
-            parsed_data.append({
-                'timestamp': timestamp,
-                'pid': pid,
-                'user': user or 'N/A',
-                'database': db or 'N/A',
-                'level_final': final_level, 
-                'level_1': level_1,
-                'level_2': level_2,
-                'action_type': action_type, # Sử dụng tên lệnh SQL cụ thể
-                'query': query_text,
-                'raw_content': content.strip()
-            })
+    intern = sys.intern
+    rows = zip(
+        format_log_timestamps(events_df['timestamp']), events_df['pid'], events_df['user_db'],
+        events_df['level'], events_df['message'], events_df['query_text']
+    )
+    for timestamp, pid, user_db, level, message, statement in rows:
+        user_db_match = USER_DB_PATTERN.fullmatch(user_db) if isinstance(user_db, str) else None
+        if not user_db_match:
+            # Các dòng log system đơn giản không có user@db
+            parsed_data.append(LogRecord(raw_log=f"{timestamp} [{pid}] {level}: {message}", level_final='SYSTEM'))
+            continue
+
+        user, db = user_db_match.groups()
+
+        # --- LOGIC PHÂN LOẠI CẤP ĐỘ ---
+        if level in MENU_LEVELS:
+            level_1 = level
+            content = message
+        else:
+            level_1 = 'UNKNOWN'
+            content = f"{level}: {message}"
+
+        # Tìm kiếm AUDIT (Cấp độ 2)
+        level_2 = 'AUDIT' if 'AUDIT:' in content else ''
+
+        # Nếu có Level 2 (AUDIT) thì Final là AUDIT, ngược lại là Level 1
+        final_level = 'AUDIT' if level_2 == 'AUDIT' else level_1
+
+        # Các regex chi tiết chỉ chạy cho loại dòng cần đến chúng (dòng AUDIT, dòng có dấu ")
+        # 1. Trích xuất loại hành động chung (DDL, READ, WRITE, ROLE)
+        action_match_general = AUDIT_ACTION_GENERAL_PATTERN.search(content) if level_2 else None
+        action_type_general = action_match_general.group(1) if action_match_general else ''
+
+        # 2. Trích xuất tên lệnh SQL thực tế (SELECT, INSERT, CREATE, DELETE, GRANT, v.v.)
+        action_match_specific = AUDIT_ACTION_SPECIFIC_PATTERN.search(content) if level_2 else None
+        action_type_specific = action_match_specific.group(1) if action_match_specific else action_type_general
+
+        # Trích xuất Nội dung SQL (nằm trong dấu "")
+        query_match = QUERY_TEXT_PATTERN.search(content) if '"' in content else None
+        query_text = query_match.group(1) if query_match else ''
+
+        # ERROR/FATAL mang sẵn câu lệnh của dòng STATEMENT đi kèm (đã ghép khi phân tích log)
+        if level in ['ERROR', 'FATAL'] and isinstance(statement, str):
+            query_text = statement
+
+        # Trích xuất lệnh SQL từ STATEMENT hoặc ERROR/FATAL
+        if final_level in ['STATEMENT', 'ERROR', 'FATAL'] and query_text:
+            specific_command_match = SQL_COMMAND_PATTERN.match(query_text.strip())
+            action_type = specific_command_match.group(1).upper() if specific_command_match else action_type_general
         else:
-            # Xử lý các dòng log không khớp (ví dụ: log system đơn giản không có user@db)
-            parsed_data.append({'raw_log': log_line, 'level_final': 'SYSTEM'})
+            # Nếu là AUDIT, ưu tiên tên lệnh SQL cụ thể (ví dụ: CREATE TABLE, SELECT)
+            action_type = action_type_specific
+
+        parsed_data.append(LogRecord(
+            timestamp=timestamp,
+            pid=intern(str(pid)),
+            user=intern(user or 'N/A'),
+            database=intern(db or 'N/A'),
+            level_final=final_level,
+            level_1=level_1,
+            action_type=intern(action_type),
+            query=QUERY_TEMPLATES.template_of(query_text) or '',
+            raw_content=content.strip()
+        ))
 
     return parsed_data
 
 # ----------------------------------------------------
 # Official File End
 # ----------------------------------------------------
-def initial_parse() -> list:
-    """Hàm khởi tạo và phân tích file log ban đầu."""
+def load_event_table() -> pd.DataFrame:
+    """Đọc và phân tích file log một lần duy nhất thành bảng sự kiện dùng chung."""
+    return read_event_table(get_log_file_path())
+
+def initial_parse(events_df: pd.DataFrame) -> list:
+    """Hàm khởi tạo danh sách log của menu từ bảng sự kiện."""
     parsed_data = []
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_file_path = os.path.join(base_dir, '..', 'Log_Example', 'postgresql-official.log')
-    Log_lines = readFile(log_file_path)
-    if Log_lines: 
-        parsed_data = filter_and_parse_logs(Log_lines)
+    if not events_df.empty:
+        parsed_data = filter_and_parse_logs(events_df)
     return parsed_data
 # ----------------------------------------------------
 # Function List All Logs base on PID: 
 # ----------------------------------------------------
-def logs_baseon_pid() -> list:
+def pid_view_rows(events_df: pd.DataFrame):
+    """Trả về (timestamp, pid, level, message) của các dòng log hiển thị theo PID."""
+    view = events_df[events_df['level'].isin(PID_VIEW_LEVELS)]
+    # Bỏ múi giờ khỏi timestamp (YYYY-MM-DD HH:MM:SS.mmm)
+    timestamps = view['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').str[:-3]
+    for timestamp, pid, level, message in zip(timestamps, view['pid'], view['level'], view['message']):
+        # Bỏ khoảng trắng thừa đầu nội dung
+        yield timestamp, str(pid), level, message.lstrip()
+
+def logs_baseon_pid(events_df: pd.DataFrame) -> list:
     logs = defaultdict(list)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_file_path = os.path.join(base_dir, '..', 'Log_Example', 'postgresql-official.log')
-    Log_lines = readFile(log_file_path)
-    pattern = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) .*?\[\s*(\d+)\s*\].*?\s(LOG|FATAL|ERROR|DETAIL):\s+(.*)")
-    for line in Log_lines:
-        match = pattern.search(line)
-        if match:
-            timestamp, pid, level, message = match.groups()
-            logs[pid].append(f"{timestamp} | {level}: {message}") #pid la key 
+    for timestamp, pid, level, message in pid_view_rows(events_df):
+        logs[pid].append(f"{timestamp} | {level}: {message}") #pid la key 
     return logs 
     
 
@@ -196,29 +222,64 @@ def print_logs_by_pid(logs: dict):
         for action in actions:
             console.print(f"[{ITEM}]*[/]:  {action}")
     
-def export_logs_to_csv():
+def filter_events(events_df: pd.DataFrame, start: str = '', end: str = '', pid: str = '') -> pd.DataFrame:
+    """Lọc bảng sự kiện theo khoảng thời gian [start, end) (YYYY-MM-DD[ HH:MM:SS]) và PID."""
+    def to_event_time(value):
+        # Thời điểm nhập không có múi giờ được hiểu theo múi giờ của log
+        value = pd.Timestamp(value)
+        tz = events_df['timestamp'].dt.tz
+        return value.tz_localize(tz) if value.tz is None and tz is not None else value
+
+    mask = pd.Series(True, index=events_df.index)
+    if start:
+        mask &= events_df['timestamp'] >= to_event_time(start)
+    if end:
+        mask &= events_df['timestamp'] < to_event_time(end)
+    if pid:
+        mask &= events_df['pid'] == int(pid)
+    return events_df[mask]
+
+def ask_time(prompt: str) -> str:
+    """Hỏi một thời điểm (YYYY-MM-DD[ HH:MM:SS]) cho tới khi nhập đúng; Enter để bỏ qua."""
+    while True:
+        value = Prompt.ask(prompt, default='').strip()
+        if not value:
+            return ''
+        try:
+            pd.Timestamp(value)
+            return value
+        except ValueError:
+            console.print(f"[{EXIT_RGB}]LỖI: '{value}' không phải thời điểm hợp lệ (YYYY-MM-DD[ HH:MM:SS]), hãy nhập lại.[/]", style=ERROR)
+
+def ask_pid(prompt: str) -> str:
+    """Hỏi một PID (số nguyên dương) cho tới khi nhập đúng; Enter để bỏ qua."""
+    while True:
+        value = Prompt.ask(prompt, default='').strip()
+        if not value or value.isdigit():
+            return value
+        console.print(f"[{EXIT_RGB}]LỖI: PID '{value}' phải là số nguyên dương, hãy nhập lại.[/]", style=ERROR)
+
+def export_logs_to_csv(events_df: pd.DataFrame, output_format: str = 'csv', start: str = '', end: str = '', pid: str = ''):
+    """
+    Xuất các dòng log theo PID ra file (csv, csv.gz hoặc parquet), mỗi dòng
+    được ghi đúng một lần. Có thể lọc theo khoảng thời gian và PID.
+    """
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    log_file_path = os.path.join(base_dir, '..', 'Log_Example', 'postgresql-official.log')
     timestamp_str = datetime.now().strftime("%Y%m%d")
-    csv_file_name = f'logs-{timestamp_str}.csv'
-    output_file_path = os.path.join(base_dir, '..', 'CSV_FILE', csv_file_name)
-    Log_lines = readFile(log_file_path) 
-    # Nếu file đã tồn tại thì xóa
-    if os.path.exists(output_file_path):
-        os.remove(output_file_path)
-
-    pattern = re.compile(r"^(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) .*?\[\s*(\d+)\s*\].*?\s(LOG|FATAL|ERROR|DETAIL):\s+(.*)")
-    extraced_logs = []
-    for line in Log_lines:
-        match = pattern.search(line)
-        if match:
-            timestamp, pid, level, message = match.groups()
-            extraced_logs.append([timestamp, pid, level, message])
-
-        with open(output_file_path, 'w', encoding='utf-8') as csv_file:
+    file_name = f'logs-{timestamp_str}.{output_format}'
+    output_file_path = os.path.join(base_dir, '..', 'CSV_FILE', file_name)
+    header = ['Timestamp', 'PID', 'Level', 'Message']
+    rows = pid_view_rows(filter_events(events_df, start, end, pid))
+
+    if output_format == 'parquet':
+        pd.DataFrame(list(rows), columns=header).to_parquet(output_file_path, index=False)
+    else:
+        opener = gzip.open if output_format == 'csv.gz' else open
+        # Ghi header và toàn bộ dòng log một lần (ghi đè file cũ nếu có)
+        with opener(output_file_path, 'wt', encoding='utf-8', newline='') as csv_file:
             writer = csv.writer(csv_file)
-            writer.writerow(['Timestamp', 'PID', 'Level', 'Message'])
-            writer.writerows(extraced_logs)
+            writer.writerow(header)
+            writer.writerows(rows)
     print(f"Logs đã được xuất thành công vào file: {output_file_path}")
 
 
@@ -232,23 +293,23 @@ def list_all_logs(parsed_data: list):
     print("=" * 60)  
     for item in parsed_data:
                 #time.sleep(0.1)  # Thêm độ trễ nhỏ để dễ quan sát khi in ra
-        if item.get('level_final') != 'SYSTEM':
+        if item.level_final != 'SYSTEM':
                 # In ra chi tiết nếu final_level không phải là SYSTEM
-            print(f"Thời gian: {item['timestamp']}")
-            print(f"Người dùng: {item['user']} | Database: {item['database']}")
-            print(f"CẤP ĐỘ FINAL: {item['level_final']} (L1: {item['level_1']} | L2: {item['level_2']})")
+            print(f"Thời gian: {item.timestamp}")
+            print(f"Người dùng: {item.user} | Database: {item.database}")
+            print(f"CẤP ĐỘ FINAL: {item.level_final} (L1: {item.level_1} | L2: {item.level_2})")
                 
             # Logic hiển thị chi tiết (đã sửa)
-        if item['level_final'] == 'AUDIT':
-            print(f"Loại hành động: {item['action_type']}")
-            print(f"Query: {item['query'][:70]}...")
-        elif item['level_final'] in ['ERROR', 'FATAL', 'STATEMENT']:
-            print(f"Nội dung: {item['raw_content']}")
-        elif item['level_final'] == 'LOG':
-            print(f"Nội dung: {item['raw_content']}")
+        if item.level_final == 'AUDIT':
+            print(f"Loại hành động: {item.action_type}")
+            print(f"Query: {item.query[:70]}...")
+        elif item.level_final in ['ERROR', 'FATAL', 'STATEMENT']:
+            print(f"Nội dung: {item.raw_content}")
+        elif item.level_final == 'LOG':
+            print(f"Nội dung: {item.raw_content}")
         else:
             # Trường hợp UNKNOWN
-            print(f"Log thô: {item.get('raw_content', item.get('raw_log', 'N/A'))}")
+            print(f"Log thô: {item.raw_content or item.raw_log or 'N/A'}")
 
         print(f"This is the end of list log")        
         print("-" * 30)
@@ -260,18 +321,18 @@ def list_connect_logs(parsed_data: list):
     time.sleep(0.5) # Thêm độ trễ nhỏ để dễ quan sát khi in ra
     list_connect = []
     for item in parsed_data:
-        if item.get('final_level') != 'SYSTEM':
-            raw_data = item.get('raw_content')
+        if item.level_final != 'SYSTEM':
+            raw_data = item.raw_content
             if raw_data and raw_data.startswith('connection authorized: user'):
                 list_connect.append(item)
     for item in list_connect:
         time.sleep(0.05)
-        console.print(f'\n[{ITEM}]PID[/] :\r{item['pid']}')
-        console.print(f'[{ITEM}]Time[/] :\r{item['timestamp']}')
-        console.print(f'[{ITEM}]Raw data[/]:\r{item['raw_content']}') 
+        console.print(f'\n[{ITEM}]PID[/] :\r{item.pid}')
+        console.print(f'[{ITEM}]Time[/] :\r{item.timestamp}')
+        console.print(f'[{ITEM}]Raw data[/]:\r{item.raw_content}') 
     console.print(f"[{LINE}]#####[/]" * 30)
         # Đếm số lượng connect theo database
-    db_counts = Counter(item['user'] for item in list_connect)
+    db_counts = Counter(item.user for item in list_connect)
     # Tạo DataFrame từ dữ liệu đếm
     df = pd.DataFrame.from_dict(db_counts, orient='index', columns=['connect_count'])
     df = df.sort_values(by='connect_count', ascending=False)
@@ -298,18 +359,18 @@ def list_disconnect_logs(parsed_data: list):
     time.sleep(0.5) # Thêm độ trễ nhỏ để dễ quan sát khi in ra
     list_disconnect = []
     for item in parsed_data:
-        if item.get('final_level') != 'SYSTEM':
-            raw_data = item.get('raw_content')
+        if item.level_final != 'SYSTEM':
+            raw_data = item.raw_content
             if raw_data and raw_data.startswith('disconnection'):
                 list_disconnect.append(item)
     for item in list_disconnect:
         time.sleep(0.05)
-        console.print(f'\n[{ITEM}]PID[/] :\r{item['pid']}')
-        console.print(f'[{ITEM}]Time[/]:{item['timestamp']}')
-        console.print(f'[{ITEM}]Raw data[/]:{item['raw_content']}') 
+        console.print(f'\n[{ITEM}]PID[/] :\r{item.pid}')
+        console.print(f'[{ITEM}]Time[/]:{item.timestamp}')
+        console.print(f'[{ITEM}]Raw data[/]:{item.raw_content}') 
     console.print(f"[{LINE}]#####[/]" * 30)
     # Đếm số lượng disconnect theo database
-    db_counts = Counter(item['database'] for item in list_disconnect)
+    db_counts = Counter(item.database for item in list_disconnect)
     # Tạo DataFrame từ dữ liệu đếm
     df = pd.DataFrame.from_dict(db_counts, orient='index', columns=['disconnect_count'])
     df = df.sort_values(by='disconnect_count', ascending=False)
@@ -344,21 +405,21 @@ def alertPermission(parsed_data: list):
     for item in parsed_data:
         
         # Lọc nhanh chỉ các dòng có cấp độ ERROR hoặc FATAL
-        if item.get('level_1') in ['ERROR', 'FATAL']:
+        if item.level_1 in ['ERROR', 'FATAL']:
             # Kiểm tra xem chuỗi "permission denied" có tồn tại trong raw_content không
-            if "permission denied" in item.get('raw_content', ''):
+            if "permission denied" in item.raw_content:
                 count+=1
                 permission_denied_found = True
                 
                 console.print(f"[{H1}][PERMISSION DENIED DETECTED][/]")
-                console.print(f"[{ITEM}]PID[/]: {item['pid']}")
-                console.print(f"[{ITEM}]Time[/]: {item['timestamp']}")
-                console.print(f"[{ITEM}]User[/]: {item['user']} @ {item['database']}")
-                console.print(f"[{ITEM}]Lỗi[/]: {item['raw_content']}")
+                console.print(f"[{ITEM}]PID[/]: {item.pid}")
+                console.print(f"[{ITEM}]Time[/]: {item.timestamp}")
+                console.print(f"[{ITEM}]User[/]: {item.user} @ {item.database}")
+                console.print(f"[{ITEM}]Lỗi[/]: {item.raw_content}")
                 
-                # Nếu có query, in ra lệnh SQL đã cố gắng chạy
-                if item.get('query'):
-                     print(f"Lệnh SQL: {item['query']}")
+                # Nếu có query, in ra mẫu lệnh SQL đã cố gắng chạy
+                if item.query:
+                     print(f"Mẫu lệnh SQL: {item.query}")
                 print("-" * 30)
     print(f'Tong cong {count} permission denied')
     if not permission_denied_found:
@@ -398,7 +459,9 @@ def display_menu():
 
 
 def menu_choice():
-    parsed_data = initial_parse()
+    # Đọc file log một lần, mọi chức năng của menu dùng chung bảng sự kiện này
+    events_df = load_event_table()
+    parsed_data = initial_parse(events_df)
 
     while True:
         display_menu()
@@ -409,9 +472,13 @@ def menu_choice():
             console.print(f'[{H1}]>>>You choose option [1]: Monitor full logs base on PID & Export to CSV')
             time.sleep(1)
             #list_all_logs(parsed_data)
-            logs = logs_baseon_pid()
+            logs = logs_baseon_pid(events_df)
             print_logs_by_pid(logs)
-            export_logs_to_csv()
+            output_format = Prompt.ask('Định dạng file xuất', choices=['csv', 'csv.gz', 'parquet'], default='csv')
+            start = ask_time('Từ thời điểm (YYYY-MM-DD[ HH:MM:SS], Enter để bỏ qua)')
+            end = ask_time('Đến trước thời điểm (YYYY-MM-DD[ HH:MM:SS], Enter để bỏ qua)')
+            pid = ask_pid('Chỉ xuất PID (Enter để bỏ qua)')
+            export_logs_to_csv(events_df, output_format, start, end, pid)
 
         elif choice == '2':
             console.print(f'[{H1}]>>>You choose option [2]: Unauthorized use alert ')